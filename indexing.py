@@ -1,68 +1,54 @@
 import os
+import mmap
+import heapq
+from multiprocessing import Pool, Process
+from array import array
+from math import ceil, sqrt
 from sys import argv, exit
+from struct import Struct
+from ast import literal_eval
 from time import sleep
 try:
-	from numpy import array
-	from matplotlib import pyplot as plt
-	def plotCoords(coords, dpi  = 1200, plotFp = None) -> None:
-		coords_array = array(coords)
-		plt.scatter(coords_array[:, 0], coords_array[:, 1], marker = ".", color = "orange")
-		plt.rcParams["figure.dpi"] = dpi
-		plt.rcParams["savefig.dpi"] = dpi
-		if plotFp is None:
-			plt.show()
-		else:
-			plt.savefig(plotFp)
-		plt.close()
-	def plotFundamentalMBRs(MBRs, dpi  = 1200, plotFp = None) -> None:
-		plt.rcParams["figure.dpi"] = dpi
-		plt.rcParams["savefig.dpi"] = dpi
-		fig, ax = plt.subplots()
-		for mbr in MBRs:
-			x_low, x_high, y_low, y_high = mbr
-			rect = plt.Rectangle((x_low, y_low), x_high - x_low, y_high - y_low, facecolor = "none", edgecolor = "blue", linewidth = 0.2)
-			ax.add_patch(rect)
-		ax.autoscale()
-		ax.set_aspect("equal", "box")
-		if plotFp is None:
-			plt.show()
-		else:
-			plt.savefig(plotFp)
-		plt.close()
-	def plotMBRs(MBRs, dpi  = 1200, plotFp = None) -> None:
-		colors = ["red", "orange", "green", "blue", "black"]
-		plt.rcParams["figure.dpi"] = dpi
-		plt.rcParams["savefig.dpi"] = dpi
-		fig, ax = plt.subplots()
-		max_layer = max([mbr[1] for mbr in MBRs])
-		for mbr in MBRs:
-			x_low, x_high, y_low, y_high = mbr[0]
-			rect = plt.Rectangle((x_low, y_low), x_high - x_low, y_high - y_low, facecolor = "none", edgecolor = colors[mbr[1] % len(colors)], linewidth = (max_layer - mbr[1] + 1) / 5, alpha = 1 - mbr[1] / 10)
-			ax.add_patch(rect)
-		ax.autoscale()
-		ax.set_aspect("equal", "box")
-		if plotFp is None:
-			plt.show()
-		else:
-			plt.savefig(plotFp)
-		plt.close()
+	import numpy as np
+	isNumPyAvailable = True
 except:
-	def plotCoords(coords, dpi = 1200, plotFp = None) -> None:
-		return None
-	def plotFundamentalMBRs(MBRs, dpi = 1200, plotFp = None) -> None:
-		return None
+	isNumPyAvailable = False
 try:
 	os.chdir(os.path.abspath(os.path.dirname(__file__))) # cd into the location path of this script
 except: # it does not work in Jupyter-notebook
 	pass
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
-_DIVISORS = [180.0 / 2 ** n for n in range(32)]
+_QUANTIZER = 2 ** 31 / 180.0
+_MASK32 = (1 << 32) - 1
 INDICATOR = 10000
+REINSERT_RATIO = 0.3 # the share of entries moved out of an overflowing node by the R*-tree forced reinsert
+defaultCurve = "z-order"
+defaultLoader = "curve"
+defaultWorkers = 1
+_workerCoords, _workerCurve, _workerLoader = None, defaultCurve, defaultLoader # set by initWorker in every worker process
+_CHANGE_OPERATIONS = ("add", "change", "remove")
+_LOADERS = ("curve", "str") # packing along the space-filling curve or Sort-Tile-Recursive
 defaultTime = 5
 coordsFilepath = "coords.txt"
 offsetsFilepath = "offsets.txt"
+defaultChunkSize = 1 << 20
 rTreeFilepath = "Rtree.txt"
+rTreeBinaryExtension = ".bin"
+_RTREE_MAGIC = b"RTREEMBR"
+_RTREE_VERSION = 1
+_HEADER_STRUCT = Struct("<8sIQ4d") # magic, version, root offset, root MBR
+_EMPTY_MBR = (0.0, 0.0, 0.0, 0.0) # the header MBR of an RTree whose entries are all deleted
+_NODE_STRUCT = Struct("<BqI") # non-leaf flag, node id, entry count
+_ENTRY_STRUCT = Struct("<q4d") # child offset (polygon id in a leaf node), [x_low, x_high, y_low, y_high]
+_IDS_MAGIC = b"RTREEIDS"
+_IDS_STRUCT = Struct("<8sIQ") # magic, level count, file size after the last full dump, written right after the root node
+_LEVEL_STRUCT = Struct("<Iq") # level, next free node id of the level
+_COMPACT_RATIO = 2 # an incremental dump rewrites the whole binary RTree once the file has grown to this many times its size after the last full dump
+_PLOTS = ("none", "file", "show") # skip plotting, save the figures into files or show them in windows
+defaultPlot = "file"
+defaultPlotLevels = 3 # only the top levels of the RTree are drawn as rectangles
+defaultResolution = (1920, 1080) # the coords and the fundamental MBRs are aggregated into pixels of this size
 plotCoordFilepath = "plotCoord.png"
 plotFundamentalMBRFilepath = "plotFundamentalMBR.png"
 plotMBRFilepath = "plotMBR.png"
@@ -74,11 +60,44 @@ class RTreeNode:
 		self.entries = entries
 		self.id = id
 		self.MBR = MBR
+		self.aggregate = None # [count, sum, min, max] of the polygons under the node
 	def __str__(self) -> str:
-		if isinstance(self.entries[0], RTreeNode):
-			return str([1, self.id, [[entry.id, entry.MBR] for entry in self.entries]])
+		if self.entries and isinstance(self.entries[0], RTreeNode): # an empty node is written as a leaf node
+			lists = [1, self.id, [[entry.id, entry.MBR] for entry in self.entries]]
 		else:
-			return str([0, self.id, self.entries])
+			lists = [0, self.id, self.entries]
+		return str(lists if self.aggregate is None else lists + [self.aggregate])
+
+
+class MappedRTreeNode(RTreeNode): # decoded from the memory-mapped binary RTree only when it is touched
+	def __init__(self, buffer, offset, MBR = None):
+		self.buffer = buffer
+		self.offset = offset
+		self.MBR = MBR
+		self.aggregate = None
+		self._id = None
+		self._entries = None
+	@property
+	def id(self) -> int:
+		if self._id is None:
+			self._id = _NODE_STRUCT.unpack_from(self.buffer, self.offset)[1]
+		return self._id
+	@id.setter
+	def id(self, value) -> None:
+		self._id = value
+	@property
+	def entries(self) -> list:
+		if self._entries is None:
+			isNonLeaf, self._id, count = _NODE_STRUCT.unpack_from(self.buffer, self.offset)
+			start = self.offset + _NODE_STRUCT.size
+			self._entries = [																\
+				MappedRTreeNode(self.buffer, child, MBR = [x_low, x_high, y_low, y_high]) if isNonLeaf else [child, [x_low, x_high, y_low, y_high]] 	\
+				for child, x_low, x_high, y_low, y_high in _ENTRY_STRUCT.iter_unpack(memoryview(self.buffer)[start:start + count * _ENTRY_STRUCT.size])	\
+			]
+		return self._entries
+	@entries.setter
+	def entries(self, value) -> None:
+		self._entries = value
 
 
 # get input #
@@ -96,46 +115,158 @@ def getTxt(filepath, index = 0) -> str: # get .txt content
 	else:
 		return None # out of range
 
-def getCoords(coordsFp = coordsFilepath) -> list:
-	content = getTxt(coordsFp)
-	if content is None:
+def iterLines(filepath, chunkSize = defaultChunkSize) -> bytes: # yield the non-empty lines of a file read in fixed-size byte chunks
+	with open(filepath, "rb") as f:
+		chunk = f.read(chunkSize)
+		if chunk.startswith((b"\xff\xfe", b"\xfe\xff")): # UTF-16 cannot be split byte-wise
+			content = getTxt(filepath)
+			for line in (content or "").replace("\r", "\n").split("\n"):
+				if line:
+					yield line.encode("utf-8")
+			return
+		if chunk.startswith(b"\xef\xbb\xbf"): # if utf-8 with BOM, remove BOM
+			chunk = chunk[3:]
+		remainder = b""
+		while True:
+			lines = (remainder + chunk).replace(b"\r", b"\n").split(b"\n")
+			remainder = lines.pop() # the last line may continue in the next chunk
+			for line in lines:
+				if line: # filtering empty lines
+					yield line
+			chunk = f.read(chunkSize)
+			if not chunk:
+				break
+		if remainder:
+			yield remainder
+
+def getCoordsStream(coordsFp = coordsFilepath, chunkSize = defaultChunkSize) -> array: # [x_0, y_0, x_1, y_1, ...]
+	coords = array("d")
+	try:
+		for cnt, line in enumerate(iterLines(coordsFp, chunkSize)):
+			if line.count(b",") == 1:
+				tmp = line.split(b",")
+				try:
+					coords.extend((float(tmp[0]), float(tmp[1])))
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
+	except OSError:
 		return None
-	content = content.replace("\r", "\n") # filtering "\r"
-	while "\n\n" in content: # filtering empty lines
-		content = content.replace("\n\n", "\n")
-	coords = []
-	for cnt, line in enumerate(content.split("\n")):
-		if line.count(",") == 1:
-			tmp = line.split(",")
-			try:
-				coords.append([float(tmp[0]), float(tmp[1])])
-			except:
-				print("Line {0} has been skipped since converting error occured. ".format(cnt))
-		elif line: # it is not necessary to prompt the empty line
-			print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
 	return coords
 
-def getOffsets(offsetsFp = offsetsFilepath) -> list:
-	content = getTxt(offsetsFp)
+def getOffsetsStream(offsetsFp = offsetsFilepath, chunkSize = defaultChunkSize) -> array: # [polygon_id_0, start_offset_0, end_offset_0, ...]
+	offsets = array("q")
+	try:
+		for cnt, line in enumerate(iterLines(offsetsFp, chunkSize)):
+			if line.count(b",") == 2:
+				tmp = line.split(b",")
+				try:
+					offsets.extend((int(tmp[0]), int(tmp[1]), int(tmp[2])))
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 2. ".format(cnt))
+	except OSError:
+		return None
+	return offsets
+
+def getAttributes(attributesFp) -> dict: # {polygon_id: value} from lines like "42,3.5"
+	attributes = {}
+	try:
+		for cnt, line in enumerate(iterLines(attributesFp)):
+			if line.count(b",") == 1:
+				tmp = line.split(b",")
+				try:
+					attributes[int(tmp[0])] = float(tmp[1])
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
+	except OSError:
+		return None
+	return attributes
+
+def getChanges(changesFp) -> dict: # {polygon_id: [operation, old MBR or None]} from lines like "change,42" or "change,42,x_low,x_high,y_low,y_high" where the last operation on a polygon wins
+	changes = {}
+	try:
+		for cnt, line in enumerate(iterLines(changesFp)):
+			if line.count(b",") in (1, 5): # the old MBR of the polygon in the previous RTree is optional
+				tmp = line.split(b",")
+				try:
+					operation, polygon_id = tmp[0].decode("utf-8").strip().lower(), int(tmp[1])
+					oldMBR = [float(value) for value in tmp[2:]] or None
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+					continue
+				if operation in _CHANGE_OPERATIONS:
+					changes[polygon_id] = [operation, oldMBR]
+				else:
+					print("Line {0} has been skipped since the operation is not one of {1}. ".format(cnt, ", ".join(_CHANGE_OPERATIONS)))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is neither 1 nor 5. ".format(cnt))
+	except OSError:
+		return None
+	return changes
+
+def isBinaryRTree(rTreeFp = rTreeFilepath) -> bool:
+	try:
+		with open(rTreeFp, "rb") as f:
+			return f.read(len(_RTREE_MAGIC)) == _RTREE_MAGIC
+	except:
+		return False
+
+def getBinaryRTree(rTreeFp = rTreeFilepath) -> MappedRTreeNode:
+	try:
+		with open(rTreeFp, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+		magic, version, rootOffset, x_low, x_high, y_low, y_high = _HEADER_STRUCT.unpack_from(buffer, 0)
+		if version != _RTREE_VERSION:
+			print("Unsupported binary RTree version: {0}".format(version))
+			return None
+		rTree = MappedRTreeNode(buffer, rootOffset, MBR = [x_low, x_high, y_low, y_high])
+		_, _, count = _NODE_STRUCT.unpack_from(buffer, rootOffset)
+		tableOffset = rootOffset + _NODE_STRUCT.size + count * _ENTRY_STRUCT.size
+		if len(buffer) >= tableOffset + _IDS_STRUCT.size: # an RTree dumped before the table existed has no next ids
+			magic, levelCount, baseSize = _IDS_STRUCT.unpack_from(buffer, tableOffset)
+			if magic == _IDS_MAGIC:
+				tableOffset += _IDS_STRUCT.size
+				rTree.nextIds = dict(_LEVEL_STRUCT.iter_unpack(buffer[tableOffset:tableOffset + levelCount * _LEVEL_STRUCT.size]))
+				rTree.baseSize = baseSize
+		return rTree
+	except:
+		return None
+
+def getRTree(rTreeFp = rTreeFilepath) -> list:
+	if isBinaryRTree(rTreeFp):
+		return getBinaryRTree(rTreeFp)
+	content = getTxt(rTreeFp)
 	if content is None:
 		return None
 	content = content.replace("\r", "\n") # filtering "\r"
 	while "\n\n" in content: # filtering empty lines
 		content = content.replace("\n\n", "\n")
-	offsets = []
-	for cnt, line in enumerate(content.split("\n")):
-		if line.count(",") == 2:
-			tmp = line.split(",")
-			try:
-				offsets.append([int(tmp[0]), int(tmp[1]), int(tmp[2])])
-			except:
-				print("Line {0} has been skipped since converting error occured. ".format(cnt))
-		elif line: # it is not necessary to prompt the empty line
-			print("Line {0} has been skipped since the count of comma(s) is not 2. ".format(cnt))
-	return offsets
+	try:
+		rTreeDict = {}
+		for line in content.split("\n"):
+			if line.startswith("[") and line.endswith("]"):
+				lists = literal_eval(line)
+				if lists[1] in rTreeDict:
+					print("Repeated entry: id = {0}".format(lists[1]))
+				else:
+					rTreeDict[lists[1]] = RTreeNode(entries = lists[2], id = lists[1])
+					if lists[0]: # if it is a non-leaf node
+						for entry_idx, element in enumerate(lists[2]):
+							if element[0] in rTreeDict:
+								rTreeDict[lists[1]].entries[entry_idx] = rTreeDict[element[0]]
+							else:
+								print("Entry not found: id = {0}".format(element[0]))
+		return rTreeDict[max(rTreeDict.keys())] # the largest id is the root (excluding the leaf node)
+	except:
+		return None
 
 def checkOffsetCoords(coords, offsets) -> bool:
-	if offsets:
+	if len(offsets):
 		for i in range(len(offsets) - 1):
 			if offsets[i + 1][1] - offsets[i][2] != 1:
 				print("Uncovered coords are detected: From {0} to {1}. ".format(offsets[i][2], offsets[i + 1][1]))
@@ -180,9 +311,7 @@ def compute_mbr(coords) -> list: # find the bounds
 def compute_geometric_center(coords) -> list: # find the geometric center
 	return [sum(coord[0] for coord in coords) / len(coords), sum(coord[1] for coord in coords) / len(coords)] if coords else None
 
-def interleave_latlng(lat, lng) -> int: # get code
-	if not isinstance(lat, float) or not isinstance(lng, float):
-		return None
+def quantize_latlng(lat, lng) -> tuple: # map [-180, 180] x [-90, 90] onto a 2 ** 32 x 2 ** 32 grid whose cell is 180 / 2 ** 31 degrees
 	if lng > 180:
 		x = (lng % 180) + 180.0
 	elif lng < -180:
@@ -195,19 +324,66 @@ def interleave_latlng(lat, lng) -> int: # get code
 		y = (-((-lat) % 90)) + 90.0
 	else:
 		y = lat + 90.0
+	return min(max(int(x * _QUANTIZER), 0), _MASK32), min(max(int(y * _QUANTIZER), 0), _MASK32)
+
+def spread_bits(v) -> int: # insert a zero bit after each of the lower 32 bits (works on ints and on uint64 arrays alike)
+	v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+	v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+	v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+	v = (v | (v << 2)) & 0x3333333333333333
+	v = (v | (v << 1)) & 0x5555555555555555
+	return v
+
+def interleave_latlng(lat, lng) -> int: # get the 64-bit Morton code (y takes the higher bit of each pair)
+	if not isinstance(lat, float) or not isinstance(lng, float):
+		return None
+	x, y = quantize_latlng(lat, lng)
+	return (spread_bits(y) << 1) | spread_bits(x)
+
+def hilbert_latlng(lat, lng) -> int: # get the 64-bit Hilbert code
+	if not isinstance(lat, float) or not isinstance(lng, float):
+		return None
+	x, y = quantize_latlng(lat, lng)
+	d = 0
+	for level in range(31, -1, -1):
+		s = 1 << level
+		rx = 1 if x & s else 0
+		ry = 1 if y & s else 0
+		d += s * s * ((3 * rx) ^ ry)
+		if not ry: # rotate the quadrant
+			if rx:
+				x, y = _MASK32 - x, _MASK32 - y
+			x, y = y, x
+	return d
+
+if isNumPyAvailable:
+	def quantize_latlng_array(lats, lngs) -> tuple:
+		lngs, lats = np.asarray(lngs, dtype = np.float64), np.asarray(lats, dtype = np.float64)
+		x = np.where(lngs > 180, (lngs % 180) + 180.0, np.where(lngs < -180, (-((-lngs) % 180)) + 180.0, lngs + 180.0))
+		y = np.where(lats > 90, (lats % 90) + 90.0, np.where(lats < -90, (-((-lats) % 90)) + 90.0, lats + 90.0))
+		return np.clip(np.floor(x * _QUANTIZER), 0, _MASK32).astype(np.uint64), np.clip(np.floor(y * _QUANTIZER), 0, _MASK32).astype(np.uint64)
 	
-	morton_code = ""
-	for dx in _DIVISORS:
-		digit = 0
-		if y >= dx:
-			digit |= 2
-			y -= dx
-		if x >= dx:
-			digit |= 1
-			x -= dx
-		morton_code += str(digit)
+	def interleave_latlng_array(lats, lngs):
+		x, y = quantize_latlng_array(lats, lngs)
+		return (spread_bits(y) << np.uint64(1)) | spread_bits(x)
 	
-	return int(morton_code)
+	def hilbert_latlng_array(lats, lngs):
+		x, y = quantize_latlng_array(lats, lngs)
+		d = np.zeros(x.shape, dtype = np.uint64)
+		for level in range(31, -1, -1):
+			s = np.uint64(1 << level)
+			rx = (x & s) > 0
+			ry = (y & s) > 0
+			d += s * s * ((np.uint64(3) * rx) ^ ry).astype(np.uint64)
+			flip = ~ry & rx
+			x = np.where(flip, np.uint64(_MASK32) - x, x)
+			y = np.where(flip, np.uint64(_MASK32) - y, y)
+			x, y = np.where(ry, x, y), np.where(ry, y, x)
+		return d
+	
+	_CURVE_ARRAYS = {"z-order":interleave_latlng_array, "hilbert":hilbert_latlng_array}
+
+_CURVES = {"z-order":interleave_latlng, "hilbert":hilbert_latlng}
 
 def buildRTree(entries, min_capacity = 8, max_capacity = 20, level = 0, level_indicator = INDICATOR, isPrint = False) -> RTreeNode:
 	if isPrint:
@@ -236,7 +412,9 @@ def computeNodeMBR(nodes) -> list: # find the bounds
 		return None
 
 def computeRTreeMBR(rTree) -> None:
-	if isinstance(rTree.entries[0], RTreeNode):
+	if not rTree.entries: # an emptied root
+		rTree.MBR = None
+	elif isinstance(rTree.entries[0], RTreeNode):
 		for entry in rTree.entries:
 			if entry.MBR is None:
 				computeRTreeMBR(entry)
@@ -244,9 +422,66 @@ def computeRTreeMBR(rTree) -> None:
 	else:
 		rTree.MBR = computeNodeMBR([entry[1] for entry in rTree.entries])
 
-def doBuildRTree(entries, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR) -> RTreeNode:
+def computeRTreeAggregate(rTree) -> list: # [count, sum, min, max] where sum, min and max stay None if no polygon under the node has a value
+	if rTree.entries and isinstance(rTree.entries[0], RTreeNode):
+		aggregates = [computeRTreeAggregate(entry) for entry in rTree.entries]
+	else:
+		aggregates = [[1, entry[2], entry[2], entry[2]] if len(entry) > 2 else [1, None, None, None] for entry in rTree.entries]
+	values = [aggregate for aggregate in aggregates if aggregate[1] is not None]
+	rTree.aggregate = [																	\
+		sum(aggregate[0] for aggregate in aggregates), 														\
+		sum(aggregate[1] for aggregate in values) if values else None, 												\
+		min(aggregate[2] for aggregate in values) if values else None, 												\
+		max(aggregate[3] for aggregate in values) if values else None													\
+	]
+	return rTree.aggregate
+
+def attachAttributes(rTree, attributes) -> None: # put the value of every polygon as the third element of its leaf entry and refresh the aggregates
+	if rTree.entries and isinstance(rTree.entries[0], RTreeNode):
+		for entry in rTree.entries:
+			attachAttributes(entry, attributes)
+	else:
+		for entry in rTree.entries:
+			if entry[0] in attributes:
+				entry[2:] = [attributes[entry[0]]]
+			else:
+				del entry[2:]
+	computeRTreeAggregate(rTree)
+
+def strPartition(entries, min_capacity = 8, max_capacity = 20) -> list: # group one level by Sort-Tile-Recursive
+	mbrs = [entry.MBR if isinstance(entry, RTreeNode) else entry[1] for entry in entries]
+	slabSize = ceil(sqrt((len(entries) - 1) // max_capacity + 1)) * max_capacity # S vertical slabs of S nodes each
+	order = sorted(range(len(entries)), key = lambda i:mbrs[i][0] + mbrs[i][1]) # by the x of the center
+	slabs = [order[i:i + slabSize] for i in range(0, len(order), slabSize)]
+	if len(slabs) > 1 and len(slabs[-1]) < min_capacity: # avoid an underfull node in the last slab
+		slabs[-2].extend(slabs.pop())
+	groups = []
+	for slab in slabs:
+		slab.sort(key = lambda i:mbrs[i][2] + mbrs[i][3]) # by the y of the center
+		count = (len(slab) - 1) // max_capacity + 1
+		for j in range(count): # runs of even lengths keep every node above half of max_capacity
+			groups.append([entries[i] for i in slab[j * len(slab) // count:(j + 1) * len(slab) // count]])
+	return groups
+
+def buildSTRRTree(entries, min_capacity = 8, max_capacity = 20, level = 0, level_indicator = INDICATOR, isPrint = False) -> RTreeNode:
+	if isPrint:
+		print("{0} nodes at level {1}".format(len(entries), level - 1)) # last level
+	if len(entries) <= max_capacity:
+		print("1 node at level {0}. ".format(level)) # last level
+		return RTreeNode(entries = entries, id = level * level_indicator) # root
+	nodes = [RTreeNode(entries = group, id = i + level * level_indicator) for i, group in enumerate(strPartition(entries, min_capacity = min_capacity, max_capacity = max_capacity))]
+	for node in nodes: # the upper level is partitioned by these MBRs
+		computeRTreeMBR(node)
+	return buildSTRRTree(nodes, min_capacity = min_capacity, max_capacity = max_capacity, level = level + 1, level_indicator = level_indicator, isPrint = True)
+
+def doBuildRTree(entries, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR, loader = defaultLoader) -> RTreeNode:
 	if type(entries) != list or len(entries) < 1:
 		return None
+	if loader == "str":
+		rTree = buildSTRRTree(entries, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+		computeRTreeMBR(rTree)
+		computeRTreeAggregate(rTree)
+		return rTree
 	rTree = buildRTree(entries, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
 	lastNode = rTree
 	while isinstance(lastNode.entries[-1], RTreeNode):
@@ -254,9 +489,11 @@ def doBuildRTree(entries, min_capacity = 8, max_capacity = 20, level_indicator =
 			lastNode.entries[-1].entries.insert(0, lastNode.entries[-2].entries.pop())
 		lastNode = lastNode.entries[-1]
 	computeRTreeMBR(rTree)
+	computeRTreeAggregate(rTree)
 	return rTree
 
-def index(coords, offsets) -> list: # build index
+def computeEntries(coords, offsets, curve = defaultCurve) -> list: # [[polygon_id, mbr, code], ...]
+	encode = _CURVES[curve]
 	entries = []
 	for offset in offsets:
 		polygon_id, start_offset, end_offset = offset
@@ -266,12 +503,290 @@ def index(coords, offsets) -> list: # build index
 		if mbr is None or center is None:
 			print("Warning: illegal coords[{0}:{1}] are found. ".format(start_offset, end_offset + 1))
 		else:
-			z_order = interleave_latlng(center[1], center[0])
-			entries.append([polygon_id, mbr, z_order])
-	entries.sort(key = lambda c:c[-1])
-	for i in range(len(entries)): # remove z-order
+			entries.append([polygon_id, mbr, encode(center[1], center[0])])
+	return entries
+
+def index(coords, offsets, curve = defaultCurve, loader = defaultLoader) -> list: # build index
+	entries = computeEntries(coords, offsets, curve = curve)
+	if loader == "curve":
+		entries.sort(key = lambda c:c[-1])
+	for i in range(len(entries)): # remove the curve code
 		entries[i].pop()
-	return doBuildRTree(entries)
+	return doBuildRTree(entries, loader = loader)
+
+def computeEntryArrays(coords, offsets, curve = defaultCurve) -> tuple: # (polygon_ids, mbrs, codes) by segment reductions over the offsets instead of per-polygon loops
+	coords_array = np.asarray(coords, dtype = np.float64).reshape(-1, 2)
+	offsets_array = np.asarray(offsets, dtype = np.int64).reshape(-1, 3)
+	polygon_ids, start_offsets, end_offsets = offsets_array[:, 0], offsets_array[:, 1], offsets_array[:, 2]
+	stop_offsets = np.minimum(end_offsets + 1, len(coords_array)) # slicing semantics of coords[start_offset:end_offset + 1]
+	legal = (start_offsets >= 0) & (start_offsets < stop_offsets)
+	for start_offset, end_offset in offsets_array[~legal, 1:].tolist():
+		print("Warning: illegal coords[{0}:{1}] are found. ".format(start_offset, end_offset + 1))
+	if not legal.any():
+		return polygon_ids[:0], np.empty((0, 4)), np.empty(0, dtype = np.uint64)
+	bounds = np.empty(2 * int(legal.sum()), dtype = np.int64) # [start_0, stop_0, start_1, stop_1, ...] and only the even reductions are used
+	bounds[0::2], bounds[1::2] = start_offsets[legal], stop_offsets[legal]
+	padded = np.vstack((coords_array, np.zeros((1, 2)))) # a sentinel row so that a stop offset equal to len(coords) is a valid index
+	mbrs = np.column_stack((																	\
+		np.minimum.reduceat(padded[:, 0], bounds)[0::2], np.maximum.reduceat(padded[:, 0], bounds)[0::2], 						\
+		np.minimum.reduceat(padded[:, 1], bounds)[0::2], np.maximum.reduceat(padded[:, 1], bounds)[0::2]						\
+	))
+	centers = np.add.reduceat(padded, bounds, axis = 0)[0::2] / (bounds[1::2] - bounds[0::2])[:, None]
+	return polygon_ids[legal], mbrs, _CURVE_ARRAYS[curve](centers[:, 1], centers[:, 0])
+
+def indexVectorized(coords, offsets, curve = defaultCurve, loader = defaultLoader) -> list: # build index with NumPy
+	polygon_ids, mbrs, codes = computeEntryArrays(coords, offsets, curve = curve)
+	order = np.argsort(codes, kind = "stable") if loader == "curve" else np.arange(len(mbrs))
+	return doBuildRTree([[polygon_id, mbr] for polygon_id, mbr in zip(polygon_ids[order].tolist(), mbrs[order].tolist())], loader = loader)
+
+def initWorker(coords, curve, loader) -> None: # every worker keeps the coords so that only the offsets are sent with the tasks
+	global _workerCoords, _workerCurve, _workerLoader
+	_workerCoords, _workerCurve, _workerLoader = coords, curve, loader
+
+def computeSortedEntries(offsets) -> list: # [[code, polygon_id, mbr], ...] of a chunk, sorted by the code if the curve loader is used
+	if isNumPyAvailable:
+		polygon_ids, mbrs, codes = computeEntryArrays(_workerCoords, offsets, curve = _workerCurve)
+		order = np.argsort(codes, kind = "stable") if _workerLoader == "curve" else np.arange(len(mbrs))
+		return [[code, polygon_id, mbr] for code, polygon_id, mbr in zip(codes[order].tolist(), polygon_ids[order].tolist(), mbrs[order].tolist())]
+	entries = [[code, polygon_id, mbr] for polygon_id, mbr, code in computeEntries(_workerCoords, offsets, curve = _workerCurve)]
+	if _workerLoader == "curve":
+		entries.sort(key = lambda c:c[0])
+	return entries
+
+def indexParallel(coords, offsets, curve = defaultCurve, loader = defaultLoader, workers = defaultWorkers) -> list: # build index with worker processes
+	chunkSize = max((len(offsets) - 1) // (workers * 4) + 1, 1) # a few chunks per worker to balance the load
+	with Pool(workers, initializer = initWorker, initargs = (coords, curve, loader)) as pool:
+		runs = pool.map(computeSortedEntries, [offsets[i:i + chunkSize] for i in range(0, len(offsets), chunkSize)])
+	if loader == "curve": # k-way merge of the sorted runs, which is stable like the sort of the serial build
+		merged = heapq.merge(*runs, key = lambda c:c[0])
+	else:
+		merged = (entry for run in runs for entry in run)
+	return doBuildRTree([[polygon_id, mbr] for code, polygon_id, mbr in merged], loader = loader)
+
+# handle updating #
+def isOverlap(rect1, rect2) -> bool: # [x_low, x_high, y_low, y_high]
+	return rect1[0] <= rect2[1] and rect1[1] >= rect2[0] and rect1[2] <= rect2[3] and rect1[3] >= rect2[2]
+
+def isContain(rect1, rect2) -> bool: # rect1 contains rect2
+	return rect1[0] <= rect2[0] and rect2[1] <= rect1[1] and rect1[2] <= rect2[2] and rect2[3] <= rect1[3]
+
+def getEntryMBR(entry) -> list:
+	return entry.MBR if isinstance(entry, RTreeNode) else entry[1]
+
+def computeArea(mbr) -> float:
+	return (mbr[1] - mbr[0]) * (mbr[3] - mbr[2])
+
+def computeMargin(mbr) -> float:
+	return (mbr[1] - mbr[0]) + (mbr[3] - mbr[2])
+
+def computeUnion(mbr1, mbr2) -> list:
+	return [min(mbr1[0], mbr2[0]), max(mbr1[1], mbr2[1]), min(mbr1[2], mbr2[2]), max(mbr1[3], mbr2[3])]
+
+def computeOverlap(mbr1, mbr2) -> float:
+	return max(min(mbr1[1], mbr2[1]) - max(mbr1[0], mbr2[0]), 0) * max(min(mbr1[3], mbr2[3]) - max(mbr1[2], mbr2[2]), 0)
+
+def getLevel(rTree, level_indicator = INDICATOR) -> int: # leaf nodes are at level 0
+	return rTree.id // level_indicator
+
+def markDirty(rTree) -> None: # the node will be written again by the next incremental dump
+	if isinstance(rTree, MappedRTreeNode): # materialize the node before it loses its offset
+		rTree.entries = rTree.entries
+		rTree.id = rTree.id
+	rTree.offset = None
+
+def getNextIds(rTree, level_indicator = INDICATOR) -> dict: # rTree is the root which keeps the next free id of every level, only an RTree without them is walked
+	if getattr(rTree, "nextIds", None) is None:
+		rTree.nextIds = {}
+		stack = [rTree]
+		while stack:
+			node = stack.pop()
+			rTree.nextIds[getLevel(node, level_indicator)] = max(rTree.nextIds.get(getLevel(node, level_indicator), 0), node.id % level_indicator + 1)
+			stack.extend(entry for entry in node.entries if isinstance(entry, RTreeNode))
+	return rTree.nextIds
+
+def allocateNodeId(rTree, level, level_indicator = INDICATOR) -> int:
+	nextIds = getNextIds(rTree, level_indicator)
+	node_id = level * level_indicator + nextIds.get(level, 0)
+	nextIds[level] = nextIds.get(level, 0) + 1
+	return node_id
+
+def chooseSubtree(rTree, mbr, level = 0, level_indicator = INDICATOR) -> list: # the path from the root to the node at the level to accommodate mbr
+	path = [rTree]
+	while getLevel(path[-1], level_indicator) > level:
+		children = path[-1].entries
+		if getLevel(path[-1], level_indicator) == 1: # the children are leaf nodes so the overlap enlargement is minimized
+			def cost(child) -> tuple:
+				enlarged = computeUnion(child.MBR, mbr)
+				overlap = sum(computeOverlap(enlarged, other.MBR) - computeOverlap(child.MBR, other.MBR) for other in children if other is not child)
+				return (overlap, computeArea(enlarged) - computeArea(child.MBR), computeArea(child.MBR))
+		else: # the area enlargement is minimized
+			def cost(child) -> tuple:
+				return (computeArea(computeUnion(child.MBR, mbr)) - computeArea(child.MBR), computeArea(child.MBR))
+		path.append(min(children, key = cost))
+	return path
+
+def splitNode(rTree, min_capacity = 8) -> list: # R*-tree split, the node keeps the first group and the second group is returned
+	entries = rTree.entries
+	m = max(min(min_capacity, len(entries) // 2), 1)
+	bestMargin, bestSortings = None, None
+	for axis in (0, 2): # choose the split axis with the minimum sum of margins
+		sortings = [sorted(entries, key = lambda e:(getEntryMBR(e)[axis], getEntryMBR(e)[axis + 1])), sorted(entries, key = lambda e:(getEntryMBR(e)[axis + 1], getEntryMBR(e)[axis]))]
+		margin = 0
+		for sorting in sortings:
+			for k in range(m, len(entries) - m + 1):
+				margin += computeMargin(computeNodeMBR([getEntryMBR(e) for e in sorting[:k]])) + computeMargin(computeNodeMBR([getEntryMBR(e) for e in sorting[k:]]))
+		if bestMargin is None or margin < bestMargin:
+			bestMargin, bestSortings = margin, sortings
+	bestCost, bestGroups = None, None
+	for sorting in bestSortings: # choose the distribution with the minimum overlap and then the minimum area
+		for k in range(m, len(entries) - m + 1):
+			mbr1, mbr2 = computeNodeMBR([getEntryMBR(e) for e in sorting[:k]]), computeNodeMBR([getEntryMBR(e) for e in sorting[k:]])
+			cost = (computeOverlap(mbr1, mbr2), computeArea(mbr1) + computeArea(mbr2))
+			if bestCost is None or cost < bestCost:
+				bestCost, bestGroups = cost, (sorting[:k], sorting[k:])
+	rTree.entries = bestGroups[0]
+	return bestGroups[1]
+
+def pickReinsert(rTree, max_capacity = 20) -> list: # remove the entries farthest from the center of the node, the closest one comes first
+	x_center, y_center = (rTree.MBR[0] + rTree.MBR[1]) / 2, (rTree.MBR[2] + rTree.MBR[3]) / 2
+	def distance(entry) -> float:
+		mbr = getEntryMBR(entry)
+		return ((mbr[0] + mbr[1]) / 2 - x_center) ** 2 + ((mbr[2] + mbr[3]) / 2 - y_center) ** 2
+	entries = sorted(rTree.entries, key = distance)
+	p = max(int(max_capacity * REINSERT_RATIO), 1)
+	rTree.entries = entries[:-p]
+	return entries[-p:]
+
+def insertEntry(rTree, entry, level = 0, reinsertedLevels = None, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR) -> RTreeNode: # return the root
+	reinsertedLevels = set() if reinsertedLevels is None else reinsertedLevels
+	path = chooseSubtree(rTree, getEntryMBR(entry), level = level, level_indicator = level_indicator)
+	path[-1].entries.append(entry)
+	reinserts = []
+	for depth in range(len(path) - 1, -1, -1): # handle overflows and adjust the MBRs bottom-up
+		node = path[depth]
+		markDirty(node)
+		computeRTreeMBR(node)
+		if len(node.entries) > max_capacity:
+			node_level = getLevel(node, level_indicator)
+			if depth and node_level not in reinsertedLevels: # forced reinsert once per level and never at the root
+				reinsertedLevels.add(node_level)
+				reinserts.extend((reinsert, node_level) for reinsert in pickReinsert(node, max_capacity = max_capacity))
+			else:
+				sibling = RTreeNode(entries = splitNode(node, min_capacity = min_capacity), id = allocateNodeId(rTree, node_level, level_indicator))
+				computeRTreeMBR(sibling)
+				if depth:
+					path[depth - 1].entries.append(sibling)
+				else: # grow a new root
+					root = RTreeNode(entries = [node, sibling])
+					root.nextIds = node.nextIds
+					node.nextIds = None
+					root.id = allocateNodeId(root, node_level + 1, level_indicator) # a later split at this level must not reuse the id of the root
+					rTree = root
+					markDirty(rTree)
+			computeRTreeMBR(node)
+	computeRTreeMBR(rTree)
+	for reinsert, reinsert_level in reinserts:
+		rTree = insertEntry(rTree, reinsert, level = reinsert_level, reinsertedLevels = reinsertedLevels, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+	return rTree
+
+def insert(rTree, polygon_id, mbr, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR) -> RTreeNode: # return the root
+	if rTree is None:
+		rTree = RTreeNode(entries = [], id = 0)
+	return insertEntry(rTree, [polygon_id, list(mbr)], min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+
+def findEntry(rTree, polygon_id, mbr = None) -> tuple: # the path to the leaf node holding the polygon and its index in the leaf node
+	stack = [[rTree]]
+	while stack:
+		path = stack.pop()
+		for idx, entry in enumerate(path[-1].entries):
+			if isinstance(entry, RTreeNode):
+				if mbr is None or isOverlap(entry.MBR, mbr):
+					stack.append(path + [entry])
+			elif entry[0] == polygon_id:
+				return path, idx
+	return None, None
+
+def delete(rTree, polygon_id, mbr = None, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR) -> RTreeNode: # return the root, mbr narrows the search if it is given
+	path, idx = findEntry(rTree, polygon_id, mbr)
+	if path is None:
+		print("Polygon {0} is not found in the RTree. ".format(polygon_id))
+		return rTree
+	path[-1].entries.pop(idx)
+	orphans = []
+	for depth in range(len(path) - 1, 0, -1): # condense the tree bottom-up
+		node = path[depth]
+		markDirty(node)
+		if len(node.entries) < min_capacity: # dissolve the underfull node and reinsert its entries at the same level later
+			path[depth - 1].entries.remove(node)
+			orphans.extend((orphan, getLevel(node, level_indicator)) for orphan in node.entries)
+		else:
+			computeRTreeMBR(node)
+	markDirty(rTree)
+	computeRTreeMBR(rTree)
+	for orphan, orphan_level in orphans:
+		rTree = insertEntry(rTree, orphan, level = orphan_level, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+	while getLevel(rTree, level_indicator) and len(rTree.entries) == 1: # shorten the tree
+		rTree.entries[0].nextIds = rTree.nextIds if hasattr(rTree, "nextIds") else None
+		rTree = rTree.entries[0]
+	return rTree
+
+
+def locateEntries(rTree, polygon_ids, oldMBRs = None) -> dict: # {polygon_id: the path from the root to its leaf node} in a single traversal which stops once every polygon is found
+	oldMBRs = oldMBRs or {}
+	blind = {polygon_id for polygon_id in polygon_ids if polygon_id not in oldMBRs} # a polygon without its old MBR may be under any node
+	paths = {}
+	stack = [([rTree], {polygon_id for polygon_id in polygon_ids if polygon_id in oldMBRs})] # (path, the polygons with an old MBR under the last node)
+	while stack and len(paths) < len(polygon_ids):
+		path, hinted = stack.pop()
+		for entry in path[-1].entries:
+			if isinstance(entry, RTreeNode):
+				inside = {polygon_id for polygon_id in hinted if isContain(entry.MBR, oldMBRs[polygon_id])}
+				if inside or blind:
+					stack.append((path + [entry], inside))
+			elif entry[0] in blind or entry[0] in hinted:
+				paths[entry[0]] = path
+				blind.discard(entry[0]) # stop descending once every polygon without an old MBR is found
+	missing = [polygon_id for polygon_id in polygon_ids if polygon_id not in paths and polygon_id in oldMBRs]
+	if missing: # an old MBR which is not the one in the RTree cannot lead to the polygon
+		paths.update(locateEntries(rTree, missing))
+	return paths
+
+def reindex(rTree, changes, coords, offsets, min_capacity = 8, max_capacity = 20, level_indicator = INDICATOR) -> RTreeNode: # apply the changes from getChanges to a previous RTree and return the root
+	wanted = {polygon_id for polygon_id, (operation, _) in changes.items() if operation != "remove"}
+	if isNumPyAvailable:
+		offsets_array = np.asarray(offsets, dtype = np.int64).reshape(-1, 3)
+		polygon_ids, mbrs, _ = computeEntryArrays(coords, offsets_array[np.isin(offsets_array[:, 0], list(wanted))])
+		newMBRs = dict(zip(polygon_ids.tolist(), mbrs.tolist()))
+	else:
+		newMBRs = {polygon_id:mbr for polygon_id, mbr, _ in computeEntries(coords, [offset for offset in offsets if offset[0] in wanted])}
+	for polygon_id in sorted(wanted - newMBRs.keys()):
+		print("Polygon {0} is not found in the offsets and it is removed from the RTree. ".format(polygon_id))
+	sought = {polygon_id for polygon_id, (operation, _) in changes.items() if operation != "add"} # an added polygon is not in the previous RTree
+	paths = locateEntries(rTree, sought, {polygon_id:oldMBR for polygon_id, (_, oldMBR) in changes.items() if oldMBR is not None})
+	for polygon_id in sorted(sought - paths.keys()):
+		if changes[polygon_id][0] == "remove":
+			print("Polygon {0} is not found in the previous RTree and there is nothing to remove. ".format(polygon_id))
+		else:
+			print("Polygon {0} is not found in the previous RTree and it is regarded as added. ".format(polygon_id))
+	reinserts = []
+	for polygon_id, path in paths.items():
+		entry = next(entry for entry in path[-1].entries if entry[0] == polygon_id)
+		newMBR = newMBRs.get(polygon_id)
+		leafMBR = path[-1].MBR
+		if newMBR is not None and isContain(leafMBR, newMBR): # update in place and repair the path
+			entry[1] = newMBR
+			for node in reversed(path):
+				markDirty(node)
+				computeRTreeMBR(node)
+		else: # removed or moved out of its leaf node
+			reinserts.append((polygon_id, entry[1]))
+	for polygon_id, oldMBR in reinserts:
+		rTree = delete(rTree, polygon_id, oldMBR, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+	reinserted = {polygon_id for polygon_id, _ in reinserts}
+	for polygon_id, newMBR in newMBRs.items():
+		if polygon_id not in paths or polygon_id in reinserted:
+			rTree = insert(rTree, polygon_id, newMBR, min_capacity = min_capacity, max_capacity = max_capacity, level_indicator = level_indicator)
+	return rTree
 
 
 # make output #
@@ -284,11 +799,50 @@ def dumpRTree(rTree, fp = None) -> None:
 	else:
 		print(rTree)
 
-def doDumpRTree(rTree, filepath = rTreeFilepath, encoding = "utf-8") -> bool:
+def dumpBinaryRTree(rTree, fp, isIncremental = False) -> int: # the children are written before their parent so that the parent can refer to their offsets
+	if isIncremental and getattr(rTree, "offset", None) is not None: # the unchanged subtree is already in the file
+		return rTree.offset
+	isNonLeaf = bool(rTree.entries) and isinstance(rTree.entries[0], RTreeNode) # an empty node is written as a leaf node
+	children = [dumpBinaryRTree(entry, fp, isIncremental) for entry in rTree.entries] if isNonLeaf else [entry[0] for entry in rTree.entries]
+	offset = fp.tell()
+	fp.write(_NODE_STRUCT.pack(isNonLeaf, rTree.id, len(rTree.entries)))
+	for child, entry in zip(children, rTree.entries):
+		fp.write(_ENTRY_STRUCT.pack(child, *(entry.MBR if isNonLeaf else entry[1])))
+	rTree.offset = offset
+	return offset
+
+def dumpNextIds(rTree, fp, baseSize) -> None: # the table right after the root saves walking the whole RTree on the next split
+	nextIds = getNextIds(rTree)
+	fp.write(_IDS_STRUCT.pack(_IDS_MAGIC, len(nextIds), baseSize))
+	for level, next_id in sorted(nextIds.items()):
+		fp.write(_LEVEL_STRUCT.pack(level, next_id))
+
+def doDumpRTree(rTree, filepath = rTreeFilepath, encoding = "utf-8", isBinary = None, isIncremental = False) -> bool: # an incremental dump appends only the changed nodes to an existing binary RTree
 	if filepath:
+		if isBinary is None:
+			isBinary = filepath.lower().endswith(rTreeBinaryExtension)
 		try:
-			with open(filepath, "w", encoding = encoding) as f:
-				dumpRTree(rTree, fp = f)
+			if isBinary and isIncremental and isBinaryRTree(filepath) and getattr(rTree, "baseSize", None) and os.path.getsize(filepath) < _COMPACT_RATIO * rTree.baseSize:
+				with open(filepath, "r+b") as f:
+					f.seek(0, os.SEEK_END)
+					markDirty(rTree) # the root is written again so that the table of the next ids follows it
+					rootOffset = dumpBinaryRTree(rTree, f, isIncremental = True)
+					dumpNextIds(rTree, f, rTree.baseSize)
+					f.seek(0)
+					f.write(_HEADER_STRUCT.pack(_RTREE_MAGIC, _RTREE_VERSION, rootOffset, *(rTree.MBR or _EMPTY_MBR)))
+			elif isBinary: # a full dump also drops the nodes which the incremental dumps have left behind
+				with open(filepath + ".tmp", "wb") as f: # rTree may still be mapped from the file
+					f.write(_HEADER_STRUCT.pack(_RTREE_MAGIC, _RTREE_VERSION, 0, *(rTree.MBR or _EMPTY_MBR))) # the root offset is filled in after the nodes are written
+					rootOffset = dumpBinaryRTree(rTree, f)
+					rTree.baseSize = f.tell() + _IDS_STRUCT.size + _LEVEL_STRUCT.size * len(getNextIds(rTree))
+					dumpNextIds(rTree, f, rTree.baseSize)
+					f.seek(0)
+					f.write(_HEADER_STRUCT.pack(_RTREE_MAGIC, _RTREE_VERSION, rootOffset, *(rTree.MBR or _EMPTY_MBR)))
+				os.replace(filepath + ".tmp", filepath)
+			else:
+				computeRTreeAggregate(rTree) # the updates may have left them stale
+				with open(filepath, "w", encoding = encoding) as f:
+					dumpRTree(rTree, fp = f)
 			return True
 		except Exception as e:
 			print(e)
@@ -298,6 +852,103 @@ def doDumpRTree(rTree, filepath = rTreeFilepath, encoding = "utf-8") -> bool:
 
 
 
+# handle plotting #
+def importPyplot(isShown = False) -> object: # matplotlib is imported only when something is really plotted
+	try:
+		import matplotlib
+		if not isShown:
+			matplotlib.use("Agg") # no window is needed for saving the figures
+		from matplotlib import pyplot as plt
+		return plt
+	except:
+		return None
+
+def getExtent(MBRs) -> list: # [x_low, x_high, y_low, y_high] covering all the MBRs
+	mbrs = np.asarray(MBRs, dtype = np.float64).reshape(-1, 4)
+	return [float(mbrs[:, 0].min()), float(mbrs[:, 1].max()), float(mbrs[:, 2].min()), float(mbrs[:, 3].max())]
+
+def getCoordsExtent(coords) -> list: # [x_low, x_high, y_low, y_high] covering all the coords
+	coords_array = np.asarray(coords, dtype = np.float64).reshape(-1, 2)
+	return [float(coords_array[:, 0].min()), float(coords_array[:, 0].max()), float(coords_array[:, 1].min()), float(coords_array[:, 1].max())]
+
+def getPixels(values, low, high, size) -> list: # the pixel indexes of the values along one axis
+	scale = size / ((high - low) or 1.0)
+	return np.clip(((values - low) * scale).astype(np.int64), 0, size - 1)
+
+def rasterizeCoords(coords, extent, resolution = defaultResolution) -> list: # the count of coords falling into every pixel
+	width, height = resolution
+	coords_array = np.asarray(coords, dtype = np.float64).reshape(-1, 2)
+	columns = getPixels(coords_array[:, 0], extent[0], extent[1], width)
+	rows = getPixels(coords_array[:, 1], extent[2], extent[3], height)
+	return np.bincount(rows * width + columns, minlength = width * height).reshape(height, width)
+
+def rasterizeMBRs(MBRs, extent, resolution = defaultResolution) -> list: # the count of MBRs covering every pixel, accumulated from the corners of the MBRs
+	width, height = resolution
+	mbrs = np.asarray(MBRs, dtype = np.float64).reshape(-1, 4)
+	column_lows, column_highs = getPixels(mbrs[:, 0], extent[0], extent[1], width), getPixels(mbrs[:, 1], extent[0], extent[1], width) + 1
+	row_lows, row_highs = getPixels(mbrs[:, 2], extent[2], extent[3], height), getPixels(mbrs[:, 3], extent[2], extent[3], height) + 1
+	corners = np.zeros((height + 1, width + 1), dtype = np.int64)
+	np.add.at(corners, (row_lows, column_lows), 1)
+	np.add.at(corners, (row_lows, column_highs), -1)
+	np.add.at(corners, (row_highs, column_lows), -1)
+	np.add.at(corners, (row_highs, column_highs), 1)
+	return corners.cumsum(axis = 0).cumsum(axis = 1)[:height, :width]
+
+def plotRaster(plt, raster, extent, resolution = defaultResolution, cmap = "Blues") -> None: # draw the counts on a log scale with one figure pixel per raster pixel
+	width, height = resolution
+	fig, ax = plt.subplots(figsize = (width / 100, height / 100), dpi = 100)
+	ax.imshow(np.log1p(raster), origin = "lower", extent = extent, cmap = cmap, interpolation = "nearest")
+	ax.set_aspect("equal", "box")
+
+def showPlot(plt, plotFp = None) -> None:
+	if plotFp is None:
+		plt.show()
+	else:
+		plt.savefig(plotFp)
+	plt.close()
+
+def plotCoords(coords, resolution = defaultResolution, plotFp = None) -> None:
+	plt = importPyplot(plotFp is None)
+	if plt is None or not len(coords):
+		return None
+	extent = getCoordsExtent(coords)
+	plotRaster(plt, rasterizeCoords(coords, extent, resolution), extent, resolution, cmap = "Oranges")
+	showPlot(plt, plotFp)
+
+def plotFundamentalMBRs(MBRs, resolution = defaultResolution, plotFp = None) -> None:
+	plt = importPyplot(plotFp is None)
+	if plt is None or not len(MBRs):
+		return None
+	extent = getExtent(MBRs)
+	plotRaster(plt, rasterizeMBRs(MBRs, extent, resolution), extent, resolution, cmap = "Blues")
+	showPlot(plt, plotFp)
+
+def plotMBRs(MBRs, levels = defaultPlotLevels, resolution = defaultResolution, plotFp = None) -> None: # the MBRs are (MBR, layer) pairs and only the top levels are drawn
+	plt = importPyplot(plotFp is None)
+	MBRs = [mbr for mbr in MBRs if mbr[1] < levels]
+	if plt is None or not MBRs:
+		return None
+	colors = ["red", "orange", "green", "blue", "black"]
+	width, height = resolution
+	fig, ax = plt.subplots(figsize = (width / 100, height / 100), dpi = 100)
+	max_layer = max([mbr[1] for mbr in MBRs])
+	for mbr in MBRs:
+		x_low, x_high, y_low, y_high = mbr[0]
+		rect = plt.Rectangle((x_low, y_low), x_high - x_low, y_high - y_low, facecolor = "none", edgecolor = colors[mbr[1] % len(colors)], linewidth = (max_layer - mbr[1] + 1) / 5, alpha = 1 - mbr[1] / 10)
+		ax.add_patch(rect)
+	ax.autoscale()
+	ax.set_aspect("equal", "box")
+	showPlot(plt, plotFp)
+
+def doPlot(coords, fMBRs, MBRs, isShown = False, levels = defaultPlotLevels, resolution = defaultResolution) -> None: # the plotting stage which runs in a background process
+	if importPyplot(isShown) is None:
+		print("Plotting is skipped since matplotlib is not available. ")
+		return None
+	plotCoords(coords, resolution = resolution, plotFp = None if isShown else plotCoordFilepath)
+	plotFundamentalMBRs(fMBRs, resolution = resolution, plotFp = None if isShown else plotFundamentalMBRFilepath)
+	plotMBRs(MBRs, levels = levels, resolution = resolution, plotFp = None if isShown else plotMBRFilepath)
+
+
 # main function #
 def preExit(countdownTime = defaultTime) -> None: # we use this function before exiting instead of getch since getch is not OS-independent
 	try:
@@ -321,22 +972,35 @@ def printHelp() -> None:
 	print("Option: ")
 	print("\t[/coords|--coords|coords]: Specify that the following option is the input coord file. ")
 	print("\t[/offsets|--offsets|offsets]: Specify that the following option is the input offset file. ")
-	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the output rTree file. ", end = "\n\n")
+	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the output rTree file. The binary format is used if the file ends with \"{0}\". ".format(rTreeBinaryExtension))
+	print("\t[/curve|--curve|curve]: Specify that the following option is the packing order ({0}). ".format("|".join(_CURVES)))
+	print("\t[/loader|--loader|loader]: Specify that the following option is the bulk loader ({0}). ".format("|".join(_LOADERS)))
+	print("\t[/workers|--workers|workers]: Specify that the following option is the count of worker processes computing the entries. ")
+	print("\t[/changes|--changes|changes]: Specify that the following option is the change set file whose lines look like \"change,42\" ({0}), optionally followed by the old MBR of the polygon as \",x_low,x_high,y_low,y_high\" to narrow the search. An added polygon must not be in the previous rTree. The previous rTree file is updated instead of being rebuilt. A binary rTree file is appended to and it is rewritten in full once it has grown to {1} times its size after the last full dump. ".format("|".join(_CHANGE_OPERATIONS), _COMPACT_RATIO))
+	print("\t[/plot|--plot|plot]: Specify that the following option is the plotting mode ({0}). The plots are rendered in the background after the rTree is dumped and they need NumPy and matplotlib. ".format("|".join(_PLOTS)))
+	print("\t[/attributes|--attributes|attributes]: Specify that the following option is the attribute file whose lines look like \"42,3.5\". The sum, min and max of the values are stored in every node of a text rTree. ", end = "\n\n")
 	print("Format: ")
-	print("\tpython indexing.py [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/rTree|--rTree|rTree] rTreeFilepath", end = "\n\n")
+	print("\tpython indexing.py [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/rTree|--rTree|rTree] rTreeFilepath [/curve|--curve|curve] curve [/loader|--loader|loader] loader [/workers|--workers|workers] workers [/changes|--changes|changes] changesFilepath [/plot|--plot|plot] plot [/attributes|--attributes|attributes] attributesFilepath", end = "\n\n")
 	print("Example: ")
 	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt")
-	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt", end = "\n\n")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree{0}".format(rTreeBinaryExtension))
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /curve hilbert")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /loader str")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /workers 32")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.bin /changes changes.txt")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /plot none")
+	print("\tpython indexing.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /attributes attributes.txt", end = "\n\n")
 
 def handleCommandline() -> dict:
 	for arg in argv[1:]:
 		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
 			printHelp()
 			return True
-	if len(argv) > 1 and len(argv) not in (3, 5, 7):
+	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11, 13, 15, 17, 19):
 		print("The count of the commandline options is incorrect. Please check your commandline. ")
 		return False
-	dicts = {"coords":coordsFilepath, "offsets":offsetsFilepath, "rTree":rTreeFilepath}
+	dicts = {"coords":coordsFilepath, "offsets":offsetsFilepath, "rTree":rTreeFilepath, "curve":defaultCurve, "loader":defaultLoader, "workers":defaultWorkers, "changes":None, "plot":defaultPlot, "attributes":None}
 	pointer = None
 	for arg in argv[1:]:
 		if arg.lower() in ("/coords", "--coords", "coords"):
@@ -345,12 +1009,43 @@ def handleCommandline() -> dict:
 			pointer = "offsets"
 		elif arg.lower() in ("/rtree", "--rtree", "rtree"):
 			pointer = "rTree"
+		elif arg.lower() in ("/curve", "--curve", "curve"):
+			pointer = "curve"
+		elif arg.lower() in ("/loader", "--loader", "loader"):
+			pointer = "loader"
+		elif arg.lower() in ("/workers", "--workers", "workers"):
+			pointer = "workers"
+		elif arg.lower() in ("/changes", "--changes", "changes"):
+			pointer = "changes"
+		elif arg.lower() in ("/plot", "--plot", "plot"):
+			pointer = "plot"
+		elif arg.lower() in ("/attributes", "--attributes", "attributes"):
+			pointer = "attributes"
 		elif pointer is None:
 			print("Error handling commandline, please check your commandline. ")
 			return False
 		else:
 			dicts[pointer] = arg
 			pointer = None # reset
+	dicts["curve"] = dicts["curve"].lower()
+	if dicts["curve"] not in _CURVES:
+		print("Unknown packing order: {0}. Please check your commandline. ".format(dicts["curve"]))
+		return False
+	dicts["loader"] = dicts["loader"].lower()
+	if dicts["loader"] not in _LOADERS:
+		print("Unknown bulk loader: {0}. Please check your commandline. ".format(dicts["loader"]))
+		return False
+	try:
+		dicts["workers"] = int(dicts["workers"])
+		if dicts["workers"] < 1:
+			raise ValueError
+	except:
+		print("Error regarding workers as a positive integer. Please check your commandline. ")
+		return False
+	dicts["plot"] = dicts["plot"].lower()
+	if dicts["plot"] not in _PLOTS:
+		print("Unknown plotting mode: {0}. Please check your commandline. ".format(dicts["plot"]))
+		return False
 	return dicts
 
 def main() -> int:
@@ -358,34 +1053,81 @@ def main() -> int:
 	commandlineArgument = handleCommandline()
 	if type(commandlineArgument) == bool:
 		return EXIT_SUCCESS if commandlineArgument else EXIT_FAILURE
-	coords = getCoords(commandlineArgument["coords"])
+	coords = getCoordsStream(commandlineArgument["coords"])
 	if coords is None:
 		print("Error reading coords, please check. ")
 		preExit()
 		return EXIT_FAILURE
-	offsets = getOffsets(commandlineArgument["offsets"])
+	offsets = getOffsetsStream(commandlineArgument["offsets"])
 	if offsets is None:
 		print("Error reading offsets, please check. ")
 		preExit()
 		return EXIT_FAILURE
+	if isNumPyAvailable: # zero-copy views of the typed arrays
+		coords = np.frombuffer(coords, dtype = np.float64).reshape(-1, 2)
+		offsets = np.frombuffer(offsets, dtype = np.int64).reshape(-1, 3)
+	else:
+		coords = [coords[i:i + 2].tolist() for i in range(0, len(coords), 2)]
+		offsets = [offsets[i:i + 3].tolist() for i in range(0, len(offsets), 3)]
 	if not checkOffsetCoords(coords, offsets):
 		preExit()
 		return EXIT_FAILURE
-	plotCoords(coords, plotFp = plotCoordFilepath)
+	attributes = None
+	if commandlineArgument["attributes"]:
+		attributes = getAttributes(commandlineArgument["attributes"])
+		if attributes is None:
+			print("Error reading attributes, please check. ")
+			preExit()
+			return EXIT_FAILURE
+	if commandlineArgument["changes"]: # incremental indexing
+		changes = getChanges(commandlineArgument["changes"])
+		if changes is None:
+			print("Error reading changes, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		rTree = getRTree(commandlineArgument["rTree"])
+		if rTree is None:
+			print("Error reading the previous RTree, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		computeRTreeMBR(rTree)
+		rTree = reindex(rTree, changes, coords, offsets)
+		if attributes is not None:
+			attachAttributes(rTree, attributes)
+		doDumpRTree(rTree, filepath = commandlineArgument["rTree"], isIncremental = True)
+		preExit()
+		return EXIT_SUCCESS
 	
 	# handle indexing #
-	rTree = index(coords, offsets)
-	fMBRs = []
-	MBRs = []
-	getFundamentalMBR(rTree, fMBRs)
-	getMBR(rTree, MBRs)
-	MBRs.reverse()
-	plotFundamentalMBRs(fMBRs, plotFp = plotFundamentalMBRFilepath)
-	plotMBRs(MBRs, plotFp = plotMBRFilepath)
+	if commandlineArgument["workers"] > 1:
+		rTree = indexParallel(coords, offsets, curve = commandlineArgument["curve"], loader = commandlineArgument["loader"], workers = commandlineArgument["workers"])
+	elif isNumPyAvailable:
+		rTree = indexVectorized(coords, offsets, curve = commandlineArgument["curve"], loader = commandlineArgument["loader"])
+	else:
+		rTree = index(coords, offsets, curve = commandlineArgument["curve"], loader = commandlineArgument["loader"])
+	if attributes is not None:
+		attachAttributes(rTree, attributes)
 	
 	# make output #
 	doDumpRTree(rTree, filepath = commandlineArgument["rTree"])
+	
+	# make plots #
+	plotProcess = None
+	if commandlineArgument["plot"] != "none" and not isNumPyAvailable: # matplotlib needs NumPy anyway
+		print("Plotting is skipped since NumPy is not available. ")
+	elif commandlineArgument["plot"] != "none": # the background process gets the full coords, the fundamental MBRs and the MBRs of the top levels, and rasterizes the coords and the fundamental MBRs there
+		fMBRs = []
+		MBRs = []
+		getFundamentalMBR(rTree, fMBRs)
+		getMBR(rTree, MBRs)
+		MBRs = [mbr for mbr in MBRs if mbr[1] < defaultPlotLevels]
+		MBRs.reverse()
+		plotProcess = Process(target = doPlot, args = (coords, np.asarray(fMBRs), MBRs), kwargs = {"isShown":commandlineArgument["plot"] == "show"})
+		plotProcess.start()
+		print("Plotting is running in the background. ")
 	preExit()
+	if plotProcess is not None:
+		plotProcess.join()
 	return EXIT_SUCCESS
 
 
@@ -1,18 +1,44 @@
 import os
+import socket
+from array import array
+import mmap
 from sys import argv, exit
+from struct import Struct
 from ast import literal_eval
 import heapq
 from time import sleep, time
+try:
+	import numpy as np
+	isNumPyAvailable = True
+except:
+	isNumPyAvailable = False
 try:
 	os.chdir(os.path.abspath(os.path.dirname(__file__))) # cd into the location path of this script
 except: # it does not work in Jupyter-notebook
 	pass
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
+defaultStorage = "nodes"
+_STORAGES = ("nodes", "packed") # RTreeNode objects or the struct-of-arrays PackedRTree
+_ORDERS = ("input", "morton", "hilbert") # the order the queries are answered in, where the output always keeps the input order
+defaultOrder = "input"
+_CURVE_BITS = 16 # the grid resolution per axis of the space-filling curves
+defaultBatchSize = 0 # the most queries sharing one traversal where 0 answers every query on its own
+_VECTOR_VERTICES = 64 # the fewest vertices of a polygon whose distances are computed by NumPy
+_CHUNK_VERTICES = 1024 # the vertices per chunk of such a polygon, each chunk carrying its own MBR
+_GROUP_SLACK = 1e-9 # widens the group bound against the rounding of the coordinates so that no candidate of a member is lost
+_GROUP_RADIUS_RATIO = 0.5 # a query joins the group of a seed when it lies within this share of the k-th distance at the seed
+_GROUP_CANDIDATE_FACTOR = 8 # a group gathering more than this many times k candidates answers its members one by one, since every member scans them
 defaultTime = 5
 coordsFilepath = "coords.txt"
 offsetsFilepath = "offsets.txt"
+defaultChunkSize = 1 << 20
 rTreeFilepath = "Rtree.txt"
+_RTREE_MAGIC = b"RTREEMBR"
+_RTREE_VERSION = 1
+_HEADER_STRUCT = Struct("<8sIQ4d") # magic, version, root offset, root MBR
+_NODE_STRUCT = Struct("<BqI") # non-leaf flag, node id, entry count
+_ENTRY_STRUCT = Struct("<q4d") # child offset (polygon id in a leaf node), [x_low, x_high, y_low, y_high]
 kNNQueriesFilepath = "NNqueries.txt"
 kNNCoordsResultsFilepath = "kNNCoordsResults.txt"
 
@@ -29,6 +55,106 @@ class RTreeNode:
 		else:
 			return str([0, self.id, self.entries])
 
+class MappedRTreeNode(RTreeNode): # decoded from the memory-mapped binary RTree only when it is touched
+	def __init__(self, buffer, offset, MBR = None):
+		self.buffer = buffer
+		self.offset = offset
+		self.MBR = MBR
+		self._id = None
+		self._entries = None
+	@property
+	def id(self) -> int:
+		if self._id is None:
+			self._id = _NODE_STRUCT.unpack_from(self.buffer, self.offset)[1]
+		return self._id
+	@id.setter
+	def id(self, value) -> None:
+		self._id = value
+	@property
+	def entries(self) -> list:
+		if self._entries is None:
+			isNonLeaf, self._id, count = _NODE_STRUCT.unpack_from(self.buffer, self.offset)
+			start = self.offset + _NODE_STRUCT.size
+			self._entries = [																\
+				MappedRTreeNode(self.buffer, child, MBR = [x_low, x_high, y_low, y_high]) if isNonLeaf else [child, [x_low, x_high, y_low, y_high]] 	\
+				for child, x_low, x_high, y_low, y_high in _ENTRY_STRUCT.iter_unpack(memoryview(self.buffer)[start:start + count * _ENTRY_STRUCT.size])	\
+			]
+		return self._entries
+	@entries.setter
+	def entries(self, value) -> None:
+		self._entries = value
+
+
+class PackedRTree: # struct-of-arrays storage where node i owns the slots [starts[i], starts[i] + counts[i]) of the column arrays
+	def __init__(self, rTree):
+		self.x_lows, self.x_highs, self.y_lows, self.y_highs = array("d"), array("d"), array("d"), array("d")
+		self.children = array("q") # the index of the child node in a non-leaf node or the polygon id in a leaf node
+		self.starts, self.counts, self.ids, self.isLeaf = array("q"), array("q"), array("q"), array("b")
+		self.MBR = rTree.MBR
+		nodes = [rTree]
+		for node in nodes: # breadth-first so that node 0 is the root and the leaf nodes come in leaf order
+			isLeaf = not isinstance(node.entries[0], RTreeNode)
+			self.starts.append(len(self.children))
+			self.counts.append(len(node.entries))
+			self.ids.append(node.id)
+			self.isLeaf.append(isLeaf)
+			for entry in node.entries:
+				x_low, x_high, y_low, y_high = entry[1] if isLeaf else entry.MBR
+				self.x_lows.append(x_low)
+				self.x_highs.append(x_high)
+				self.y_lows.append(y_low)
+				self.y_highs.append(y_high)
+				if isLeaf:
+					self.children.append(entry[0])
+				else:
+					self.children.append(len(nodes))
+					nodes.append(entry)
+	def getMBR(self, slot) -> list:
+		return [self.x_lows[slot], self.x_highs[slot], self.y_lows[slot], self.y_highs[slot]]
+	def iterFundamentalMBRs(self) -> list: # yield [polygon_id, [x_low, x_high, y_low, y_high]] in leaf order
+		for node in range(len(self.starts)):
+			if self.isLeaf[node]:
+				for slot in range(self.starts[node], self.starts[node] + self.counts[node]):
+					yield [self.children[slot], self.getMBR(slot)]
+
+class CoordStore: # the coords of all the polygons kept in typed arrays where a polygon owns the slots [start, stop) given by ranges
+	def __init__(self, coords, ids, offsets): # the typed arrays from getCoordsWithIDStream and getOffsetsStream
+		self.xs, self.ys, self.ids = coords[0::2], coords[1::2], ids
+		self.ranges = {}
+		for i in range(0, len(offsets), 3):
+			polygon_id, start_offset, end_offset = offsets[i:i + 3]
+			start = min(max(start_offset, 0), len(ids))
+			self.ranges[polygon_id] = (start, max(min(end_offset + 1, len(ids)), start))
+		self.columns = None # the NumPy views of the arrays built by getColumns
+		self.chunks = {} # polygon_id -> [[MBR, start, stop], ...] of the large polygons touched so far
+	def __contains__(self, polygon_id) -> bool:
+		return polygon_id in self.ranges
+	def __len__(self) -> int:
+		return len(self.ranges)
+	def __iter__(self) -> iter:
+		return iter(self.ranges)
+	def __getitem__(self, polygon_id) -> zip: # the (x, y, id) of the coords of a polygon, sliced from the arrays on demand
+		start, stop = self.ranges[polygon_id]
+		return zip(self.xs[start:stop], self.ys[start:stop], self.ids[start:stop])
+	def keys(self) -> list:
+		return self.ranges.keys()
+	def getColumns(self) -> tuple: # (xs, ys, ids) as NumPy views sharing the memory of the arrays
+		if self.columns is None:
+			self.columns = (np.frombuffer(self.xs, dtype = np.float64), np.frombuffer(self.ys, dtype = np.float64), np.frombuffer(self.ids, dtype = np.int64))
+		return self.columns
+	def getChunks(self, polygon_id) -> list: # split the slots of a large polygon into runs of _CHUNK_VERTICES which carry their own MBR on the first touch, where [] leaves the polygon to the per-coord loop
+		polygonChunks = self.chunks.get(polygon_id)
+		if polygonChunks is None:
+			polygonChunks = []
+			start, stop = self.ranges[polygon_id]
+			if isNumPyAvailable and stop - start >= _VECTOR_VERTICES:
+				xs, ys, _ = self.getColumns()
+				for chunk_start in range(start, stop, _CHUNK_VERTICES):
+					chunk_stop = min(chunk_start + _CHUNK_VERTICES, stop)
+					polygonChunks.append([[float(xs[chunk_start:chunk_stop].min()), float(xs[chunk_start:chunk_stop].max()), float(ys[chunk_start:chunk_stop].min()), float(ys[chunk_start:chunk_stop].max())], chunk_start, chunk_stop])
+			self.chunks[polygon_id] = polygonChunks
+		return polygonChunks
+
 
 # get input #
 def getTxt(filepath, index = 0) -> str: # get .txt content
@@ -45,46 +171,65 @@ def getTxt(filepath, index = 0) -> str: # get .txt content
 	else:
 		return None # out of range
 
-def getCoordsWithID(coordsFp = coordsFilepath) -> list:
-	content = getTxt(coordsFp)
-	if content is None:
+def iterLines(filepath, chunkSize = defaultChunkSize) -> bytes: # yield the non-empty lines of a file read in fixed-size byte chunks
+	with open(filepath, "rb") as f:
+		chunk = f.read(chunkSize)
+		if chunk.startswith((b"\xff\xfe", b"\xfe\xff")): # UTF-16 cannot be split byte-wise
+			content = getTxt(filepath)
+			for line in (content or "").replace("\r", "\n").split("\n"):
+				if line:
+					yield line.encode("utf-8")
+			return
+		if chunk.startswith(b"\xef\xbb\xbf"): # if utf-8 with BOM, remove BOM
+			chunk = chunk[3:]
+		remainder = b""
+		while True:
+			lines = (remainder + chunk).replace(b"\r", b"\n").split(b"\n")
+			remainder = lines.pop() # the last line may continue in the next chunk
+			for line in lines:
+				if line: # filtering empty lines
+					yield line
+			chunk = f.read(chunkSize)
+			if not chunk:
+				break
+		if remainder:
+			yield remainder
+
+def getCoordsWithIDStream(coordsFp = coordsFilepath, chunkSize = defaultChunkSize) -> tuple: # ([x_0, y_0, x_1, y_1, ...], [id_0, id_1, ...])
+	coords, ids = array("d"), array("q")
+	try:
+		for cnt, line in enumerate(iterLines(coordsFp, chunkSize)):
+			if line.count(b",") == 1:
+				tmp = line.split(b",")
+				try:
+					coords.extend((float(tmp[0]), float(tmp[1])))
+					ids.append(cnt)
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
+	except OSError:
 		return None
-	content = content.replace("\r", "\n") # filtering "\r"
-	while "\n\n" in content: # filtering empty lines
-		content = content.replace("\n\n", "\n")
-	coords = []
-	for cnt, line in enumerate(content.split("\n")):
-		if line.count(",") == 1:
-			tmp = line.split(",")
-			try:
-				coords.append([float(tmp[0]), float(tmp[1]), cnt])
-			except:
-				print("Line {0} has been skipped since converting error occured. ".format(cnt))
-		elif line: # it is not necessary to prompt the empty line
-			print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
-	return coords
+	return coords, ids
 
-def getOffsets(offsetsFp = offsetsFilepath) -> list:
-	content = getTxt(offsetsFp)
-	if content is None:
+def getOffsetsStream(offsetsFp = offsetsFilepath, chunkSize = defaultChunkSize) -> array: # [polygon_id_0, start_offset_0, end_offset_0, ...]
+	offsets = array("q")
+	try:
+		for cnt, line in enumerate(iterLines(offsetsFp, chunkSize)):
+			if line.count(b",") == 2:
+				tmp = line.split(b",")
+				try:
+					offsets.extend((int(tmp[0]), int(tmp[1]), int(tmp[2])))
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 2. ".format(cnt))
+	except OSError:
 		return None
-	content = content.replace("\r", "\n") # filtering "\r"
-	while "\n\n" in content: # filtering empty lines
-		content = content.replace("\n\n", "\n")
-	offsets = []
-	for cnt, line in enumerate(content.split("\n")):
-		if line.count(",") == 2:
-			tmp = line.split(",")
-			try:
-				offsets.append([int(tmp[0]), int(tmp[1]), int(tmp[2])])
-			except:
-				print("Line {0} has been skipped since converting error occured. ".format(cnt))
-		elif line: # it is not necessary to prompt the empty line
-			print("Line {0} has been skipped since the count of comma(s) is not 2. ".format(cnt))
 	return offsets
 
 def checkOffsetCoords(coords, offsets) -> bool:
-	if offsets:
+	if len(offsets):
 		for i in range(len(offsets) - 1):
 			if offsets[i + 1][1] - offsets[i][2] != 1:
 				print("Uncovered coords are detected: From {0} to {1}. ".format(offsets[i][2], offsets[i + 1][1]))
@@ -99,14 +244,31 @@ def checkOffsetCoords(coords, offsets) -> bool:
 		return False
 	return True
 
-def index(coords, offsets) -> dict: # build index
-	fMBRs = {}
-	for offset in offsets:
-		polygon_id, start_offset, end_offset = offset
-		fMBRs[polygon_id] = coords[start_offset:end_offset + 1]
-	return fMBRs
+def indexStream(coords, ids, offsets) -> CoordStore: # build index from the typed arrays of getCoordsWithIDStream and getOffsetsStream without a per-coord object
+	return CoordStore(coords, ids, offsets)
+
+def isBinaryRTree(rTreeFp = rTreeFilepath) -> bool:
+	try:
+		with open(rTreeFp, "rb") as f:
+			return f.read(len(_RTREE_MAGIC)) == _RTREE_MAGIC
+	except:
+		return False
+
+def getBinaryRTree(rTreeFp = rTreeFilepath) -> MappedRTreeNode:
+	try:
+		with open(rTreeFp, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+		magic, version, rootOffset, x_low, x_high, y_low, y_high = _HEADER_STRUCT.unpack_from(buffer, 0)
+		if version != _RTREE_VERSION:
+			print("Unsupported binary RTree version: {0}".format(version))
+			return None
+		return MappedRTreeNode(buffer, rootOffset, MBR = [x_low, x_high, y_low, y_high])
+	except:
+		return None
 
 def getRTree(rTreeFp = rTreeFilepath) -> list:
+	if isBinaryRTree(rTreeFp):
+		return getBinaryRTree(rTreeFp)
 	content = getTxt(rTreeFp)
 	if content is None:
 		return None
@@ -187,40 +349,345 @@ def computeRTreeMBR(rTree) -> None:
 
 
 # handle querying #
-def distance(rectangle, q) -> float:
-	x_distance = 0 if rectangle[0] <= q[0] <= rectangle[1] else min(abs(rectangle[0] - q[0]), abs(rectangle[1] - q[0]))
-	y_distance = 0 if rectangle[2] <= q[1] <= rectangle[3] else min(abs(rectangle[2] - q[1]), abs(rectangle[3] - q[1]))
-	return (x_distance ** 2 + y_distance ** 2) ** (1 / 2)
+def getMortonKey(x, y) -> int: # interleave the bits of the grid cell
+	key = 0
+	for bit in range(_CURVE_BITS):
+		key |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+	return key
+
+def getHilbertKey(x, y) -> int: # the distance of the grid cell along the Hilbert curve
+	key, side = 0, 1 << (_CURVE_BITS - 1)
+	while side:
+		rx, ry = int(x & side > 0), int(y & side > 0)
+		key += side * side * ((3 * rx) ^ ry)
+		if not ry: # rotate the quadrant
+			if rx:
+				x, y = (1 << _CURVE_BITS) - 1 - x, (1 << _CURVE_BITS) - 1 - y
+			x, y = y, x
+		side >>= 1
+	return key
+
+def getQueryOrder(centres, order = defaultOrder) -> list: # the query indexes sorted by the curve key of their centres so that consecutive queries touch nearby nodes
+	if order == "input" or not centres:
+		return list(range(len(centres)))
+	x_low, x_high = min(centre[0] for centre in centres), max(centre[0] for centre in centres)
+	y_low, y_high = min(centre[1] for centre in centres), max(centre[1] for centre in centres)
+	scale = (1 << _CURVE_BITS) - 1
+	getKey = getHilbertKey if order == "hilbert" else getMortonKey
+	keys = [getKey(int((x - x_low) / (x_high - x_low) * scale) if x_high > x_low else 0, int((y - y_low) / (y_high - y_low) * scale) if y_high > y_low else 0) for x, y in centres]
+	return sorted(range(len(centres)), key = keys.__getitem__)
 
-def kNNSearching(rTree, q, k, fMBRs) -> list:
+def restoreOrder(results, permutation) -> list: # put the results answered in the permuted order back into the input order
+	restored = [None] * len(results)
+	for i, result in zip(permutation, results):
+		restored[i] = result
+	return restored
+
+def squaredDistance(rectangle, q) -> float: # the squared MINDIST, which orders like the distance without any square root
+	x_distance = rectangle[0] - q[0] if q[0] < rectangle[0] else (q[0] - rectangle[1] if q[0] > rectangle[1] else 0)
+	y_distance = rectangle[2] - q[1] if q[1] < rectangle[2] else (q[1] - rectangle[3] if q[1] > rectangle[3] else 0)
+	return x_distance * x_distance + y_distance * y_distance
+
+def pushCandidate(candidates, squared_distance, k) -> float: # keep the k smallest candidate distances in a max-heap and return the pruning bound, the k-th of them
+	if len(candidates) < k:
+		heapq.heappush(candidates, -squared_distance)
+	elif squared_distance < -candidates[0]:
+		heapq.heapreplace(candidates, -squared_distance)
+	return -candidates[0] if len(candidates) == k else float("inf")
+
+def getChunkCandidates(fMBRs, chunk, q, k, bound) -> list: # (squared distance, coord id) of the coords in a chunk within the bound, cut down to the k nearest of the chunk and their ties
+	xs, ys, ids = fMBRs.getColumns()
+	_, start, stop = chunk
+	ids = ids[start:stop]
+	x_distances, y_distances = xs[start:stop] - q[0], ys[start:stop] - q[1]
+	squared_distances = x_distances * x_distances + y_distances * y_distances
+	survivors = np.flatnonzero(squared_distances <= bound)
+	if len(survivors) > k: # a coord behind k nearer ones of the same chunk cannot be in the result
+		survivors = survivors[squared_distances[survivors] <= np.partition(squared_distances[survivors], k - 1)[k - 1]]
+	return zip(squared_distances[survivors].tolist(), ids[survivors].tolist())
+
+def kNNSearching(rTree, q, k, fMBRs) -> list: # best-first search with (squared distance, rank) keys where a node, a fMBR or a vertex chunk ranks -1 and a coord ranks by its id
 	kNNResults = []
-	if isinstance(rTree, RTreeNode): # filter
-		heap = [(distance(entry.MBR, q), index, entry) for index, entry in enumerate(rTree.entries)] # use index to avoid the same distance
-		heapq.heapify(heap) # initial heap
-		index = len(heap)
-		while heap and len(kNNResults) < k:
-			element = heapq.heappop(heap)[2] # element[0] is the distance and element[1] is the index
-			if isinstance(element, RTreeNode):
-				for entry in element.entries:
-					if isinstance(entry, RTreeNode):
-						heapq.heappush(heap, (distance(entry.MBR, q), index, entry))
-					else:
-						heapq.heappush(heap, (distance(entry[1], q), index, entry))
+	if k <= 0 or not rTree.entries:
+		return kNNResults
+	heap, candidates, bound, index = [(0, -1, 0, rTree)], [], float("inf"), 1 # index only separates the nodes, fMBRs and chunks at the same distance
+	while heap and len(kNNResults) < k:
+		_, rank, _, element = heapq.heappop(heap)
+		if rank >= 0: # [x, y, id]
+			kNNResults.append(rank) # only record id
+		elif isinstance(element, RTreeNode):
+			for entry in element.entries:
+				squared_distance = squaredDistance(entry.MBR if isinstance(entry, RTreeNode) else entry[1], q)
+				if squared_distance <= bound: # nothing under a node, a fMBR or a chunk farther than the k-th candidate can be in the result
+					heapq.heappush(heap, (squared_distance, -1, index, entry))
 					index += 1
-			elif isinstance(element[0], int) and isinstance(element[1], list): # fMBR: [id, [x_low, x_high, y_low, y_high]]
-				for coord in fMBRs[element[0]]:
-					heapq.heappush(heap, (((coord[0] - q[0]) ** 2 + (coord[1] - q[1]) ** 2) ** (1 / 2), index, coord))
+		elif isinstance(element, tuple): # chunk: (polygon id, chunk index)
+			for squared_distance, coord_id in getChunkCandidates(fMBRs, fMBRs.chunks[element[0]][element[1]], q, k, bound):
+				if squared_distance <= bound:
+					heapq.heappush(heap, (squared_distance, coord_id, 0, None))
+					bound = pushCandidate(candidates, squared_distance, k)
+		else: # fMBR: [id, [x_low, x_high, y_low, y_high]]
+			polygonChunks = fMBRs.getChunks(element[0])
+			for j, chunk in enumerate(polygonChunks):
+				squared_distance = squaredDistance(chunk[0], q)
+				if squared_distance <= bound:
+					heapq.heappush(heap, (squared_distance, -1, index, (element[0], j)))
 					index += 1
-			else: # [x, y, id]
-				kNNResults.append(element[2]) # only record id
+			if not polygonChunks: # a small polygon or no NumPy
+				for coord in fMBRs[element[0]]:
+					squared_distance = (coord[0] - q[0]) * (coord[0] - q[0]) + (coord[1] - q[1]) * (coord[1] - q[1])
+					if squared_distance <= bound:
+						heapq.heappush(heap, (squared_distance, coord[2], 0, None))
+						bound = pushCandidate(candidates, squared_distance, k)
 	return kNNResults
 
+def kNNSearchingPacked(rTree, q, k, fMBRs) -> list: # the MINDISTs are computed inline from the column arrays
+	kNNResults = []
+	if k <= 0 or not rTree.counts[0]:
+		return kNNResults
+	x_lows, x_highs, y_lows, y_highs, starts, counts, isLeaf, children = rTree.x_lows, rTree.x_highs, rTree.y_lows, rTree.y_highs, rTree.starts, rTree.counts, rTree.isLeaf, rTree.children
+	heap, candidates, bound = [(0, -1, 0, 0)], [], float("inf") # (squared distance, -1 or the coord id, kind, node or polygon id) where kind 0 is a node, kind 1 is a fMBR, kind 2 is a coord and kind 3 is a (polygon id, chunk index) chunk
+	while heap and len(kNNResults) < k:
+		_, rank, kind, element = heapq.heappop(heap)
+		if rank >= 0:
+			kNNResults.append(rank) # only record id
+		elif kind == 3:
+			for squared_distance, coord_id in getChunkCandidates(fMBRs, fMBRs.chunks[element[0]][element[1]], q, k, bound):
+				if squared_distance <= bound:
+					heapq.heappush(heap, (squared_distance, coord_id, 2, 0))
+					bound = pushCandidate(candidates, squared_distance, k)
+		elif kind == 1:
+			polygonChunks = fMBRs.getChunks(element)
+			for j, chunk in enumerate(polygonChunks):
+				squared_distance = squaredDistance(chunk[0], q)
+				if squared_distance <= bound:
+					heapq.heappush(heap, (squared_distance, -1, 3, (element, j)))
+			if not polygonChunks:
+				for coord in fMBRs[element]:
+					squared_distance = (coord[0] - q[0]) * (coord[0] - q[0]) + (coord[1] - q[1]) * (coord[1] - q[1])
+					if squared_distance <= bound:
+						heapq.heappush(heap, (squared_distance, coord[2], 2, 0))
+						bound = pushCandidate(candidates, squared_distance, k)
+		else:
+			for slot in range(starts[element], starts[element] + counts[element]):
+				x_distance = x_lows[slot] - q[0] if q[0] < x_lows[slot] else (q[0] - x_highs[slot] if q[0] > x_highs[slot] else 0)
+				y_distance = y_lows[slot] - q[1] if q[1] < y_lows[slot] else (q[1] - y_highs[slot] if q[1] > y_highs[slot] else 0)
+				squared_distance = x_distance * x_distance + y_distance * y_distance
+				if squared_distance <= bound:
+					heapq.heappush(heap, (squared_distance, -1, 1 if isLeaf[element] else 0, children[slot]))
+	return kNNResults
+
+def iterNearest(rTree, q, fMBRs) -> tuple: # distance browsing: yield (coord_id, distance) in increasing distance order while the heap lives on between the next() calls, so a caller may stop at any point without searching again
+	if not rTree.entries:
+		return
+	heap, index = [(0, -1, 0, rTree)], 1 # the same keys as kNNSearching but without a k there is no bound to prune with
+	while heap:
+		squared_distance, rank, _, element = heapq.heappop(heap)
+		if rank >= 0:
+			yield rank, squared_distance ** 0.5
+		elif isinstance(element, RTreeNode):
+			for entry in element.entries:
+				heapq.heappush(heap, (squaredDistance(entry.MBR if isinstance(entry, RTreeNode) else entry[1], q), -1, index, entry))
+				index += 1
+		else: # fMBR: [id, [x_low, x_high, y_low, y_high]], whose coords only join the heap once it is reached
+			for coord in fMBRs[element[0]]:
+				heapq.heappush(heap, ((coord[0] - q[0]) * (coord[0] - q[0]) + (coord[1] - q[1]) * (coord[1] - q[1]), coord[2], 0, None))
+
+def iterNearestPacked(rTree, q, fMBRs) -> tuple:
+	if not rTree.counts[0]:
+		return
+	x_lows, x_highs, y_lows, y_highs, starts, counts, isLeaf, children = rTree.x_lows, rTree.x_highs, rTree.y_lows, rTree.y_highs, rTree.starts, rTree.counts, rTree.isLeaf, rTree.children
+	heap = [(0, -1, 0, 0)] # (squared distance, -1 or the coord id, kind, node or polygon id) where kind 0 is a node and kind 1 is a fMBR
+	while heap:
+		squared_distance, rank, kind, element = heapq.heappop(heap)
+		if rank >= 0:
+			yield rank, squared_distance ** 0.5
+		elif kind == 1:
+			for coord in fMBRs[element]:
+				heapq.heappush(heap, ((coord[0] - q[0]) * (coord[0] - q[0]) + (coord[1] - q[1]) * (coord[1] - q[1]), coord[2], 2, 0))
+		else:
+			for slot in range(starts[element], starts[element] + counts[element]):
+				x_distance = x_lows[slot] - q[0] if q[0] < x_lows[slot] else (q[0] - x_highs[slot] if q[0] > x_highs[slot] else 0)
+				y_distance = y_lows[slot] - q[1] if q[1] < y_lows[slot] else (q[1] - y_highs[slot] if q[1] > y_highs[slot] else 0)
+				heapq.heappush(heap, (x_distance * x_distance + y_distance * y_distance, -1, 1 if isLeaf[element] else 0, children[slot]))
+
+def getGroupBound(squared_bound, radius) -> float: # a member within radius of the seed has its k-th neighbour within the k-th distance at the seed plus radius, so only what lies within that plus radius again of the seed can be in its result
+	return (squared_bound ** 0.5 + 2 * radius) ** 2
+
+def getChunkItems(fMBRs, chunk, c, limit) -> zip: # (squared distance, (x, y, id)) of every coord in a chunk within the group bound
+	xs, ys, ids = fMBRs.getColumns()
+	_, start, stop = chunk
+	xs, ys, ids = xs[start:stop], ys[start:stop], ids[start:stop]
+	x_distances, y_distances = xs - c[0], ys - c[1]
+	squared_distances = x_distances * x_distances + y_distances * y_distances
+	survivors = np.flatnonzero(squared_distances <= limit)
+	return zip(squared_distances[survivors].tolist(), zip(xs[survivors].tolist(), ys[survivors].tolist(), ids[survivors].tolist()))
+
+def pruneGroupItems(items, limit, most) -> list: # drop the items left beyond the shrinking group bound once they pile up, where None means that more than most of them are within it
+	if len(items) <= 2 * most:
+		return items
+	items = [item for item in items if item[0] <= limit]
+	return items if len(items) <= most else None
+
+def getGroupCandidates(rTree, c, k, radius, most, fMBRs) -> tuple: # one best-first traversal from the seed c returning ([distance at c, [x, y, id]] within the group bound nearest first, the squared k-th distance at c), or None for the candidates once there are more than most of them
+	items, candidates, bound, limit = [], [], float("inf"), float("inf")
+	if k <= 0 or not rTree.entries:
+		return items, bound
+	heap, index = [(0, 0, rTree)], 1 # index only separates the nodes, fMBRs and chunks at the same distance
+	while heap and heap[0][0] <= limit: # every node, fMBR or chunk left is beyond the group bound
+		_, _, element = heapq.heappop(heap)
+		if isinstance(element, RTreeNode):
+			for entry in element.entries:
+				squared_distance = squaredDistance(entry.MBR if isinstance(entry, RTreeNode) else entry[1], c)
+				if squared_distance <= limit:
+					heapq.heappush(heap, (squared_distance, index, entry))
+					index += 1
+		elif isinstance(element, tuple): # chunk: (polygon id, chunk index)
+			for squared_distance, coord in getChunkItems(fMBRs, fMBRs.chunks[element[0]][element[1]], c, limit):
+				if squared_distance <= limit:
+					items.append((squared_distance, coord))
+					bound = pushCandidate(candidates, squared_distance, k)
+					limit = getGroupBound(bound, radius)
+					items = pruneGroupItems(items, limit, most)
+					if items is None:
+						return None, bound
+		else: # fMBR: [id, [x_low, x_high, y_low, y_high]]
+			polygonChunks = fMBRs.getChunks(element[0])
+			for j, chunk in enumerate(polygonChunks):
+				squared_distance = squaredDistance(chunk[0], c)
+				if squared_distance <= limit:
+					heapq.heappush(heap, (squared_distance, index, (element[0], j)))
+					index += 1
+			if not polygonChunks: # a small polygon or no NumPy
+				for coord in fMBRs[element[0]]:
+					squared_distance = (coord[0] - c[0]) * (coord[0] - c[0]) + (coord[1] - c[1]) * (coord[1] - c[1])
+					if squared_distance <= limit:
+						items.append((squared_distance, coord))
+						bound = pushCandidate(candidates, squared_distance, k)
+						limit = getGroupBound(bound, radius)
+						items = pruneGroupItems(items, limit, most)
+						if items is None:
+							return None, bound
+	return sorted([(squared_distance ** 0.5, coord) for squared_distance, coord in items if squared_distance <= limit], key = lambda item: item[0]), bound
+
+def getGroupCandidatesPacked(rTree, c, k, radius, most, fMBRs) -> tuple:
+	items, candidates, bound, limit = [], [], float("inf"), float("inf")
+	if k <= 0 or not rTree.counts[0]:
+		return items, bound
+	x_lows, x_highs, y_lows, y_highs, starts, counts, isLeaf, children = rTree.x_lows, rTree.x_highs, rTree.y_lows, rTree.y_highs, rTree.starts, rTree.counts, rTree.isLeaf, rTree.children
+	heap = [(0, 0, 0)] # (squared distance, kind, element) where kind 0 is a node, kind 1 is a fMBR and kind 2 is a (polygon id, chunk index) chunk
+	while heap and heap[0][0] <= limit:
+		_, kind, element = heapq.heappop(heap)
+		if kind == 2:
+			for squared_distance, coord in getChunkItems(fMBRs, fMBRs.chunks[element[0]][element[1]], c, limit):
+				if squared_distance <= limit:
+					items.append((squared_distance, coord))
+					bound = pushCandidate(candidates, squared_distance, k)
+					limit = getGroupBound(bound, radius)
+					items = pruneGroupItems(items, limit, most)
+					if items is None:
+						return None, bound
+		elif kind == 1:
+			polygonChunks = fMBRs.getChunks(element)
+			for j, chunk in enumerate(polygonChunks):
+				squared_distance = squaredDistance(chunk[0], c)
+				if squared_distance <= limit:
+					heapq.heappush(heap, (squared_distance, 2, (element, j)))
+			if not polygonChunks:
+				for coord in fMBRs[element]:
+					squared_distance = (coord[0] - c[0]) * (coord[0] - c[0]) + (coord[1] - c[1]) * (coord[1] - c[1])
+					if squared_distance <= limit:
+						items.append((squared_distance, coord))
+						bound = pushCandidate(candidates, squared_distance, k)
+						limit = getGroupBound(bound, radius)
+						items = pruneGroupItems(items, limit, most)
+						if items is None:
+							return None, bound
+		else:
+			for slot in range(starts[element], starts[element] + counts[element]):
+				x_distance = x_lows[slot] - c[0] if c[0] < x_lows[slot] else (c[0] - x_highs[slot] if c[0] > x_highs[slot] else 0)
+				y_distance = y_lows[slot] - c[1] if c[1] < y_lows[slot] else (c[1] - y_highs[slot] if c[1] > y_highs[slot] else 0)
+				squared_distance = x_distance * x_distance + y_distance * y_distance
+				if squared_distance <= limit:
+					heapq.heappush(heap, (squared_distance, 1 if isLeaf[element] else 0, children[slot]))
+	return sorted([(squared_distance ** 0.5, coord) for squared_distance, coord in items if squared_distance <= limit], key = lambda item: item[0]), bound
+
+def selectGroupMember(items, q, k, radius) -> list: # scan the candidates outwards from the seed until the rest are farther from q than its k-th candidate
+	candidates = [] # max-heap of the negated (squared distance, coord_id)
+	for distance, (x, y, coord_id) in items:
+		if len(candidates) == k and distance > radius and (distance - radius) * (distance - radius) > -candidates[0][0]:
+			break
+		key = (-((x - q[0]) * (x - q[0]) + (y - q[1]) * (y - q[1])), -coord_id)
+		if len(candidates) < k:
+			heapq.heappush(candidates, key)
+		elif key > candidates[0]:
+			heapq.heapreplace(candidates, key)
+	return [-coord_id for _, coord_id in sorted(candidates, reverse = True)] # ties are broken by the coord id like the single-query search
+
 def doKNNSearching(rTree, queries, k, fMBRs) -> list:
 	kNNResults = []
 	for query in queries:
-		kNNResults.append([query, kNNSearching(rTree, query, k, fMBRs)])
+		kNNResults.append([query, kNNSearchingPacked(rTree, query, k, fMBRs) if isinstance(rTree, PackedRTree) else kNNSearching(rTree, query, k, fMBRs)])
+	return kNNResults
+
+def doKNNSearchingBatch(rTree, queries, k, fMBRs, batchSize = defaultBatchSize) -> list: # the next queries along the Hilbert curve lying within a share of the k-th distance at a seed query share one traversal from the seed, unless it gathers more than a few times k candidates
+	kNNResults = [None] * len(queries)
+	permutation = getQueryOrder(queries, order = "hilbert")
+	packed, i = isinstance(rTree, PackedRTree), 0
+	getCandidates = getGroupCandidatesPacked if packed else getGroupCandidates
+	while i < len(permutation):
+		c = queries[permutation[i]]
+		slack = _GROUP_SLACK * (1 + abs(c[0]) + abs(c[1]))
+		items, bound = getCandidates(rTree, c, k, slack, float("inf"), fMBRs) # the seed alone measures its k-th distance
+		kNNResults[permutation[i]] = [c, selectGroupMember(items, c, k, slack)]
+		squared_share, squared_radius, j = _GROUP_RADIUS_RATIO * _GROUP_RADIUS_RATIO * bound, 0, i + 1
+		while j < len(permutation) and j - i < batchSize:
+			q = queries[permutation[j]]
+			squared_distance = (q[0] - c[0]) * (q[0] - c[0]) + (q[1] - c[1]) * (q[1] - c[1])
+			if squared_distance > squared_share:
+				break
+			squared_radius = max(squared_radius, squared_distance)
+			j += 1
+		if j > i + 1:
+			radius = squared_radius ** 0.5 + slack
+			items, _ = getCandidates(rTree, c, k, radius, _GROUP_CANDIDATE_FACTOR * k, fMBRs)
+			for p in permutation[i + 1:j]:
+				kNNResults[p] = [queries[p], selectGroupMember(items, queries[p], k, radius) if items is not None else (kNNSearchingPacked(rTree, queries[p], k, fMBRs) if packed else kNNSearching(rTree, queries[p], k, fMBRs))] # a sparse group answers its members one by one
+		i = j
 	return kNNResults
 
+def getServerResponses(server, requests) -> list: # send the request lines pipelined to queryServer.py and return its response lines in order
+	if server.lower().startswith("unix:"):
+		if not hasattr(socket, "AF_UNIX"):
+			raise OSError("Unix sockets are not supported on this platform")
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.connect(server[5:])
+	else:
+		host, _, port = server.rpartition(":")
+		connection = socket.create_connection((host or "127.0.0.1", int(port)))
+	with connection:
+		connection.sendall("".join([request + "\n" for request in requests]).encode("utf-8"))
+		connection.shutdown(socket.SHUT_WR) # the server closes the connection after the last response
+		with connection.makefile("r", encoding = "utf-8") as f:
+			return f.read().splitlines()
+
+def doRemoteQuerying(server, queries, requests) -> list: # [query, ids] from the responses of the requests
+	try:
+		responses = getServerResponses(server, requests)
+	except (OSError, ValueError) as e:
+		print("Error querying the server {0}: {1}".format(server, e))
+		return None
+	if len(responses) != len(requests):
+		print("The server answered {0} of {1} request(s). ".format(len(responses), len(requests)))
+		return None
+	results = []
+	for query, response in zip(queries, responses):
+		if not response.startswith("ok"):
+			print("The server failed on {0}: {1}".format(query, response))
+			return None
+		results.append([query, [int(item) for item in response[3:].split(",") if item]])
+	return results
+
 
 # make output #
 def output(kNNResults, outputFp = None, encoding = "utf-8") -> bool:
@@ -264,14 +731,22 @@ def printHelp() -> None:
 	print("Option: ")
 	print("\t[/coords|--coords|coords]: Specify that the following option is the input coord file. ")
 	print("\t[/offsets|--offsets|offsets]: Specify that the following option is the input offset file. ")
-	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file. ")
+	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file (text or binary). ")
 	print("\t[/kNNQueries|--kNNQueries|kNNQueries]: Specify that the following option is the input KNN querying file. ")
 	print("\t[/k|-k|k]: Specify that the following option is the input k. ")
+	print("\t[/storage|--storage|storage]: Specify that the following option is the storage of the RTree ({0}). ".format("|".join(_STORAGES)))
+	print("\t[/order|--order|order]: Specify that the following option is the order the queries are answered in ({0}). The results are always written in the input order. ".format("|".join(_ORDERS)))
+	print("\t[/server|--server|server]: Specify that the following option is the address of a running queryServer.py (host:port or unix:path) to send the queries to instead of loading the RTree. ")
+	print("\t[/batch|--batch|batch]: Specify that the following option is the most nearby queries sharing one traversal of the RTree (0 answers every query on its own). The results stay the same. ")
 	print("\t[/o|-o|o|/output|--output|output]: Specify that the following option is the output result file. ", end = "\n\n")
 	print("Format: ")
-	print("\tpython kNNCoordsSearching.py [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/rTree|--rTree|rTree] rTreeFilepath [/kNNQueries|--kNNQueries|kNNQueries] kNNQueriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath", end = "\n\n")
+	print("\tpython kNNCoordsSearching.py [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/rTree|--rTree|rTree] rTreeFilepath [/kNNQueries|--kNNQueries|kNNQueries] kNNQueriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath [/storage|--storage|storage] storage [/order|--order|order] order [/server|--server|server] serverAddress [/batch|--batch|batch] batchSize", end = "\n\n")
 	print("Example: ")
 	print("\tpython kNNCoordsSearching.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /kNNQueries NNqueries.txt /k 10")
+	print("\tpython kNNCoordsSearching.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /kNNQueries NNqueries.txt /k 10 /storage packed")
+	print("\tpython kNNCoordsSearching.py /rTree Rtree.txt /kNNQueries NNqueries.txt /k 10 /order hilbert")
+	print("\tpython kNNCoordsSearching.py /kNNQueries NNqueries.txt /k 10 /server 127.0.0.1:8765")
+	print("\tpython kNNCoordsSearching.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /kNNQueries NNqueries.txt /k 10 /batch 16")
 	print("\tpython kNNCoordsSearching.py /coords coords.txt /offsets offsets.txt /rTree Rtree.txt /kNNQueries NNqueries.txt /k 10 /output kNNCoordsResults.txt", end = "\n\n")
 
 def handleCommandline() -> dict:
@@ -279,10 +754,10 @@ def handleCommandline() -> dict:
 		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
 			printHelp()
 			return True
-	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11, 13):
+	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11, 13, 15, 17, 19, 21):
 		print("The count of the commandline options is incorrect. Please check your commandline. ")
 		return False
-	dicts = {"coords":coordsFilepath, "offsets":offsetsFilepath, "rTree":rTreeFilepath, "kNNQueries":kNNQueriesFilepath, "k":10, "output":kNNCoordsResultsFilepath}
+	dicts = {"coords":coordsFilepath, "offsets":offsetsFilepath, "rTree":rTreeFilepath, "kNNQueries":kNNQueriesFilepath, "k":10, "output":kNNCoordsResultsFilepath, "storage":defaultStorage, "order":defaultOrder, "server":None, "batch":defaultBatchSize}
 	pointer = None
 	for arg in argv[1:]:
 		if arg.lower() in ("/coords", "--coords", "coords"):
@@ -297,6 +772,14 @@ def handleCommandline() -> dict:
 			pointer = "k"
 		elif arg.lower() in ("/o", "-o", "o", "/output", "--output", "output"):
 			pointer = "output"
+		elif arg.lower() in ("/storage", "--storage", "storage"):
+			pointer = "storage"
+		elif arg.lower() in ("/order", "--order", "order"):
+			pointer = "order"
+		elif arg.lower() in ("/server", "--server", "server"):
+			pointer = "server"
+		elif arg.lower() in ("/batch", "--batch", "batch"):
+			pointer = "batch"
 		elif pointer is None:
 			print("Error handling commandline, please check your commandline. ")
 			return False
@@ -308,6 +791,24 @@ def handleCommandline() -> dict:
 	except:
 		print("Error regarding k as an integer. Please check your commandline. ")
 		return False
+	dicts["storage"] = dicts["storage"].lower()
+	if dicts["storage"] not in _STORAGES:
+		print("Unknown storage: {0}. Please check your commandline. ".format(dicts["storage"]))
+		return False
+	dicts["order"] = dicts["order"].lower()
+	if dicts["order"] not in _ORDERS:
+		print("Unknown query order: {0}. Please check your commandline. ".format(dicts["order"]))
+		return False
+	try:
+		dicts["batch"] = int(dicts["batch"])
+		if dicts["batch"] < 0:
+			raise ValueError
+	except:
+		print("Error regarding batch as a non-negative integer. Please check your commandline. ")
+		return False
+	if dicts["batch"] and dicts["server"]:
+		print("The batch size applies to the local search only. Please check your commandline. ")
+		return False
 	return dicts
 
 def main() -> int:
@@ -315,39 +816,61 @@ def main() -> int:
 	commandlineArgument = handleCommandline()
 	if type(commandlineArgument) == bool:
 		return EXIT_SUCCESS if commandlineArgument else EXIT_FAILURE
-	coords = getCoordsWithID(commandlineArgument["coords"])
-	if coords is None:
+	if commandlineArgument["server"]: # a thin client of queryServer.py which keeps the RTree resident
+		queries = getQueries(commandlineArgument["kNNQueries"])
+		if queries is None:
+			print("Error reading queries, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		start_time = time()
+		kNNResults = doRemoteQuerying(commandlineArgument["server"], queries, ["knncoords {0} {1!r} {2!r}".format(commandlineArgument["k"], *query) for query in queries])
+		end_time = time()
+		if kNNResults is None:
+			preExit()
+			return EXIT_FAILURE
+		if len(queries):
+			print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000))
+		output(kNNResults, outputFp = commandlineArgument["output"])
+		preExit()
+		return EXIT_SUCCESS
+	coordsWithID = getCoordsWithIDStream(commandlineArgument["coords"])
+	if coordsWithID is None:
 		print("Error reading coords, please check. ")
 		preExit()
 		return EXIT_FAILURE
-	offsets = getOffsets(commandlineArgument["offsets"])
+	coords, ids = coordsWithID
+	offsets = getOffsetsStream(commandlineArgument["offsets"])
 	if offsets is None:
 		print("Error reading offsets, please check. ")
 		preExit()
 		return EXIT_FAILURE
-	if not checkOffsetCoords(coords, offsets):
+	if not checkOffsetCoords(ids, [offsets[i:i + 3] for i in range(0, len(offsets), 3)]):
 		preExit()
 		return EXIT_FAILURE
-	fMBRs = index(coords, offsets)
+	fMBRs = indexStream(coords, ids, offsets)
 	rTree = getRTree(commandlineArgument["rTree"])
 	if rTree is None:
 		print("Error reading RTree, please check. ")
 		preExit()
 		return EXIT_FAILURE
 	computeRTreeMBR(rTree)
-	if not checkRTreeMBR(rTree):
+	if not isinstance(rTree, MappedRTreeNode) and not checkRTreeMBR(rTree): # checking a binary RTree would touch every page
 		print("Check RTree MBR failed. Please check your input RTree file. ")
 		preExit()
 		return EXIT_FAILURE
+	if commandlineArgument["storage"] == "packed":
+		rTree = PackedRTree(rTree)
 	queries = getQueries(commandlineArgument["kNNQueries"])
 	if queries is None:
 		print("Error reading queries, please check. ")
 		preExit()
 		return EXIT_FAILURE
+	permutation = getQueryOrder([query for query in queries], order = commandlineArgument["order"]) # answering the queries along a space-filling curve keeps the touched nodes warm
+	queries = [queries[i] for i in permutation]
 	
 	# handle queries #
 	start_time = time()
-	kNNResults = doKNNSearching(rTree, queries, commandlineArgument["k"], fMBRs)
+	kNNResults = doKNNSearchingBatch(rTree, queries, commandlineArgument["k"], fMBRs, batchSize = commandlineArgument["batch"]) if commandlineArgument["batch"] else doKNNSearching(rTree, queries, commandlineArgument["k"], fMBRs)
 	end_time = time()
 	if len(queries):
 		print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000))
@@ -355,7 +878,7 @@ def main() -> int:
 		print("Nothing queried since the querying list is empty. ")
 	
 	# make output #
-	output(kNNResults, outputFp = commandlineArgument["output"])
+	output(restoreOrder(kNNResults, permutation), outputFp = commandlineArgument["output"])
 	preExit()
 	return EXIT_SUCCESS
 
@@ -1,5 +1,8 @@
 import os
+from array import array
+import mmap
 from sys import argv, exit
+from struct import Struct
 from ast import literal_eval
 from time import sleep, time
 try:
@@ -13,9 +16,16 @@ except: # it does not work in Jupyter-notebook
 	pass
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
+defaultStorage = "nodes"
+_STORAGES = ("nodes", "packed") # RTreeNode objects or the struct-of-arrays PackedRTree
 defaultTime = 5
 coordsFilepath = "coords.txt"
 rTreeFilepath = "Rtree.txt"
+_RTREE_MAGIC = b"RTREEMBR"
+_RTREE_VERSION = 1
+_HEADER_STRUCT = Struct("<8sIQ4d") # magic, version, root offset, root MBR
+_NODE_STRUCT = Struct("<BqI") # non-leaf flag, node id, entry count
+_ENTRY_STRUCT = Struct("<q4d") # child offset (polygon id in a leaf node), [x_low, x_high, y_low, y_high]
 queriesFilepath = "NNqueries.txt"
 linearScanningCoordsResultsFilepath = "linearScanningCoordsResults.txt"
 linearScanningMBRsResultsFilepath = "linearScanningMBRsResults.txt"
@@ -33,6 +43,68 @@ class RTreeNode:
 		else:
 			return str([0, self.id, self.entries])
 
+class MappedRTreeNode(RTreeNode): # decoded from the memory-mapped binary RTree only when it is touched
+	def __init__(self, buffer, offset, MBR = None):
+		self.buffer = buffer
+		self.offset = offset
+		self.MBR = MBR
+		self._id = None
+		self._entries = None
+	@property
+	def id(self) -> int:
+		if self._id is None:
+			self._id = _NODE_STRUCT.unpack_from(self.buffer, self.offset)[1]
+		return self._id
+	@id.setter
+	def id(self, value) -> None:
+		self._id = value
+	@property
+	def entries(self) -> list:
+		if self._entries is None:
+			isNonLeaf, self._id, count = _NODE_STRUCT.unpack_from(self.buffer, self.offset)
+			start = self.offset + _NODE_STRUCT.size
+			self._entries = [																\
+				MappedRTreeNode(self.buffer, child, MBR = [x_low, x_high, y_low, y_high]) if isNonLeaf else [child, [x_low, x_high, y_low, y_high]] 	\
+				for child, x_low, x_high, y_low, y_high in _ENTRY_STRUCT.iter_unpack(memoryview(self.buffer)[start:start + count * _ENTRY_STRUCT.size])	\
+			]
+		return self._entries
+	@entries.setter
+	def entries(self, value) -> None:
+		self._entries = value
+
+
+class PackedRTree: # struct-of-arrays storage where node i owns the slots [starts[i], starts[i] + counts[i]) of the column arrays
+	def __init__(self, rTree):
+		self.x_lows, self.x_highs, self.y_lows, self.y_highs = array("d"), array("d"), array("d"), array("d")
+		self.children = array("q") # the index of the child node in a non-leaf node or the polygon id in a leaf node
+		self.starts, self.counts, self.ids, self.isLeaf = array("q"), array("q"), array("q"), array("b")
+		self.MBR = rTree.MBR
+		nodes = [rTree]
+		for node in nodes: # breadth-first so that node 0 is the root and the leaf nodes come in leaf order
+			isLeaf = not isinstance(node.entries[0], RTreeNode)
+			self.starts.append(len(self.children))
+			self.counts.append(len(node.entries))
+			self.ids.append(node.id)
+			self.isLeaf.append(isLeaf)
+			for entry in node.entries:
+				x_low, x_high, y_low, y_high = entry[1] if isLeaf else entry.MBR
+				self.x_lows.append(x_low)
+				self.x_highs.append(x_high)
+				self.y_lows.append(y_low)
+				self.y_highs.append(y_high)
+				if isLeaf:
+					self.children.append(entry[0])
+				else:
+					self.children.append(len(nodes))
+					nodes.append(entry)
+	def getMBR(self, slot) -> list:
+		return [self.x_lows[slot], self.x_highs[slot], self.y_lows[slot], self.y_highs[slot]]
+	def iterFundamentalMBRs(self) -> list: # yield [polygon_id, [x_low, x_high, y_low, y_high]] in leaf order
+		for node in range(len(self.starts)):
+			if self.isLeaf[node]:
+				for slot in range(self.starts[node], self.starts[node] + self.counts[node]):
+					yield [self.children[slot], self.getMBR(slot)]
+
 
 # get input #
 def getTxt(filepath, index = 0) -> str: # get .txt content
@@ -68,7 +140,28 @@ def getCoordsWithID(coordsFp = coordsFilepath) -> list:
 			print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
 	return coords
 
+def isBinaryRTree(rTreeFp = rTreeFilepath) -> bool:
+	try:
+		with open(rTreeFp, "rb") as f:
+			return f.read(len(_RTREE_MAGIC)) == _RTREE_MAGIC
+	except:
+		return False
+
+def getBinaryRTree(rTreeFp = rTreeFilepath) -> MappedRTreeNode:
+	try:
+		with open(rTreeFp, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+		magic, version, rootOffset, x_low, x_high, y_low, y_high = _HEADER_STRUCT.unpack_from(buffer, 0)
+		if version != _RTREE_VERSION:
+			print("Unsupported binary RTree version: {0}".format(version))
+			return None
+		return MappedRTreeNode(buffer, rootOffset, MBR = [x_low, x_high, y_low, y_high])
+	except:
+		return None
+
 def getRTree(rTreeFp = rTreeFilepath) -> list:
+	if isBinaryRTree(rTreeFp):
+		return getBinaryRTree(rTreeFp)
 	content = getTxt(rTreeFp)
 	if content is None:
 		return None
@@ -166,7 +259,10 @@ def isOverlap(rect1, rect2) -> bool: # [x_low, x_high, y_low, y_high]
 	return rect1[0] <= rect2[1] and rect1[1] >= rect2[0] and rect1[2] <= rect2[3] and rect1[3] >= rect2[2]
 
 def _linearScanningRanges(rTree, q, init_list) -> None:
-	if isinstance(rTree, RTreeNode):
+	if isinstance(rTree, PackedRTree):
+		for fMBR in rTree.iterFundamentalMBRs():
+			_linearScanningRanges(fMBR, q, init_list)
+	elif isinstance(rTree, RTreeNode):
 		for entry in rTree.entries:
 			_linearScanningRanges(entry, q, init_list)
 	elif isOverlap(rTree[1], q):
@@ -183,7 +279,10 @@ def distance(rectangle, q) -> float:
 	return (x_distance ** 2 + y_distance ** 2) ** (1 / 2)
 
 def _linearScanningMBRs(rTree, q, init_list) -> None:
-	if isinstance(rTree, RTreeNode):
+	if isinstance(rTree, PackedRTree):
+		for fMBR in rTree.iterFundamentalMBRs():
+			init_list.append((fMBR, distance(fMBR[1], q)))
+	elif isinstance(rTree, RTreeNode):
 		for entry in rTree.entries:
 			_linearScanningMBRs(entry, q, init_list)
 	else:
@@ -246,13 +345,14 @@ def printHelp() -> None:
 	print("Python script for KNN querying by linear scanning. ", end = "\n\n")
 	print("Option: ")
 	print("\t[/coords|--coords|coords]: Specify that the following option is the input coords file. ")
-	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file. ")
+	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file (text or binary). ")
 	print("\t[/queries|--queries|queries]: Specify that the following option is the input querying file. ")
 	print("\t[/k|-k|k]: Specify that the following option is the input k. ")
+	print("\t[/storage|--storage|storage]: Specify that the following option is the storage of the RTree ({0}). ".format("|".join(_STORAGES)))
 	print("\t[/o|-o|o|/output|--output|output]: Specify that the following option is the output result file. ", end = "\n\n")
 	print("Format: ")
-	print("\tpython linearQuerying.py [/rTree|--rTree|rTree] rTreeFilepath [/queries|--queries|queries] queriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath")
-	print("\tpython linearQuerying.py [/coords|--coords|coords] coordsFilepath [/queries|--queries|queries] queriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath", end = "\n\n")
+	print("\tpython linearQuerying.py [/rTree|--rTree|rTree] rTreeFilepath [/queries|--queries|queries] queriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath [/storage|--storage|storage] storage")
+	print("\tpython linearQuerying.py [/coords|--coords|coords] coordsFilepath [/queries|--queries|queries] queriesFilepath [/k|-k|k] k [/o|-o|o|/output|--output|output] outputFilepath [/storage|--storage|storage] storage", end = "\n\n")
 	print("Example: ")
 	print("\tpython linearQuerying.py /rTree rTree.txt /queries NNqueries.txt /k 10 /output linearScanningMBRsResults.txt")
 	print("\tpython linearQuerying.py /coords coords.txt /queries NNqueries.txt /k 10 /output linearScanningCoordsResults.txt", end = "\n\n")
@@ -263,10 +363,10 @@ def handleCommandline() -> dict:
 		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
 			printHelp()
 			return True
-	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9):
+	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11):
 		print("The count of the commandline options is incorrect. Please check your commandline. ")
 		return False
-	dicts = {"coords":coordsFilepath, "rTree":rTreeFilepath, "queries":queriesFilepath, "k":10, "output":None, "queryMBR":None}
+	dicts = {"coords":coordsFilepath, "rTree":rTreeFilepath, "queries":queriesFilepath, "k":10, "output":None, "queryMBR":None, "storage":defaultStorage}
 	pointer = None
 	for arg in argv[1:]:
 		if arg.lower() in ("/coords", "--coords", "coords"):
@@ -281,6 +381,8 @@ def handleCommandline() -> dict:
 			pointer = "k"
 		elif arg.lower() in ("/o", "-o", "o", "/output", "--output", "output"):
 			pointer = "output"
+		elif arg.lower() in ("/storage", "--storage", "storage"):
+			pointer = "storage"
 		elif pointer is None:
 			print("Error handling commandline, please check your commandline. ")
 			return False
@@ -292,6 +394,10 @@ def handleCommandline() -> dict:
 	except:
 		print("Error regarding k as an integer. Please check your commandline. ")
 		return False
+	dicts["storage"] = dicts["storage"].lower()
+	if dicts["storage"] not in _STORAGES:
+		print("Unknown storage: {0}. Please check your commandline. ".format(dicts["storage"]))
+		return False
 	return dicts
 
 def main() -> int:
@@ -314,10 +420,12 @@ def main() -> int:
 			preExit()
 			return EXIT_FAILURE
 		computeRTreeMBR(rTree)
-		if not checkRTreeMBR(rTree):
+		if not isinstance(rTree, MappedRTreeNode) and not checkRTreeMBR(rTree): # checking a binary RTree would touch every page
 			print("Check RTree MBR failed. Please check your input RTree file. ")
 			preExit()
 			return EXIT_FAILURE
+		if commandlineArgument["storage"] == "packed":
+			rTree = PackedRTree(rTree)
 	else:
 		coords = getCoordsWithID(commandlineArgument["coords"])
 		if coords is None:
@@ -0,0 +1,302 @@
+import os
+import asyncio
+from sys import argv, exit
+from time import sleep, time
+import rangeQuerying # the engines of the query scripts, kept resident together with their RTrees
+import kNNMBRsSearching
+import kNNCoordsSearching
+try:
+	os.chdir(os.path.abspath(os.path.dirname(__file__))) # cd into the location path of this script
+except: # it does not work in Jupyter-notebook
+	pass
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+defaultTime = 5
+defaultHost = "127.0.0.1"
+defaultPort = 8765
+defaultBatchDelay = 0.001 # seconds to wait for concurrent requests to join a batch
+defaultMaxBatch = 4096 # the maximum count of requests answered together
+defaultKNNGroupSize = 16 # the most nearby knn requests of a batch sharing one traversal of the RTree
+rTreeFilepath = "Rtree.txt"
+_KINDS = ("range", "knn", "knncoords") # "range x_low y_low x_high y_high [limit]", "knn k x y" and "knncoords k x y"
+
+
+# class #
+class QueryServer: # answer the request lines of every connection in order while the requests of all the connections are batched together
+	def __init__(self, rangeTree, kNNTree, kNNCoordsTree = None, fMBRs = None, batchDelay = defaultBatchDelay, maxBatch = defaultMaxBatch, kNNGroupSize = defaultKNNGroupSize):
+		self.rangeTree = rangeTree
+		self.kNNTree = kNNTree
+		self.kNNCoordsTree = kNNCoordsTree
+		self.fMBRs = fMBRs
+		self.rangeMatrices = rangeQuerying.getNodeMatrices(rangeTree) if isinstance(rangeTree, rangeQuerying.PackedRTree) else None # built once for all the batches
+		self.batchDelay = batchDelay
+		self.maxBatch = maxBatch
+		self.kNNGroupSize = kNNGroupSize
+		self.requests = [] # [kind, args, future] waiting for the next batch
+		self.hasRequests = None # created by start in the running loop
+		self.requestCount, self.batchCount, self.connectionCount = 0, 0, 0
+	def answerBatch(self, requests) -> list: # one engine call per kind, where the range windows share a single traversal and the nearby knn points share a traversal per group, and return the (future, response) pairs
+		groups, responses = {}, []
+		for kind, args, future in requests:
+			groups.setdefault((kind, None if kind == "range" else args[0]), []).append((args, future))
+		for (kind, k), group in groups.items():
+			try:
+				if kind == "range":
+					windows = [args[0] for args, _ in group]
+					rangeResults = rangeQuerying.doRangeQueryingBatch(self.rangeTree, windows, matrices = self.rangeMatrices) if self.rangeMatrices is not None else rangeQuerying.doRangeQuerying(self.rangeTree, windows)
+					results = [ids[:args[1]] if args[1] else ids for (args, _), (_, ids) in zip(group, rangeResults)]
+				elif kind == "knn":
+					results = [ids for _, ids in kNNMBRsSearching.doKNNSearchingBatch(self.kNNTree, [args[1] for args, _ in group], k, self.kNNGroupSize)]
+				elif self.kNNCoordsTree is None:
+					raise ValueError("the server was started without the coord and offset files")
+				else:
+					results = [ids for _, ids in kNNCoordsSearching.doKNNSearchingBatch(self.kNNCoordsTree, [args[1] for args, _ in group], k, self.fMBRs, self.kNNGroupSize)]
+				responses.extend((future, "ok " + ",".join([str(item) for item in ids])) for (_, future), ids in zip(group, results))
+			except Exception as e:
+				responses.extend((future, "error {0}".format(e)) for _, future in group)
+		return responses
+	async def start(self) -> asyncio.Future: # the event belongs to the running loop, so it is created here rather than in __init__
+		self.hasRequests = asyncio.Event()
+		return asyncio.ensure_future(self.runBatches())
+	async def runBatches(self) -> None:
+		while True:
+			await self.hasRequests.wait()
+			if self.batchDelay:
+				await asyncio.sleep(self.batchDelay) # let the concurrent requests join
+			requests, self.requests = self.requests[:self.maxBatch], self.requests[self.maxBatch:]
+			if not self.requests:
+				self.hasRequests.clear()
+			for future, response in await asyncio.get_running_loop().run_in_executor(None, self.answerBatch, requests): # the engines run in a thread so that the connections are still read and written meanwhile
+				if not future.done(): # cancelled when its connection is gone
+					future.set_result(response)
+			self.requestCount += len(requests)
+			self.batchCount += 1
+			await asyncio.sleep(0) # let the connections read and write between the batches
+	async def writeResponses(self, writer, responses) -> None: # the responses of a connection leave in the order of its requests
+		while True:
+			future = await responses.get()
+			if future is None:
+				break
+			writer.write((await future + "\n").encode("utf-8"))
+			if responses.empty():
+				await writer.drain()
+		await writer.drain()
+		writer.close()
+	async def handleConnection(self, reader, writer) -> None:
+		self.connectionCount += 1
+		responses = asyncio.Queue()
+		writerTask = asyncio.ensure_future(self.writeResponses(writer, responses))
+		try:
+			while True: # a client may pipeline any count of requests without waiting for the responses
+				line = await reader.readline()
+				if not line:
+					break
+				future = asyncio.get_running_loop().create_future()
+				try:
+					line = line.decode("utf-8").strip() # a line which is not UTF-8 raises UnicodeDecodeError, a ValueError answered like a malformed request
+					if not line:
+						continue
+					kind, args = parseRequest(line)
+					self.requests.append((kind, args, future))
+					self.hasRequests.set()
+				except ValueError as e:
+					future.set_result("error {0}".format(e))
+				await responses.put(future)
+		except ConnectionError:
+			pass
+		finally:
+			await responses.put(None)
+			try:
+				await writerTask
+			except ConnectionError:
+				pass
+
+
+# get input #
+def loadRTree(rTreeFp = rTreeFilepath) -> rangeQuerying.RTreeNode: # parsed and checked once for all the engines
+	rTree = rangeQuerying.getRTree(rTreeFp)
+	if rTree is None:
+		print("Error reading RTree, please check. ")
+		return None
+	rangeQuerying.computeRTreeMBR(rTree)
+	if not isinstance(rTree, rangeQuerying.MappedRTreeNode) and not rangeQuerying.checkRTreeMBR(rTree): # checking a binary RTree would touch every page
+		print("Check RTree MBR failed. Please check your input RTree file. ")
+		return None
+	return rTree
+
+def convertRTree(rTree, module) -> object: # every script recognizes only its own node classes, so the loaded RTree is rebuilt for the other engines where a binary RTree shares its mapping
+	if isinstance(rTree, rangeQuerying.MappedRTreeNode):
+		return module.MappedRTreeNode(rTree.buffer, rTree.offset, MBR = rTree.MBR)
+	if rTree.entries and isinstance(rTree.entries[0], rangeQuerying.RTreeNode):
+		return module.RTreeNode(entries = [convertRTree(entry, module) for entry in rTree.entries], id = rTree.id, MBR = rTree.MBR)
+	return module.RTreeNode(entries = rTree.entries, id = rTree.id, MBR = rTree.MBR)
+
+def loadFMBRs(coordsFp, offsetsFp) -> kNNCoordsSearching.CoordStore:
+	coordsWithID = kNNCoordsSearching.getCoordsWithIDStream(coordsFp)
+	if coordsWithID is None:
+		print("Error reading coords, please check. ")
+		return None
+	coords, ids = coordsWithID
+	offsets = kNNCoordsSearching.getOffsetsStream(offsetsFp)
+	if offsets is None:
+		print("Error reading offsets, please check. ")
+		return None
+	if not kNNCoordsSearching.checkOffsetCoords(ids, [offsets[i:i + 3] for i in range(0, len(offsets), 3)]):
+		return None
+	return kNNCoordsSearching.indexStream(coords, ids, offsets)
+
+def parseRequest(line) -> tuple: # (kind, args) of a request line
+	tmp = line.split()
+	kind = tmp[0].lower()
+	if kind not in _KINDS:
+		raise ValueError("unknown request kind: {0}".format(tmp[0]))
+	try:
+		if kind == "range" and len(tmp) in (5, 6):
+			x_low, y_low, x_high, y_high = (float(item) for item in tmp[1:5])
+			limit = int(tmp[5]) if len(tmp) == 6 else 0
+			if limit >= 0:
+				return kind, ([x_low, x_high, y_low, y_high], limit) # swap to [x_low, x_high, y_low, y_high]
+		elif kind != "range" and len(tmp) == 4:
+			k = int(tmp[1])
+			if k > 0:
+				return kind, (k, [float(tmp[2]), float(tmp[3])])
+	except ValueError:
+		pass
+	raise ValueError("malformed {0} request".format(kind))
+
+
+# main function #
+def preExit(countdownTime = defaultTime) -> None: # we use this function before exiting instead of getch since getch is not OS-independent
+	try:
+		cntTime = int(countdownTime)
+		length = len(str(cntTime))
+	except:
+		return
+	print()
+	while cntTime > 0:
+		print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(cntTime), end = "")
+		try:
+			sleep(1)
+		except:
+			print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(0))
+			return
+		cntTime -= 1
+	print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(cntTime))
+
+def printHelp() -> None:
+	print("Python script for serving range and KNN queries with the RTree loaded once. ", end = "\n\n")
+	print("Option: ")
+	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file (text or binary). ")
+	print("\t[/coords|--coords|coords]: Specify that the following option is the input coord file for the knncoords requests (optional). ")
+	print("\t[/offsets|--offsets|offsets]: Specify that the following option is the input offset file for the knncoords requests (optional). ")
+	print("\t[/host|--host|host]: Specify that the following option is the TCP host to listen on. ")
+	print("\t[/port|--port|port]: Specify that the following option is the TCP port to listen on. ")
+	print("\t[/unix|--unix|unix]: Specify that the following option is the Unix socket path to listen on instead of TCP. ", end = "\n\n")
+	print("Protocol: ")
+	print("\tEach request is a line of \"range x_low y_low x_high y_high [limit]\", \"knn k x y\" or \"knncoords k x y\" where k is positive. ")
+	print("\tEach response is a line of \"ok id_0,id_1,...\" or \"error message\" in the order of the requests of the connection. ")
+	print("\tThe scripts rangeQuerying.py, kNNMBRsSearching.py and kNNCoordsSearching.py act as clients with [/server|--server|server] host:port or unix:path. ", end = "\n\n")
+	print("Format: ")
+	print("\tpython queryServer.py [/rTree|--rTree|rTree] rTreeFilepath [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/host|--host|host] host [/port|--port|port] port [/unix|--unix|unix] unixPath", end = "\n\n")
+	print("Example: ")
+	print("\tpython queryServer.py /rTree Rtree.txt")
+	print("\tpython queryServer.py /rTree Rtree.txt /coords coords.txt /offsets offsets.txt /port 8765")
+	print("\tpython queryServer.py /rTree Rtree.txt /unix /tmp/rtree.sock", end = "\n\n")
+
+def handleCommandline() -> dict:
+	for arg in argv[1:]:
+		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
+			printHelp()
+			return True
+	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11, 13):
+		print("The count of the commandline options is incorrect. Please check your commandline. ")
+		return False
+	dicts = {"rTree":rTreeFilepath, "coords":None, "offsets":None, "host":defaultHost, "port":defaultPort, "unix":None}
+	pointer = None
+	for arg in argv[1:]:
+		if arg.lower() in ("/rtree", "--rtree", "rtree"):
+			pointer = "rTree"
+		elif arg.lower() in ("/coords", "--coords", "coords"):
+			pointer = "coords"
+		elif arg.lower() in ("/offsets", "--offsets", "offsets"):
+			pointer = "offsets"
+		elif arg.lower() in ("/host", "--host", "host"):
+			pointer = "host"
+		elif arg.lower() in ("/port", "--port", "port"):
+			pointer = "port"
+		elif arg.lower() in ("/unix", "--unix", "unix"):
+			pointer = "unix"
+		elif pointer is None:
+			print("Error handling commandline, please check your commandline. ")
+			return False
+		else:
+			dicts[pointer] = arg
+			pointer = None # reset
+	try:
+		dicts["port"] = int(dicts["port"])
+		if not 0 <= dicts["port"] < 65536:
+			raise ValueError
+	except:
+		print("Error regarding port as an integer in [0, 65535]. Please check your commandline. ")
+		return False
+	if (dicts["coords"] is None) != (dicts["offsets"] is None):
+		print("The knncoords requests need both the coord file and the offset file. Please check your commandline. ")
+		return False
+	return dicts
+
+async def serve(queryServer, host = defaultHost, port = defaultPort, unixPath = None) -> None:
+	batcher = await queryServer.start()
+	try:
+		if unixPath:
+			if not hasattr(asyncio, "start_unix_server"):
+				raise OSError("Unix sockets are not supported on this platform")
+			server = await asyncio.start_unix_server(queryServer.handleConnection, path = unixPath)
+		else:
+			server = await asyncio.start_server(queryServer.handleConnection, host = host, port = port)
+		print("Serving on {0}. Press Ctrl+C to stop. ".format(unixPath or ", ".join(str(socket.getsockname()) for socket in server.sockets)))
+		async with server:
+			await server.serve_forever()
+	finally:
+		batcher.cancel()
+
+def main() -> int:
+	# get input #
+	commandlineArgument = handleCommandline()
+	if type(commandlineArgument) == bool:
+		return EXIT_SUCCESS if commandlineArgument else EXIT_FAILURE
+	start_time = time()
+	rangeTree = loadRTree(commandlineArgument["rTree"])
+	if rangeTree is None:
+		preExit()
+		return EXIT_FAILURE
+	kNNTree = convertRTree(rangeTree, kNNMBRsSearching)
+	kNNCoordsTree, fMBRs = None, None
+	if commandlineArgument["coords"]:
+		fMBRs = loadFMBRs(commandlineArgument["coords"], commandlineArgument["offsets"])
+		if fMBRs is None:
+			preExit()
+			return EXIT_FAILURE
+		kNNCoordsTree = convertRTree(rangeTree, kNNCoordsSearching)
+	if rangeQuerying.isNumPyAvailable: # the concurrent range requests are pushed down the PackedRTree together
+		rangeTree = rangeQuerying.PackedRTree(rangeTree)
+	print("Loading time: {0:.3f}s. ".format(time() - start_time))
+
+	# handle requests #
+	queryServer = QueryServer(rangeTree, kNNTree, kNNCoordsTree, fMBRs)
+	try:
+		asyncio.run(serve(queryServer, host = commandlineArgument["host"], port = commandlineArgument["port"], unixPath = commandlineArgument["unix"]))
+	except KeyboardInterrupt:
+		pass
+	except OSError as e:
+		print("Error listening: {0}".format(e))
+		preExit()
+		return EXIT_FAILURE
+	print("Served {0} request(s) in {1} batch(es) over {2} connection(s). ".format(queryServer.requestCount, queryServer.batchCount, queryServer.connectionCount))
+	return EXIT_SUCCESS
+
+
+
+
+
+if __name__ == "__main__":
+	exit(main())
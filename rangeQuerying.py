@@ -1,17 +1,56 @@
 import os
-from sys import argv, exit
+import socket
+from array import array
+import mmap
+from sys import argv, exit, stdout
+from struct import Struct
 from ast import literal_eval
+from itertools import islice
+from collections import OrderedDict
+from multiprocessing import Pool, get_all_start_methods, get_context
 from time import sleep, time
+try:
+	import numpy as np
+	isNumPyAvailable = True
+except:
+	isNumPyAvailable = False
 try:
 	os.chdir(os.path.abspath(os.path.dirname(__file__))) # cd into the location path of this script
 except: # it does not work in Jupyter-notebook
 	pass
 EXIT_SUCCESS = 0
 EXIT_FAILURE = 1
+_MODES = ("list", "count", "aggregate") # the polygon ids, their count or their count, sum, min, max and extent
+defaultMode = "list"
+_ENGINES = ("single", "batch", "stream") # one traversal per window, all the windows pushed down the PackedRTree together or one traversal per window streamed into the output
+defaultEngine = "single"
+defaultBatchSize = 1024
+defaultLimit = 0 # the maximum count of polygon ids per window where 0 means no limit
+defaultStreamChunkSize = 4096 # polygon ids written at a time by the stream engine
+defaultWorkers = 1 # the count of the querying processes
+defaultShardSize = 1024 # the maximum count of windows sent to a worker at a time
+defaultCacheBudget = 0 # the memory budget of the range cache in MiB where 0 disables the cache
+_CACHE_ENTRY_BYTES = 96 # the estimated cost of a cached window besides its candidates
+_CACHE_CANDIDATE_BYTES = 40 # the estimated cost of a cached candidate, its polygon id and its MBR
+defaultStorage = "nodes"
+_STORAGES = ("nodes", "packed") # RTreeNode objects or the struct-of-arrays PackedRTree
+_ORDERS = ("input", "morton", "hilbert") # the order the queries are answered in, where the output always keeps the input order
+defaultOrder = "input"
+_CURVE_BITS = 16 # the grid resolution per axis of the space-filling curves
 defaultTime = 5
 rTreeFilepath = "Rtree.txt"
+_RTREE_MAGIC = b"RTREEMBR"
+_RTREE_VERSION = 1
+_HEADER_STRUCT = Struct("<8sIQ4d") # magic, version, root offset, root MBR
+_NODE_STRUCT = Struct("<BqI") # non-leaf flag, node id, entry count
+_ENTRY_STRUCT = Struct("<q4d") # child offset (polygon id in a leaf node), [x_low, x_high, y_low, y_high]
 rQueriesFilepath = "Rqueries.txt"
+coordsFilepath = "coords.txt"
+offsetsFilepath = "offsets.txt"
+defaultChunkSize = 1 << 20
 rangeResultsFilepath = "rangeResults.txt"
+_workerRTree = None # the RTree of a worker process, inherited by forking or loaded once by initWorker
+_workerMatrices = None # the node matrices of the batch engine, built once per worker
 
 
 # class #
@@ -20,12 +59,212 @@ class RTreeNode:
 		self.entries = entries
 		self.id = id
 		self.MBR = MBR
+		self.aggregate = None # [count, sum, min, max] of the polygons under the node
 	def __str__(self) -> str:
 		if isinstance(self.entries[0], RTreeNode):
 			return str([1, self.id, [[entry.id, entry.MBR] for entry in self.entries]])
 		else:
 			return str([0, self.id, self.entries])
 
+class MappedRTreeNode(RTreeNode): # decoded from the memory-mapped binary RTree only when it is touched
+	def __init__(self, buffer, offset, MBR = None):
+		self.buffer = buffer
+		self.offset = offset
+		self.MBR = MBR
+		self.aggregate = None
+		self._id = None
+		self._entries = None
+	@property
+	def id(self) -> int:
+		if self._id is None:
+			self._id = _NODE_STRUCT.unpack_from(self.buffer, self.offset)[1]
+		return self._id
+	@id.setter
+	def id(self, value) -> None:
+		self._id = value
+	@property
+	def entries(self) -> list:
+		if self._entries is None:
+			isNonLeaf, self._id, count = _NODE_STRUCT.unpack_from(self.buffer, self.offset)
+			start = self.offset + _NODE_STRUCT.size
+			self._entries = [																\
+				MappedRTreeNode(self.buffer, child, MBR = [x_low, x_high, y_low, y_high]) if isNonLeaf else [child, [x_low, x_high, y_low, y_high]] 	\
+				for child, x_low, x_high, y_low, y_high in _ENTRY_STRUCT.iter_unpack(memoryview(self.buffer)[start:start + count * _ENTRY_STRUCT.size])	\
+			]
+		return self._entries
+	@entries.setter
+	def entries(self, value) -> None:
+		self._entries = value
+
+
+class PackedRTree: # struct-of-arrays storage where node i owns the slots [starts[i], starts[i] + counts[i]) of the column arrays
+	def __init__(self, rTree):
+		self.x_lows, self.x_highs, self.y_lows, self.y_highs = array("d"), array("d"), array("d"), array("d")
+		self.children = array("q") # the index of the child node in a non-leaf node or the polygon id in a leaf node
+		self.starts, self.counts, self.ids, self.isLeaf = array("q"), array("q"), array("q"), array("b")
+		self.MBR = rTree.MBR
+		nodes = [rTree]
+		for node in nodes: # breadth-first so that node 0 is the root and the leaf nodes come in leaf order
+			isLeaf = not isinstance(node.entries[0], RTreeNode)
+			self.starts.append(len(self.children))
+			self.counts.append(len(node.entries))
+			self.ids.append(node.id)
+			self.isLeaf.append(isLeaf)
+			for entry in node.entries:
+				x_low, x_high, y_low, y_high = entry[1] if isLeaf else entry.MBR
+				self.x_lows.append(x_low)
+				self.x_highs.append(x_high)
+				self.y_lows.append(y_low)
+				self.y_highs.append(y_high)
+				if isLeaf:
+					self.children.append(entry[0])
+				else:
+					self.children.append(len(nodes))
+					nodes.append(entry)
+		self.leafIds = array("q") # the polygon ids in depth-first order so that the subtree of node i owns the span [spanStarts[i], spanStops[i])
+		self.spanStarts, self.spanStops = array("q", bytes(8 * len(self.starts))), array("q", bytes(8 * len(self.starts)))
+		stack = [0]
+		while stack:
+			node = stack.pop()
+			start, stop = self.starts[node], self.starts[node] + self.counts[node]
+			if self.isLeaf[node]:
+				self.spanStarts[node] = len(self.leafIds)
+				self.leafIds.extend(self.children[start:stop])
+				self.spanStops[node] = len(self.leafIds)
+			else:
+				stack.extend(reversed(self.children[start:stop]))
+		for node in reversed(range(len(self.starts))): # the children come after their parents in the breadth-first order
+			if not self.isLeaf[node]:
+				self.spanStarts[node] = self.spanStarts[self.children[self.starts[node]]]
+				self.spanStops[node] = self.spanStops[self.children[self.starts[node] + self.counts[node] - 1]]
+	def getMBR(self, slot) -> list:
+		return [self.x_lows[slot], self.x_highs[slot], self.y_lows[slot], self.y_highs[slot]]
+	def iterFundamentalMBRs(self) -> list: # yield [polygon_id, [x_low, x_high, y_low, y_high]] in leaf order
+		for node in range(len(self.starts)):
+			if self.isLeaf[node]:
+				for slot in range(self.starts[node], self.starts[node] + self.counts[node]):
+					yield [self.children[slot], self.getMBR(slot)]
+
+class PolygonStore: # the outlines for refining where the polygon in row i owns the coords [starts[i], stops[i]) and the closing edge goes back to starts[i]
+	def __init__(self, coords, offsets): # the typed arrays from getCoordsStream and getOffsetsStream
+		if isNumPyAvailable:
+			self.coords = np.frombuffer(coords, dtype = np.float64).reshape(-1, 2)
+			offsets_array = np.frombuffer(offsets, dtype = np.int64).reshape(-1, 3)
+			self.starts, self.stops = offsets_array[:, 1].copy(), offsets_array[:, 2] + 1
+			self.sortedIds = np.sort(offsets_array[:, 0])
+			self.sortedRows = np.argsort(offsets_array[:, 0], kind = "stable")
+			bounds = np.stack([self.starts, self.stops], axis = 1).ravel() # reducing over the [start, stop) pairs keeps every polygon to its own slice in any order of the offsets
+			xs, ys = np.append(self.coords[:, 0], 0), np.append(self.coords[:, 1], 0) # a stop at the end of the coords stays a valid index
+			self.MBRs = np.stack([np.minimum.reduceat(xs, bounds)[0::2], np.maximum.reduceat(xs, bounds)[0::2], np.minimum.reduceat(ys, bounds)[0::2], np.maximum.reduceat(ys, bounds)[0::2]], axis = 1) if len(self.starts) else np.zeros((0, 4))
+		else:
+			self.rows = {polygon_id:row for row, polygon_id in enumerate(offsets[0::3])} # the sorted ids take its place with NumPy
+			self.coords = [coords[i:i + 2].tolist() for i in range(0, len(coords), 2)]
+			self.starts, self.stops = offsets[1::3].tolist(), [end + 1 for end in offsets[2::3]]
+			self.MBRs = [computeNodeMBR([[x, x, y, y] for x, y in self.coords[start:stop]]) for start, stop in zip(self.starts, self.stops)]
+	def getRows(self, polygon_ids) -> list: # the row of every polygon id where -1 marks a polygon missing from the offsets
+		if not isNumPyAvailable:
+			return [self.rows.get(polygon_id, -1) for polygon_id in polygon_ids]
+		polygon_ids = np.asarray(polygon_ids, dtype = np.int64)
+		positions = np.minimum(np.searchsorted(self.sortedIds, polygon_ids), max(len(self.sortedIds) - 1, 0))
+		return np.where(self.sortedIds[positions] == polygon_ids, self.sortedRows[positions], -1) if len(self.sortedIds) else np.full(len(polygon_ids), -1)
+
+class RangeCache: # LRU cache of the unlimited range results where a window inside a cached window is answered by filtering the cached candidates
+	def __init__(self, rTree, budget = defaultCacheBudget):
+		self.rTree = rTree
+		self.budget = budget # bytes
+		self.entries = OrderedDict() # (x_low, x_high, y_low, y_high) -> (polygon_ids, MBRs, slot) from the least to the most recently used
+		self.size = 0
+		self.leafMBRs = None # polygon id -> MBR or, with NumPy, the sorted polygon ids and their MBRs, collected on the first insertion
+		self.leafBytes = 0 # the estimated cost of leafMBRs, which takes its share of the budget
+		self.hits, self.containedHits, self.misses, self.evictions = 0, 0, 0, 0
+		if isNumPyAvailable: # the cached windows by slot so that the containing windows are found in one pass
+			self.windows, self.lastUsed = np.zeros((64, 4)), np.full(64, -1, dtype = np.int64) # -1 marks a free slot
+			self.keys, self.freeSlots, self.clock = [None] * 64, list(range(63, -1, -1)), 0
+	def touch(self, key) -> None:
+		self.entries.move_to_end(key)
+		if isNumPyAvailable:
+			self.clock += 1
+			self.lastUsed[self.entries[key][2]] = self.clock
+	def findContaining(self, W) -> tuple: # the most recently used cached window containing W, the likeliest one being zoomed into
+		if not isNumPyAvailable:
+			for window in reversed(self.entries):
+				if isContained(W, window):
+					return window
+			return None
+		isContaining = (self.windows[:, 0] <= W[0]) & (W[1] <= self.windows[:, 1]) & (self.windows[:, 2] <= W[2]) & (W[3] <= self.windows[:, 3])
+		lastUsed = np.where(isContaining, self.lastUsed, -1)
+		slot = int(lastUsed.argmax())
+		return self.keys[slot] if lastUsed[slot] >= 0 else None
+	def get(self, W) -> list: # a new list of the polygon ids overlapping W or None on a miss
+		key = tuple(W)
+		if key in self.entries:
+			self.touch(key)
+			self.hits += 1
+			return self.entries[key][0].tolist() if isNumPyAvailable else list(self.entries[key][0])
+		window = self.findContaining(W) if self.entries else None
+		if window is None:
+			self.misses += 1
+			return None
+		self.touch(window)
+		polygon_ids, MBRs, _ = self.entries[window] # every polygon overlapping W overlaps the cached window, so filtering keeps the depth-first order
+		if isNumPyAvailable:
+			isKept = (MBRs[:, 0] <= W[1]) & (MBRs[:, 1] >= W[0]) & (MBRs[:, 2] <= W[3]) & (MBRs[:, 3] >= W[2])
+			polygon_ids, MBRs = polygon_ids[isKept], MBRs[isKept]
+			result = polygon_ids.tolist()
+		else:
+			isKept = [isOverlap(MBR, W) for MBR in MBRs]
+			polygon_ids, MBRs = [polygon_id for polygon_id, kept in zip(polygon_ids, isKept) if kept], [MBR for MBR, kept in zip(MBRs, isKept) if kept]
+			result = list(polygon_ids)
+		self.containedHits += 1
+		self.put(W, polygon_ids, MBRs)
+		return result
+	def put(self, W, polygon_ids, MBRs = None) -> bool: # the MBRs of the polygons are looked up unless given
+		key, size = tuple(W), _CACHE_ENTRY_BYTES + _CACHE_CANDIDATE_BYTES * len(polygon_ids)
+		if key in self.entries:
+			return False
+		if MBRs is None and self.leafMBRs is None and not self.leafBytes:
+			leafMBRs = getLeafMBRs(self.rTree)
+			self.leafBytes = _CACHE_CANDIDATE_BYTES * len(leafMBRs)
+			if self.leafBytes <= self.budget: # otherwise it is dropped and nothing is ever cached
+				if isNumPyAvailable:
+					leafIds = np.fromiter(leafMBRs.keys(), dtype = np.int64, count = len(leafMBRs))
+					order = np.argsort(leafIds)
+					leafMBRs = (leafIds[order], np.asarray(list(leafMBRs.values()), dtype = np.float64).reshape(-1, 4)[order])
+				self.leafMBRs = leafMBRs
+				self.size += self.leafBytes
+		if size + self.leafBytes > self.budget:
+			return False
+		if MBRs is None:
+			if isNumPyAvailable:
+				polygon_ids = np.asarray(polygon_ids, dtype = np.int64)
+				MBRs = self.leafMBRs[1][np.searchsorted(self.leafMBRs[0], polygon_ids)]
+			else:
+				MBRs = [self.leafMBRs[polygon_id] for polygon_id in polygon_ids]
+		if isNumPyAvailable:
+			if not self.freeSlots: # double the slots
+				capacity = len(self.keys)
+				self.windows = np.concatenate([self.windows, np.zeros((capacity, 4))])
+				self.lastUsed = np.concatenate([self.lastUsed, np.full(capacity, -1, dtype = np.int64)])
+				self.keys.extend([None] * capacity)
+				self.freeSlots.extend(range(2 * capacity - 1, capacity - 1, -1))
+			slot = self.freeSlots.pop()
+			self.windows[slot], self.keys[slot] = key, key
+			self.entries[key] = (polygon_ids, MBRs, slot)
+		else:
+			self.entries[key] = (list(polygon_ids), MBRs, None)
+		self.touch(key)
+		self.size += size
+		while self.size > self.budget: # evict the least recently used windows
+			window, (evicted_ids, _, slot) = self.entries.popitem(last = False)
+			if isNumPyAvailable:
+				self.lastUsed[slot], self.keys[slot] = -1, None
+				self.freeSlots.append(slot)
+			self.size -= _CACHE_ENTRY_BYTES + _CACHE_CANDIDATE_BYTES * len(evicted_ids)
+			self.evictions += 1
+		return True
+	def getStatistics(self) -> str:
+		return "{0} exact hit(s), {1} contained hit(s), {2} miss(es), {3} eviction(s), {4} window(s) in {5} of {6} byte(s)".format(self.hits, self.containedHits, self.misses, self.evictions, len(self.entries), self.size, self.budget)
+
 
 # get input #
 def getTxt(filepath, index = 0) -> str: # get .txt content
@@ -42,7 +281,100 @@ def getTxt(filepath, index = 0) -> str: # get .txt content
 	else:
 		return None # out of range
 
+def iterLines(filepath, chunkSize = defaultChunkSize) -> bytes: # yield the non-empty lines of a file read in fixed-size byte chunks
+	with open(filepath, "rb") as f:
+		chunk = f.read(chunkSize)
+		if chunk.startswith((b"\xff\xfe", b"\xfe\xff")): # UTF-16 cannot be split byte-wise
+			content = getTxt(filepath)
+			for line in (content or "").replace("\r", "\n").split("\n"):
+				if line:
+					yield line.encode("utf-8")
+			return
+		if chunk.startswith(b"\xef\xbb\xbf"): # if utf-8 with BOM, remove BOM
+			chunk = chunk[3:]
+		remainder = b""
+		while True:
+			lines = (remainder + chunk).replace(b"\r", b"\n").split(b"\n")
+			remainder = lines.pop() # the last line may continue in the next chunk
+			for line in lines:
+				if line: # filtering empty lines
+					yield line
+			chunk = f.read(chunkSize)
+			if not chunk:
+				break
+		if remainder:
+			yield remainder
+
+def getCoordsStream(coordsFp = coordsFilepath, chunkSize = defaultChunkSize) -> array: # [x_0, y_0, x_1, y_1, ...]
+	coords = array("d")
+	try:
+		for cnt, line in enumerate(iterLines(coordsFp, chunkSize)):
+			if line.count(b",") == 1:
+				tmp = line.split(b",")
+				try:
+					coords.extend((float(tmp[0]), float(tmp[1])))
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 1. ".format(cnt))
+	except OSError:
+		return None
+	return coords
+
+def getOffsetsStream(offsetsFp = offsetsFilepath, chunkSize = defaultChunkSize) -> array: # [polygon_id_0, start_offset_0, end_offset_0, ...]
+	offsets = array("q")
+	try:
+		for cnt, line in enumerate(iterLines(offsetsFp, chunkSize)):
+			if line.count(b",") == 2:
+				tmp = line.split(b",")
+				try:
+					offsets.extend((int(tmp[0]), int(tmp[1]), int(tmp[2])))
+				except:
+					print("Line {0} has been skipped since converting error occured. ".format(cnt))
+			else:
+				print("Line {0} has been skipped since the count of comma(s) is not 2. ".format(cnt))
+	except OSError:
+		return None
+	return offsets
+
+def checkOffsetCoords(coords, offsets) -> bool:
+	if len(offsets):
+		for i in range(len(offsets) - 1):
+			if offsets[i + 1][1] - offsets[i][2] != 1:
+				print("Uncovered coords are detected: From {0} to {1}. ".format(offsets[i][2], offsets[i + 1][1]))
+				return False
+	else:
+		return False
+	if offsets[0][1] != 0:
+		print("The offsets do not cover the coords as offsets begin at {0} while coords begin at 0. ".format(offsets[0][1]))
+		return False
+	if offsets[-1][-1] != len(coords) - 1:
+		print("The offsets do not cover the coords as offsets end at {0} while coords end at {1}. ".format(offsets[-1][-1], len(coords) - 1))
+		return False
+	return True
+
+def isBinaryRTree(rTreeFp = rTreeFilepath) -> bool:
+	try:
+		with open(rTreeFp, "rb") as f:
+			return f.read(len(_RTREE_MAGIC)) == _RTREE_MAGIC
+	except:
+		return False
+
+def getBinaryRTree(rTreeFp = rTreeFilepath) -> MappedRTreeNode:
+	try:
+		with open(rTreeFp, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+		magic, version, rootOffset, x_low, x_high, y_low, y_high = _HEADER_STRUCT.unpack_from(buffer, 0)
+		if version != _RTREE_VERSION:
+			print("Unsupported binary RTree version: {0}".format(version))
+			return None
+		return MappedRTreeNode(buffer, rootOffset, MBR = [x_low, x_high, y_low, y_high])
+	except:
+		return None
+
 def getRTree(rTreeFp = rTreeFilepath) -> list:
+	if isBinaryRTree(rTreeFp):
+		return getBinaryRTree(rTreeFp)
 	content = getTxt(rTreeFp)
 	if content is None:
 		return None
@@ -58,6 +390,8 @@ def getRTree(rTreeFp = rTreeFilepath) -> list:
 					print("Repeated entry: id = {0}".format(lists[1]))
 				else:
 					rTreeDict[lists[1]] = RTreeNode(entries = lists[2], id = lists[1])
+					if len(lists) > 3: # the stored aggregate
+						rTreeDict[lists[1]].aggregate = lists[3]
 					if lists[0]: # if it is a non-leaf node
 						for entry_idx, element in enumerate(lists[2]):
 							if element[0] in rTreeDict:
@@ -121,36 +455,383 @@ def computeRTreeMBR(rTree) -> None:
 	else:
 		rTree.MBR = computeNodeMBR([entry[1] for entry in rTree.entries])
 
+def computeRTreeAggregate(rTree) -> list: # [count, sum, min, max] where sum, min and max stay None if no polygon under the node has a value
+	if rTree.aggregate is not None: # stored in the text RTree
+		return rTree.aggregate
+	if rTree.entries and isinstance(rTree.entries[0], RTreeNode):
+		aggregates = [computeRTreeAggregate(entry) for entry in rTree.entries]
+	else:
+		aggregates = [[1, entry[2], entry[2], entry[2]] if len(entry) > 2 else [1, None, None, None] for entry in rTree.entries]
+	values = [aggregate for aggregate in aggregates if aggregate[1] is not None]
+	rTree.aggregate = [																	\
+		sum(aggregate[0] for aggregate in aggregates), 														\
+		sum(aggregate[1] for aggregate in values) if values else None, 												\
+		min(aggregate[2] for aggregate in values) if values else None, 												\
+		max(aggregate[3] for aggregate in values) if values else None													\
+	]
+	return rTree.aggregate
+
 
 # handle querying #
+def getMortonKey(x, y) -> int: # interleave the bits of the grid cell
+	key = 0
+	for bit in range(_CURVE_BITS):
+		key |= ((x >> bit) & 1) << (2 * bit) | ((y >> bit) & 1) << (2 * bit + 1)
+	return key
+
+def getHilbertKey(x, y) -> int: # the distance of the grid cell along the Hilbert curve
+	key, side = 0, 1 << (_CURVE_BITS - 1)
+	while side:
+		rx, ry = int(x & side > 0), int(y & side > 0)
+		key += side * side * ((3 * rx) ^ ry)
+		if not ry: # rotate the quadrant
+			if rx:
+				x, y = (1 << _CURVE_BITS) - 1 - x, (1 << _CURVE_BITS) - 1 - y
+			x, y = y, x
+		side >>= 1
+	return key
+
+def getQueryOrder(centres, order = defaultOrder) -> list: # the query indexes sorted by the curve key of their centres so that consecutive queries touch nearby nodes
+	if order == "input" or not centres:
+		return list(range(len(centres)))
+	x_low, x_high = min(centre[0] for centre in centres), max(centre[0] for centre in centres)
+	y_low, y_high = min(centre[1] for centre in centres), max(centre[1] for centre in centres)
+	scale = (1 << _CURVE_BITS) - 1
+	getKey = getHilbertKey if order == "hilbert" else getMortonKey
+	keys = [getKey(int((x - x_low) / (x_high - x_low) * scale) if x_high > x_low else 0, int((y - y_low) / (y_high - y_low) * scale) if y_high > y_low else 0) for x, y in centres]
+	return sorted(range(len(centres)), key = keys.__getitem__)
+
+def restoreOrder(results, permutation) -> list: # put the results answered in the permuted order back into the input order
+	restored = [None] * len(results)
+	for i, result in zip(permutation, results):
+		restored[i] = result
+	return restored
+
 def isOverlap(rect1, rect2) -> bool: # [x_low, x_high, y_low, y_high]
 	return rect1[0] <= rect2[1] and rect1[1] >= rect2[0] and rect1[2] <= rect2[3] and rect1[3] >= rect2[2]
 
-def rQuerying(rTree, W, init_list = []) -> None:
-	if isinstance(rTree, RTreeNode):
-		if isOverlap(rTree.MBR, W):
-			for entry in rTree.entries:
-				rQuerying(entry, W, init_list)
+def isContained(rect1, rect2) -> bool: # whether rect1 lies inside rect2
+	return rect2[0] <= rect1[0] and rect1[1] <= rect2[1] and rect2[2] <= rect1[2] and rect1[3] <= rect2[3]
+
+def iterSubtree(rTree) -> int: # yield every polygon id under the node without any test
+	stack = [rTree]
+	while stack:
+		node = stack.pop()
+		if node.entries and isinstance(node.entries[0], RTreeNode):
+			stack.extend(reversed(node.entries))
+		else:
+			for entry in node.entries:
+				yield entry[0]
+
+def iterRQuerying(rTree, W) -> int: # yield the polygon ids overlapping W in the order of the depth-first traversal with an explicit stack
+	if isinstance(rTree, PackedRTree):
+		stack = [~0 if isContained(rTree.MBR, W) else 0] if isOverlap(rTree.MBR, W) else [] # ~node marks a node fully contained in W
+		while stack:
+			node = stack.pop()
+			if node < 0: # the whole span at once
+				yield from rTree.leafIds[rTree.spanStarts[~node]:rTree.spanStops[~node]]
+				continue
+			start, stop = rTree.starts[node], rTree.starts[node] + rTree.counts[node]
+			if rTree.isLeaf[node]:
+				for slot in range(start, stop):
+					if rTree.x_lows[slot] <= W[1] and rTree.x_highs[slot] >= W[0] and rTree.y_lows[slot] <= W[3] and rTree.y_highs[slot] >= W[2]:
+						yield rTree.children[slot]
+			else:
+				for slot in range(stop - 1, start - 1, -1): # reversed so that the first child is popped first
+					if rTree.x_lows[slot] <= W[1] and rTree.x_highs[slot] >= W[0] and rTree.y_lows[slot] <= W[3] and rTree.y_highs[slot] >= W[2]:
+						if W[0] <= rTree.x_lows[slot] and rTree.x_highs[slot] <= W[1] and W[2] <= rTree.y_lows[slot] and rTree.y_highs[slot] <= W[3]:
+							stack.append(~rTree.children[slot])
+						else:
+							stack.append(rTree.children[slot])
 	else:
-		if isOverlap(rTree[1], W):
-			init_list.append(rTree[0])
+		stack = [rTree] if isOverlap(rTree.MBR, W) else []
+		while stack:
+			node = stack.pop()
+			if isContained(node.MBR, W):
+				yield from iterSubtree(node)
+			elif node.entries and isinstance(node.entries[0], RTreeNode):
+				stack.extend(entry for entry in reversed(node.entries) if isOverlap(entry.MBR, W))
+			else:
+				for entry in node.entries:
+					if isOverlap(entry[1], W):
+						yield entry[0]
+
+def mergeAggregate(result, aggregate, MBR) -> None: # fold [count, sum, min, max] and the MBR into result = [count, sum, min, max, extent]
+	result[0] += aggregate[0]
+	if aggregate[1] is not None:
+		result[1] = aggregate[1] if result[1] is None else result[1] + aggregate[1]
+		result[2] = aggregate[2] if result[2] is None else min(result[2], aggregate[2])
+		result[3] = aggregate[3] if result[3] is None else max(result[3], aggregate[3])
+	result[4] = list(MBR) if result[4] is None else [min(result[4][0], MBR[0]), max(result[4][1], MBR[1]), min(result[4][2], MBR[2]), max(result[4][3], MBR[3])]
 
-def doRangeQuerying(rTree, rectangles) -> list:
+def aggregateRQuerying(rTree, W) -> list: # [count, sum, min, max, extent] of the polygons overlapping W where a fully contained node is answered by its aggregate
+	result = [0, None, None, None, None]
+	stack = [rTree] if rTree.entries and isOverlap(rTree.MBR, W) else []
+	while stack:
+		node = stack.pop()
+		if isContained(node.MBR, W):
+			mergeAggregate(result, node.aggregate, node.MBR)
+		elif isinstance(node.entries[0], RTreeNode):
+			stack.extend(entry for entry in node.entries if isOverlap(entry.MBR, W))
+		else: # fold the hits of the leaf node at once
+			hits = [entry for entry in node.entries if isOverlap(entry[1], W)]
+			if hits:
+				values = [entry[2] for entry in hits if len(entry) > 2]
+				mergeAggregate(result, [len(hits), sum(values), min(values), max(values)] if values else [len(hits), None, None, None], computeNodeMBR([entry[1] for entry in hits]))
+	return result
+
+def countRQuerying(rTree, W) -> int: # the count of the polygons overlapping W where a fully contained node is answered by its count
+	count = 0
+	stack = [rTree] if rTree.entries and isOverlap(rTree.MBR, W) else []
+	while stack:
+		node = stack.pop()
+		if isContained(node.MBR, W):
+			count += node.aggregate[0]
+		elif isinstance(node.entries[0], RTreeNode):
+			stack.extend(entry for entry in node.entries if isOverlap(entry.MBR, W))
+		else:
+			count += sum(1 for entry in node.entries if isOverlap(entry[1], W))
+	return count
+
+def doRangeAggregating(rTree, rectangles, mode = "aggregate") -> list:
+	return [[W, countRQuerying(rTree, W) if mode == "count" else aggregateRQuerying(rTree, W)] for W in rectangles]
+
+def rQuerying(rTree, W, init_list = None, limit = defaultLimit) -> list:
+	if init_list is None:
+		init_list = []
+	init_list.extend(islice(iterRQuerying(rTree, W), limit or None))
+	return init_list
+
+def getNodeMatrices(rTree) -> tuple: # the column arrays reshaped into a row per node, padded with MBRs that never overlap
+	children, starts, counts = (np.frombuffer(column, dtype = np.int64) for column in (rTree.children, rTree.starts, rTree.counts))
+	isLeaf = np.frombuffer(rTree.isLeaf, dtype = np.int8).astype(bool)
+	rows, cols = np.repeat(np.arange(len(counts)), counts), np.arange(len(children)) - np.repeat(starts, counts)
+	span_starts = np.where(isLeaf[rows], np.frombuffer(rTree.spanStarts, dtype = np.int64)[rows] + cols, np.frombuffer(rTree.spanStarts, dtype = np.int64)[np.where(isLeaf[rows], 0, children)]) # an entry in a leaf node spans its own position
+	span_stops = np.where(isLeaf[rows], span_starts + 1, np.frombuffer(rTree.spanStops, dtype = np.int64)[np.where(isLeaf[rows], 0, children)])
+	matrices = []
+	for column, padding in ((rTree.x_lows, np.inf), (rTree.x_highs, -np.inf), (rTree.y_lows, np.inf), (rTree.y_highs, -np.inf), (children, -1), (span_starts, 0), (span_stops, 0)):
+		matrix = np.full((len(counts), int(counts.max())), padding, dtype = np.float64 if isinstance(column, array) else np.int64)
+		matrix[rows, cols] = np.frombuffer(column, dtype = np.float64) if isinstance(column, array) else column
+		matrices.append(matrix)
+	return tuple(matrices) + (isLeaf, )
+
+def rQueryingBatch(matrices, windows) -> tuple: # push all the windows down the PackedRTree together, one level per step, and return the (window, leaf-order position) hits
+	x_lows, x_highs, y_lows, y_highs, children, span_starts, span_stops, isLeaf = matrices
+	window_ids, nodes = np.arange(len(windows)), np.zeros(len(windows), dtype = np.int64) # the active (window, node) pairs
+	hit_windows, hit_starts, hit_stops = [], [], []
+	while len(nodes):
+		W = windows[window_ids]
+		overlaps = (x_lows[nodes] <= W[:, 1:2]) & (x_highs[nodes] >= W[:, 0:1]) & (y_lows[nodes] <= W[:, 3:4]) & (y_highs[nodes] >= W[:, 2:3]) # a row per pair and a column per child
+		pairs, cols = np.nonzero(overlaps)
+		window_ids, nodes = window_ids[pairs], nodes[pairs]
+		isDone = isLeaf[nodes] # leaf entries and fully contained children are emitted as spans
+		inners = np.flatnonzero(~isDone)
+		W, inner_nodes, inner_cols = windows[window_ids[inners]], nodes[inners], cols[inners]
+		isDone[inners] = (W[:, 0] <= x_lows[inner_nodes, inner_cols]) & (x_highs[inner_nodes, inner_cols] <= W[:, 1]) & (W[:, 2] <= y_lows[inner_nodes, inner_cols]) & (y_highs[inner_nodes, inner_cols] <= W[:, 3])
+		hit_windows.append(window_ids[isDone])
+		hit_starts.append(span_starts[nodes[isDone], cols[isDone]])
+		hit_stops.append(span_stops[nodes[isDone], cols[isDone]])
+		window_ids, nodes = window_ids[~isDone], children[nodes[~isDone], cols[~isDone]]
+	lengths = np.concatenate(hit_stops) - np.concatenate(hit_starts)
+	positions = np.arange(lengths.sum()) + np.repeat(np.concatenate(hit_starts) - (np.cumsum(lengths) - lengths), lengths)
+	return np.repeat(np.concatenate(hit_windows), lengths), positions
+
+def doRangeQueryingBatch(rTree, rectangles, batchSize = defaultBatchSize, limit = defaultLimit, matrices = None) -> list: # sorting the hits by their leaf-order positions gives every window the same order as the single traversal
+	if matrices is None:
+		matrices = getNodeMatrices(rTree)
+	leafIds = np.frombuffer(rTree.leafIds, dtype = np.int64)
+	rangeResults = []
+	for i in range(0, len(rectangles), batchSize): # bounded batches keep the (window, node) pairs small enough for the cache
+		windows = np.asarray(rectangles[i:i + batchSize], dtype = np.float64).reshape(-1, 4)
+		window_ids, positions = rQueryingBatch(matrices, windows)
+		keys = np.sort(window_ids * len(leafIds) + positions)
+		polygon_ids = leafIds[keys % len(leafIds)].tolist()
+		stops = np.cumsum(np.bincount(keys // len(leafIds), minlength = len(windows))).tolist()
+		rangeResults.extend([W, polygon_ids[start:min(stop, start + limit) if limit else stop]] for W, start, stop in zip(rectangles[i:i + batchSize], [0] + stops, stops))
+	return rangeResults
+
+def doRangeQuerying(rTree, rectangles, engine = "single", limit = defaultLimit) -> list:
+	if engine == "batch":
+		return doRangeQueryingBatch(rTree if isinstance(rTree, PackedRTree) else PackedRTree(rTree), rectangles, limit = limit)
 	rangeResults = []
 	for W in rectangles:
-		init_list = []
-		rQuerying(rTree, W, init_list)
-		rangeResults.append([W, init_list])
+		rangeResults.append([W, rQuerying(rTree, W, limit = limit)])
+	return rangeResults
+
+def setWorkerRTree(rTree, engine = "single") -> None:
+	global _workerRTree, _workerMatrices
+	_workerRTree = rTree
+	_workerMatrices = getNodeMatrices(rTree) if engine == "batch" else None
+
+def initWorker(rTreeFp, storage, engine, mode) -> None: # load the RTree once in a worker which cannot inherit it by forking
+	rTree = getRTree(rTreeFp)
+	computeRTreeMBR(rTree)
+	if mode != "list":
+		computeRTreeAggregate(rTree)
+	elif storage == "packed" or engine == "batch":
+		rTree = PackedRTree(rTree)
+	setWorkerRTree(rTree, engine)
+
+def queryShard(shard) -> list: # answer a chunk of windows in a worker
+	windows, engine, limit, mode = shard
+	if mode != "list":
+		return doRangeAggregating(_workerRTree, windows, mode = mode)
+	if engine == "batch":
+		return doRangeQueryingBatch(_workerRTree, windows, limit = limit, matrices = _workerMatrices)
+	return doRangeQuerying(_workerRTree, windows, engine = engine, limit = limit)
+
+def doRangeQueryingParallel(rTree, rectangles, workers = defaultWorkers, rTreeFp = rTreeFilepath, storage = defaultStorage, engine = "single", limit = defaultLimit, mode = defaultMode) -> list: # the chunks are answered by a pool of processes and merged back in their original order
+	chunkSize = max(1, min(defaultShardSize, -(-len(rectangles) // (workers * 4)))) # several chunks per worker even out the load
+	shards = [(rectangles[i:i + chunkSize], engine, limit, mode) for i in range(0, len(rectangles), chunkSize)]
+	if "fork" in get_all_start_methods(): # the forked workers share the pages of the parsed RTree, where the column arrays of the PackedRTree are never written
+		setWorkerRTree(rTree, engine)
+		pool = get_context("fork").Pool(workers)
+	else:
+		pool = Pool(workers, initializer = initWorker, initargs = (rTreeFp, storage, engine, mode))
+	with pool:
+		return [result for results in pool.imap(queryShard, shards) for result in results]
+
+def getLeafMBRs(rTree) -> dict: # polygon id -> [x_low, x_high, y_low, y_high]
+	if isinstance(rTree, PackedRTree):
+		return {polygon_id:MBR for polygon_id, MBR in rTree.iterFundamentalMBRs()}
+	leafMBRs, stack = {}, [rTree]
+	while stack:
+		node = stack.pop()
+		if node.entries and isinstance(node.entries[0], RTreeNode):
+			stack.extend(node.entries)
+		else:
+			for entry in node.entries:
+				leafMBRs[entry[0]] = entry[1]
+	return leafMBRs
+
+def doRangeQueryingCached(rTree, rectangles, cache, engine = "single", limit = defaultLimit) -> list: # the misses are answered by the engine a batch at a time and the unlimited results are cached
+	rangeResults, step = [], defaultBatchSize if engine == "batch" else 1
+	for i in range(0, len(rectangles), step):
+		windows = rectangles[i:i + step]
+		results = [cache.get(W) for W in windows]
+		misses = {tuple(W):W for W, result in zip(windows, results) if result is None} # a window repeated inside a batch is queried once
+		for key, (W, result) in zip(list(misses), doRangeQuerying(rTree, list(misses.values()), engine = engine)):
+			cache.put(W, result)
+			misses[key] = result
+		for W, result in zip(windows, results):
+			if result is None:
+				result = list(misses[tuple(W)])
+			rangeResults.append([W, result[:limit] if limit else result])
 	return rangeResults
 
+def isRingMeetingRect(ring, W) -> bool: # whether the closed ring [[x, y], ...] touches the rectangle W by a vertex, an edge or its interior
+	x_low, x_high, y_low, y_high = W
+	inside = False
+	for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]):
+		if x_low <= x0 <= x_high and y_low <= y0 <= y_high: # vertex-in-rect
+			return True
+		t0, t1 = 0.0, 1.0 # edge-crossing by clipping the edge against W
+		for p, q in ((x0 - x1, x0 - x_low), (x1 - x0, x_high - x0), (y0 - y1, y0 - y_low), (y1 - y0, y_high - y0)):
+			if p == 0:
+				if q < 0:
+					t0 = 2.0
+			elif p < 0:
+				t0 = max(t0, q / p)
+			else:
+				t1 = min(t1, q / p)
+		if t0 <= t1:
+			return True
+		if (y0 > y_low) != (y1 > y_low) and x_low < x0 + (y_low - y0) * (x1 - x0) / (y1 - y0): # ray casting from the corner of W
+			inside = not inside
+	return inside # rect-in-polygon
+
+def isCandidateMeetingRect(store, W, polygon_id) -> bool:
+	row = store.rows.get(polygon_id, -1)
+	return row < 0 or isContained(store.MBRs[row], W) or isRingMeetingRect(store.coords[store.starts[row]:store.stops[row]], W) # a polygon missing from the offsets cannot be refined and a fully contained one needs no refining
+
+def refinePairs(store, windows, window_ids, rows) -> list: # whether every (window, candidate) pair really meets, tested for all the pairs at once
+	isKept = rows < 0 # a polygon missing from the offsets cannot be refined
+	W, MBRs = windows[window_ids], store.MBRs[rows]
+	isKept |= (rows >= 0) & (MBRs[:, 0] >= W[:, 0]) & (MBRs[:, 1] <= W[:, 1]) & (MBRs[:, 2] >= W[:, 2]) & (MBRs[:, 3] <= W[:, 3]) # fully contained candidates skip the refining
+	refined = np.flatnonzero(~isKept)
+	firstVertices = store.coords[store.starts[rows[refined]]]
+	isKept[refined] = (firstVertices[:, 0] >= W[refined, 0]) & (firstVertices[:, 0] <= W[refined, 1]) & (firstVertices[:, 1] >= W[refined, 2]) & (firstVertices[:, 1] <= W[refined, 3]) # most candidates are settled by their first vertex
+	refined = refined[~isKept[refined]]
+	if len(refined):
+		starts, lengths = store.starts[rows[refined]], store.stops[rows[refined]] - store.starts[rows[refined]]
+		firsts = np.cumsum(lengths) - lengths # where every ring begins in the gathered vertices
+		indexes = np.arange(lengths.sum()) + np.repeat(starts - firsts, lengths)
+		nexts = indexes + 1
+		nexts[firsts + lengths - 1] = starts # close the rings
+		x0, y0, x1, y1 = store.coords[indexes, 0], store.coords[indexes, 1], store.coords[nexts, 0], store.coords[nexts, 1]
+		x_low, x_high, y_low, y_high = np.repeat(W[refined], lengths, axis = 0).T
+		isMeeting = (x0 >= x_low) & (x0 <= x_high) & (y0 >= y_low) & (y0 <= y_high) # vertex-in-rect
+		t0, t1 = np.zeros(len(x0)), np.ones(len(x0))
+		with np.errstate(divide = "ignore", invalid = "ignore"):
+			for p, q in ((x0 - x1, x0 - x_low), (x1 - x0, x_high - x0), (y0 - y1, y0 - y_low), (y1 - y0, y_high - y0)): # edge-crossing by clipping every edge against its window
+				t0 = np.where((p == 0) & (q < 0), 2.0, np.where(p < 0, np.maximum(t0, q / p), t0))
+				t1 = np.where(p > 0, np.minimum(t1, q / p), t1)
+			isMeeting |= t0 <= t1
+			isCrossing = ((y0 > y_low) != (y1 > y_low)) & (x_low < x0 + (y_low - y0) * (x1 - x0) / (y1 - y0)) # ray casting from the corner of the window
+		isKept[refined] = np.logical_or.reduceat(isMeeting, firsts) | (np.add.reduceat(isCrossing, firsts) % 2 == 1) # rect-in-polygon
+	return isKept.tolist()
+
+def doRefining(rangeResults, store, limit = defaultLimit) -> list: # keep the candidates whose outline or interior really meets the window, in their original order
+	if not isNumPyAvailable:
+		return [[W, [polygon_id for polygon_id in polygon_ids if isCandidateMeetingRect(store, W, polygon_id)][:limit or None]] for W, polygon_ids in rangeResults]
+	windows = np.asarray([W for W, _ in rangeResults], dtype = np.float64).reshape(-1, 4)
+	counts = [len(polygon_ids) for _, polygon_ids in rangeResults]
+	polygon_ids = [polygon_id for _, ids in rangeResults for polygon_id in ids]
+	isKept = refinePairs(store, windows, np.repeat(np.arange(len(counts)), counts), store.getRows(polygon_ids))
+	refinedResults, start = [], 0
+	for (W, ids), count in zip(rangeResults, counts):
+		refinedResults.append([W, [polygon_id for polygon_id, kept in zip(ids, isKept[start:start + count]) if kept][:limit or None]])
+		start += count
+	return refinedResults
+
+def getServerResponses(server, requests) -> list: # send the request lines pipelined to queryServer.py and return its response lines in order
+	if server.lower().startswith("unix:"):
+		if not hasattr(socket, "AF_UNIX"):
+			raise OSError("Unix sockets are not supported on this platform")
+		connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		connection.connect(server[5:])
+	else:
+		host, _, port = server.rpartition(":")
+		connection = socket.create_connection((host or "127.0.0.1", int(port)))
+	with connection:
+		connection.sendall("".join([request + "\n" for request in requests]).encode("utf-8"))
+		connection.shutdown(socket.SHUT_WR) # the server closes the connection after the last response
+		with connection.makefile("r", encoding = "utf-8") as f:
+			return f.read().splitlines()
+
+def doRemoteQuerying(server, queries, requests) -> list: # [query, ids] from the responses of the requests
+	try:
+		responses = getServerResponses(server, requests)
+	except (OSError, ValueError) as e:
+		print("Error querying the server {0}: {1}".format(server, e))
+		return None
+	if len(responses) != len(requests):
+		print("The server answered {0} of {1} request(s). ".format(len(responses), len(requests)))
+		return None
+	results = []
+	for query, response in zip(queries, responses):
+		if not response.startswith("ok"):
+			print("The server failed on {0}: {1}".format(query, response))
+			return None
+		results.append([query, [int(item) for item in response[3:].split(",") if item]])
+	return results
+
 
 # make output #
-def output(rangeResults, outputFp = None, encoding = "utf-8") -> bool:
+def formatResult(i, result, mode = defaultMode) -> str:
+	if mode == "count":
+		return "{0} ({1})".format(i, result[1])
+	elif mode == "aggregate":
+		return "{0} ({1}): sum = {2}, min = {3}, max = {4}, extent = {5}".format(i, *result[1])
+	else:
+		return "{0} ({1}): {2}".format(i, len(result[1]), ",".join([str(item) for item in result[1]]))
+
+def output(rangeResults, outputFp = None, encoding = "utf-8", mode = defaultMode) -> bool:
 	if outputFp:
 		try:
 			with open(outputFp, "w", encoding = encoding) as f:
 				for i, result in enumerate(rangeResults):
-					f.write("{0} ({1}): {2}\n".format(i, len(result[1]), ",".join([str(item) for item in result[1]])))
+					f.write(formatResult(i, result, mode) + "\n")
 			print("Dump to the result file successfully. ")
 			return True
 		except Exception as e:
@@ -158,11 +839,35 @@ def output(rangeResults, outputFp = None, encoding = "utf-8") -> bool:
 			print(e)
 			return False
 	for i, result in enumerate(rangeResults):
-		print("{0} ({1}): {2}".format(i, len(result[1]), ",".join([str(item) for item in result[1]])))
+		print(formatResult(i, result, mode))
 	return True
 
 
 
+def outputStream(rTree, rectangles, outputFp = None, encoding = "utf-8", limit = defaultLimit, chunkSize = defaultStreamChunkSize) -> bool: # buffer the ids of one window compactly since its count comes first and then write them chunk by chunk
+	try:
+		f = open(outputFp, "w", encoding = encoding) if outputFp else stdout
+		try:
+			for i, W in enumerate(rectangles):
+				polygon_ids = array("q", islice(iterRQuerying(rTree, W), limit or None))
+				f.write("{0} ({1}): ".format(i, len(polygon_ids)))
+				for start in range(0, len(polygon_ids), chunkSize):
+					if start:
+						f.write(",")
+					f.write(",".join([str(polygon_id) for polygon_id in polygon_ids[start:start + chunkSize]]))
+				f.write("\n")
+		finally:
+			if outputFp:
+				f.close()
+		if outputFp:
+			print("Dump to the result file successfully. ")
+		return True
+	except Exception as e:
+		print("Error writing output file. ")
+		print(e)
+		return False
+
+
 # main function #
 def preExit(countdownTime = defaultTime) -> None: # we use this function before exiting instead of getch since getch is not OS-independent
 	try:
@@ -180,13 +885,32 @@ def preExit(countdownTime = defaultTime) -> None: # we use this function before
 def printHelp() -> None:
 	print("Python script for range querying based on RTree. ", end = "\n\n")
 	print("Option: ")
-	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file. ")
+	print("\t[/rTree|--rTree|rTree]: Specify that the following option is the input rTree file (text or binary). ")
 	print("\t[/rQueries|--rQueries|rQueries]: Specify that the following option is the input rQueries file. ")
+	print("\t[/storage|--storage|storage]: Specify that the following option is the storage of the RTree ({0}). ".format("|".join(_STORAGES)))
+	print("\t[/engine|--engine|engine]: Specify that the following option is the querying engine ({0}). The batch engine needs NumPy and copies the whole RTree into column arrays first, which decodes every node of a binary RTree. ".format("|".join(_ENGINES)))
+	print("\t[/limit|--limit|limit]: Specify that the following option is the maximum count of polygon ids per window (0 for no limit). ")
+	print("\t[/mode|--mode|mode]: Specify that the following option is the output mode ({0}). The count and aggregate modes are answered from the aggregates of the RTree nodes, which only a text rTree file stores. ".format("|".join(_MODES)))
+	print("\t[/coords|--coords|coords]: Specify that the following option is the input coord file for refining the candidates by their outlines (list mode only). ")
+	print("\t[/offsets|--offsets|offsets]: Specify that the following option is the input offset file for refining the candidates by their outlines (list mode only). ")
+	print("\t[/cache|--cache|cache]: Specify that the following option is the memory budget of the range cache in MiB (0 to disable, list mode only). Repeated windows and windows inside a cached window skip the RTree. The budget also covers the table of the polygon MBRs built on the first insertion. ")
+	print("\t[/workers|--workers|workers]: Specify that the following option is the count of the querying processes. The stream engine and the range cache need a single process. ")
+	print("\t[/order|--order|order]: Specify that the following option is the order the queries are answered in ({0}). The results are always written in the input order. ".format("|".join(_ORDERS)))
+	print("\t[/server|--server|server]: Specify that the following option is the address of a running queryServer.py (host:port or unix:path) to send the queries to instead of loading the RTree. ")
 	print("\t[/o|-o|o|/output|--output|output]: Specify that the following option is the output result file. ", end = "\n\n")
 	print("Format: ")
-	print("\tpython rangeQuerying.py [/rTree|--rTree|rTree] rTreeFilepath [/rQueries|--rQueries|rQueries] rQueriesFilepath [/o|-o|o|/output|--output|output] outputFilepath", end = "\n\n")
+	print("\tpython rangeQuerying.py [/rTree|--rTree|rTree] rTreeFilepath [/rQueries|--rQueries|rQueries] rQueriesFilepath [/o|-o|o|/output|--output|output] outputFilepath [/storage|--storage|storage] storage [/engine|--engine|engine] engine [/limit|--limit|limit] limit [/mode|--mode|mode] mode [/coords|--coords|coords] coordsFilepath [/offsets|--offsets|offsets] offsetsFilepath [/cache|--cache|cache] cacheBudget [/workers|--workers|workers] workers [/order|--order|order] order [/server|--server|server] serverAddress", end = "\n\n")
 	print("Example: ")
 	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /storage packed")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /engine batch")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /engine stream /limit 100")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /mode count")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /coords coords.txt /offsets offsets.txt")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /cache 64")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /workers 4")
+	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /order hilbert")
+	print("\tpython rangeQuerying.py /rQueries Rqueries.txt /server 127.0.0.1:8765")
 	print("\tpython rangeQuerying.py /rTree Rtree.txt /rQueries Rqueries.txt /output rangeResults.txt", end = "\n\n")
 
 def handleCommandline() -> dict:
@@ -194,10 +918,10 @@ def handleCommandline() -> dict:
 		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
 			printHelp()
 			return True
-	if len(argv) > 1 and len(argv) not in (3, 5, 7):
+	if len(argv) > 1 and len(argv) not in (3, 5, 7, 9, 11, 13, 15, 17, 19, 21, 23, 25, 27):
 		print("The count of the commandline options is incorrect. Please check your commandline. ")
 		return False
-	dicts = {"rTree":rTreeFilepath, "rQueries":rQueriesFilepath, "output":rangeResultsFilepath}
+	dicts = {"rTree":rTreeFilepath, "rQueries":rQueriesFilepath, "output":rangeResultsFilepath, "storage":defaultStorage, "engine":defaultEngine, "limit":defaultLimit, "mode":defaultMode, "coords":None, "offsets":None, "cache":defaultCacheBudget, "workers":defaultWorkers, "order":defaultOrder, "server":None}
 	pointer = None
 	for arg in argv[1:]:
 		if arg.lower() in ("/rtree", "--rtree", "rtree"):
@@ -206,12 +930,90 @@ def handleCommandline() -> dict:
 			pointer = "rQueries"
 		elif arg.lower() in ("/o", "-o", "o", "/output", "--output", "output"):
 			pointer = "output"
+		elif arg.lower() in ("/storage", "--storage", "storage"):
+			pointer = "storage"
+		elif arg.lower() in ("/engine", "--engine", "engine"):
+			pointer = "engine"
+		elif arg.lower() in ("/limit", "--limit", "limit"):
+			pointer = "limit"
+		elif arg.lower() in ("/mode", "--mode", "mode"):
+			pointer = "mode"
+		elif arg.lower() in ("/coords", "--coords", "coords"):
+			pointer = "coords"
+		elif arg.lower() in ("/offsets", "--offsets", "offsets"):
+			pointer = "offsets"
+		elif arg.lower() in ("/cache", "--cache", "cache"):
+			pointer = "cache"
+		elif arg.lower() in ("/workers", "--workers", "workers"):
+			pointer = "workers"
+		elif arg.lower() in ("/order", "--order", "order"):
+			pointer = "order"
+		elif arg.lower() in ("/server", "--server", "server"):
+			pointer = "server"
 		elif pointer is None:
 			print("Error handling commandline, please check your commandline. ")
 			return False
 		else:
 			dicts[pointer] = arg
 			pointer = None # reset
+	dicts["storage"] = dicts["storage"].lower()
+	if dicts["storage"] not in _STORAGES:
+		print("Unknown storage: {0}. Please check your commandline. ".format(dicts["storage"]))
+		return False
+	dicts["engine"] = dicts["engine"].lower()
+	if dicts["engine"] not in _ENGINES:
+		print("Unknown querying engine: {0}. Please check your commandline. ".format(dicts["engine"]))
+		return False
+	if dicts["engine"] == "batch" and not isNumPyAvailable:
+		print("The batch engine needs NumPy. Please check your commandline. ")
+		return False
+	try:
+		dicts["limit"] = int(dicts["limit"])
+		if dicts["limit"] < 0:
+			raise ValueError
+	except:
+		print("Error regarding limit as a non-negative integer. Please check your commandline. ")
+		return False
+	dicts["mode"] = dicts["mode"].lower()
+	if dicts["mode"] not in _MODES:
+		print("Unknown output mode: {0}. Please check your commandline. ".format(dicts["mode"]))
+		return False
+	if (dicts["coords"] is None) != (dicts["offsets"] is None):
+		print("Refining needs both the coord file and the offset file. Please check your commandline. ")
+		return False
+	if dicts["coords"] is not None and (dicts["mode"] != "list" or dicts["engine"] == "stream"):
+		print("Refining only works in the list mode without the stream engine. Please check your commandline. ")
+		return False
+	try:
+		dicts["cache"] = float(dicts["cache"])
+		if dicts["cache"] < 0:
+			raise ValueError
+	except:
+		print("Error regarding cache as a non-negative count of MiB. Please check your commandline. ")
+		return False
+	if dicts["cache"] and (dicts["mode"] != "list" or dicts["engine"] == "stream"):
+		print("The range cache only works in the list mode without the stream engine. Please check your commandline. ")
+		return False
+	try:
+		dicts["workers"] = int(dicts["workers"])
+		if dicts["workers"] < 1:
+			raise ValueError
+	except:
+		print("Error regarding workers as a positive integer. Please check your commandline. ")
+		return False
+	if dicts["workers"] > 1 and (dicts["engine"] == "stream" or dicts["cache"]):
+		print("The worker processes work without the stream engine and the range cache. Please check your commandline. ")
+		return False
+	dicts["order"] = dicts["order"].lower()
+	if dicts["order"] not in _ORDERS:
+		print("Unknown query order: {0}. Please check your commandline. ".format(dicts["order"]))
+		return False
+	if dicts["order"] != "input" and dicts["engine"] == "stream":
+		print("The stream engine writes the results in the order they are answered, so it needs the input order. Please check your commandline. ")
+		return False
+	if dicts["server"] and (dicts["mode"] != "list" or dicts["coords"] is not None or dicts["cache"] or dicts["workers"] > 1 or dicts["order"] != "input"):
+		print("The server answers in the list mode without refining, the range cache, the worker processes or the query order. Please check your commandline. ")
+		return False
 	return dicts
 
 def main() -> int:
@@ -219,33 +1021,106 @@ def main() -> int:
 	commandlineArgument = handleCommandline()
 	if type(commandlineArgument) == bool:
 		return EXIT_SUCCESS if commandlineArgument else EXIT_FAILURE
+	if commandlineArgument["server"]: # a thin client of queryServer.py which keeps the RTree resident
+		queries = getQueries(commandlineArgument["rQueries"])
+		if queries is None:
+			print("Error reading queries, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		start_time = time()
+		rangeResults = doRemoteQuerying(commandlineArgument["server"], queries, ["range {0!r} {2!r} {1!r} {3!r} {4}".format(*W, commandlineArgument["limit"]) for W in queries])
+		end_time = time()
+		if rangeResults is None:
+			preExit()
+			return EXIT_FAILURE
+		if len(queries):
+			print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. Throughput: {3:.1f} item(s)/s with {4} process(es). ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000, len(queries) / max(end_time - start_time, 1e-9), commandlineArgument["workers"]))
+		output(rangeResults, outputFp = commandlineArgument["output"])
+		preExit()
+		return EXIT_SUCCESS
 	rTree = getRTree(commandlineArgument["rTree"])
 	if rTree is None:
 		print("Error reading RTree, please check. ")
 		preExit()
 		return EXIT_FAILURE
 	computeRTreeMBR(rTree)
-	if not checkRTreeMBR(rTree):
+	if not isinstance(rTree, MappedRTreeNode) and not checkRTreeMBR(rTree): # checking a binary RTree would touch every page
 		print("Check RTree MBR failed. Please check your input RTree file. ")
 		preExit()
 		return EXIT_FAILURE
+	if commandlineArgument["mode"] != "list" and isinstance(rTree, MappedRTreeNode): # computing the aggregates of a binary RTree would touch every page
+		print("The binary RTree does not store the aggregates of the count and aggregate modes. Please use a text RTree. ")
+		preExit()
+		return EXIT_FAILURE
+	if commandlineArgument["mode"] != "list": # the aggregates live on the RTree nodes
+		computeRTreeAggregate(rTree)
+	elif commandlineArgument["storage"] == "packed" or commandlineArgument["engine"] == "batch": # the batch engine works on the column arrays
+		rTree = PackedRTree(rTree)
 	queries = getQueries(commandlineArgument["rQueries"])
 	if queries is None:
 		print("Error reading queries, please check. ")
 		preExit()
 		return EXIT_FAILURE
+	permutation = getQueryOrder([[(query[0] + query[1]) / 2, (query[2] + query[3]) / 2] for query in queries], order = commandlineArgument["order"]) # answering the queries along a space-filling curve keeps the touched nodes warm
+	queries = [queries[i] for i in permutation]
+	store = None
+	if commandlineArgument["coords"]:
+		coords = getCoordsStream(commandlineArgument["coords"])
+		if coords is None:
+			print("Error reading coords, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		offsets = getOffsetsStream(commandlineArgument["offsets"])
+		if offsets is None:
+			print("Error reading offsets, please check. ")
+			preExit()
+			return EXIT_FAILURE
+		if not checkOffsetCoords(coords[0::2], [offsets[i:i + 3] for i in range(0, len(offsets), 3)]): # every polygon owns a non-empty slice of the coords
+			preExit()
+			return EXIT_FAILURE
+		store = PolygonStore(coords, offsets)
 	
 	# handle queries #
+	if commandlineArgument["mode"] != "list":
+		start_time = time()
+		if commandlineArgument["workers"] > 1:
+			rangeResults = doRangeQueryingParallel(rTree, queries, workers = commandlineArgument["workers"], rTreeFp = commandlineArgument["rTree"], storage = commandlineArgument["storage"], mode = commandlineArgument["mode"])
+		else:
+			rangeResults = doRangeAggregating(rTree, queries, mode = commandlineArgument["mode"])
+		end_time = time()
+		if len(queries):
+			print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. Throughput: {3:.1f} item(s)/s with {4} process(es). ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000, len(queries) / max(end_time - start_time, 1e-9), commandlineArgument["workers"]))
+		output(restoreOrder(rangeResults, permutation), outputFp = commandlineArgument["output"], mode = commandlineArgument["mode"])
+		preExit()
+		return EXIT_SUCCESS
+	if commandlineArgument["engine"] == "stream": # the queries are answered while the output is written
+		start_time = time()
+		isSuccessful = outputStream(rTree, queries, outputFp = commandlineArgument["output"], limit = commandlineArgument["limit"])
+		end_time = time()
+		if len(queries):
+			print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. Throughput: {3:.1f} item(s)/s with {4} process(es). ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000, len(queries) / max(end_time - start_time, 1e-9), commandlineArgument["workers"]))
+		preExit()
+		return EXIT_SUCCESS if isSuccessful else EXIT_FAILURE
+	cache = RangeCache(rTree, budget = int(commandlineArgument["cache"] * (1 << 20))) if commandlineArgument["cache"] else None
 	start_time = time()
-	rangeResults = doRangeQuerying(rTree, queries)
+	if commandlineArgument["workers"] > 1:
+		rangeResults = doRangeQueryingParallel(rTree, queries, workers = commandlineArgument["workers"], rTreeFp = commandlineArgument["rTree"], storage = commandlineArgument["storage"], engine = commandlineArgument["engine"], limit = 0 if store else commandlineArgument["limit"])
+	elif cache:
+		rangeResults = doRangeQueryingCached(rTree, queries, cache, engine = commandlineArgument["engine"], limit = 0 if store else commandlineArgument["limit"])
+	else:
+		rangeResults = doRangeQuerying(rTree, queries, engine = commandlineArgument["engine"], limit = 0 if store else commandlineArgument["limit"]) # the limit is applied after refining
+	if store:
+		rangeResults = doRefining(rangeResults, store, limit = commandlineArgument["limit"])
 	end_time = time()
 	if len(queries):
-		print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000))
+		print("Total time: {0:.3f}s. Item count: {1}. Average Time: {2:.3f}ms/item. Throughput: {3:.1f} item(s)/s with {4} process(es). ".format(end_time - start_time, len(queries), (end_time - start_time) / len(queries) * 1000, len(queries) / max(end_time - start_time, 1e-9), commandlineArgument["workers"]))
 	else:
 		print("Nothing queried since the querying list is empty. ")
+	if cache:
+		print("Range cache: {0}. ".format(cache.getStatistics()))
 	
 	# make output #
-	output(rangeResults, outputFp = commandlineArgument["output"])
+	output(restoreOrder(rangeResults, permutation), outputFp = commandlineArgument["output"])
 	preExit()
 	return EXIT_SUCCESS
 
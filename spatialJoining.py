@@ -0,0 +1,331 @@
+import os
+import mmap
+from sys import argv, exit
+from struct import Struct
+from ast import literal_eval
+from time import sleep, time
+try:
+	os.chdir(os.path.abspath(os.path.dirname(__file__))) # cd into the location path of this script
+except: # it does not work in Jupyter-notebook
+	pass
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+defaultTime = 5
+defaultStreamChunkSize = 4096 # pairs written at a time
+rTreeFilepath = "Rtree.txt"
+_RTREE_MAGIC = b"RTREEMBR"
+_RTREE_VERSION = 1
+_HEADER_STRUCT = Struct("<8sIQ4d") # magic, version, root offset, root MBR
+_NODE_STRUCT = Struct("<BqI") # non-leaf flag, node id, entry count
+_ENTRY_STRUCT = Struct("<q4d") # child offset (polygon id in a leaf node), [x_low, x_high, y_low, y_high]
+joinResultsFilepath = "joinResults.txt"
+
+
+# class #
+class RTreeNode:
+	def __init__(self, entries = [], id = 0, MBR = None):
+		self.entries = entries
+		self.id = id
+		self.MBR = MBR
+	def __str__(self) -> str:
+		if isinstance(self.entries[0], RTreeNode):
+			return str([1, self.id, [[entry.id, entry.MBR] for entry in self.entries]])
+		else:
+			return str([0, self.id, self.entries])
+
+class MappedRTreeNode(RTreeNode): # decoded from the memory-mapped binary RTree only when it is touched
+	def __init__(self, buffer, offset, MBR = None):
+		self.buffer = buffer
+		self.offset = offset
+		self.MBR = MBR
+		self._id = None
+		self._entries = None
+	@property
+	def id(self) -> int:
+		if self._id is None:
+			self._id = _NODE_STRUCT.unpack_from(self.buffer, self.offset)[1]
+		return self._id
+	@id.setter
+	def id(self, value) -> None:
+		self._id = value
+	@property
+	def entries(self) -> list:
+		if self._entries is None:
+			isNonLeaf, self._id, count = _NODE_STRUCT.unpack_from(self.buffer, self.offset)
+			start = self.offset + _NODE_STRUCT.size
+			self._entries = [																\
+				MappedRTreeNode(self.buffer, child, MBR = [x_low, x_high, y_low, y_high]) if isNonLeaf else [child, [x_low, x_high, y_low, y_high]] 	\
+				for child, x_low, x_high, y_low, y_high in _ENTRY_STRUCT.iter_unpack(memoryview(self.buffer)[start:start + count * _ENTRY_STRUCT.size])	\
+			]
+		return self._entries
+	@entries.setter
+	def entries(self, value) -> None:
+		self._entries = value
+
+
+# get input #
+def getTxt(filepath, index = 0) -> str: # get .txt content
+	coding = ("utf-8", "gbk", "utf-16") # codings
+	if 0 <= index < len(coding): # in the range
+		try:
+			with open(filepath, "r", encoding = coding[index]) as f:
+				content = f.read()
+			return content[1:] if content.startswith("\ufeff") else content # if utf-8 with BOM, remove BOM
+		except (UnicodeError, UnicodeDecodeError):
+			return getTxt(filepath, index + 1) # recursion
+		except:
+			return None
+	else:
+		return None # out of range
+
+def isBinaryRTree(rTreeFp = rTreeFilepath) -> bool:
+	try:
+		with open(rTreeFp, "rb") as f:
+			return f.read(len(_RTREE_MAGIC)) == _RTREE_MAGIC
+	except:
+		return False
+
+def getBinaryRTree(rTreeFp = rTreeFilepath) -> MappedRTreeNode:
+	try:
+		with open(rTreeFp, "rb") as f:
+			buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) # the mapping stays valid after the file is closed
+		magic, version, rootOffset, x_low, x_high, y_low, y_high = _HEADER_STRUCT.unpack_from(buffer, 0)
+		if version != _RTREE_VERSION:
+			print("Unsupported binary RTree version: {0}".format(version))
+			return None
+		return MappedRTreeNode(buffer, rootOffset, MBR = [x_low, x_high, y_low, y_high])
+	except:
+		return None
+
+def getRTree(rTreeFp = rTreeFilepath) -> list:
+	if isBinaryRTree(rTreeFp):
+		return getBinaryRTree(rTreeFp)
+	content = getTxt(rTreeFp)
+	if content is None:
+		return None
+	content = content.replace("\r", "\n") # filtering "\r"
+	while "\n\n" in content: # filtering empty lines
+		content = content.replace("\n\n", "\n")
+	try:
+		rTreeDict = {}
+		for line in content.split("\n"):
+			if line.startswith("[") and line.endswith("]"):
+				lists = literal_eval(line)
+				if lists[1] in rTreeDict:
+					print("Repeated entry: id = {0}".format(lists[1]))
+				else:
+					rTreeDict[lists[1]] = RTreeNode(entries = lists[2], id = lists[1])
+					if lists[0]: # if it is a non-leaf node
+						for entry_idx, element in enumerate(lists[2]):
+							if element[0] in rTreeDict:
+								rTreeDict[lists[1]].entries[entry_idx] = rTreeDict[element[0]]
+							else:
+								print("Entry not found: id = {0}".format(element[0]))
+		return rTreeDict[max(rTreeDict.keys())] # the largest id is the root (excluding the leaf node)
+	except:
+		return None
+
+def checkRTreeMBR(rTree) -> bool:
+	try:
+		if isinstance(rTree, RTreeNode):
+			if rTree.MBR[0] <= rTree.MBR[1] and rTree.MBR[2] <= rTree.MBR[3]:
+				for entry in rTree.entries:
+					if not checkRTreeMBR(entry):
+						return False
+				return True
+			else:
+				return False
+		else: # list
+			return rTree[1][0] <= rTree[1][1] and rTree[1][2] <= rTree[1][3]
+	except:
+		return False
+
+def computeNodeMBR(nodes) -> list: # find the bounds
+	if nodes:
+		x_low = min(nodes, key = lambda c:c[0])[0]
+		x_high = max(nodes, key = lambda c:c[1])[1]
+		y_low = min(nodes, key = lambda c:c[2])[2]
+		y_high = max(nodes, key = lambda c:c[3])[3]
+		return [x_low, x_high, y_low, y_high]
+	else:
+		return None
+
+def computeRTreeMBR(rTree) -> None:
+	if isinstance(rTree.entries[0], RTreeNode):
+		for entry in rTree.entries:
+			if entry.MBR is None:
+				computeRTreeMBR(entry)
+		rTree.MBR = computeNodeMBR([entry.MBR for entry in rTree.entries])
+	else:
+		rTree.MBR = computeNodeMBR([entry[1] for entry in rTree.entries])
+
+
+# handle joining #
+def isOverlap(rect1, rect2) -> bool: # [x_low, x_high, y_low, y_high]
+	return rect1[0] <= rect2[1] and rect1[1] >= rect2[0] and rect1[2] <= rect2[3] and rect1[3] >= rect2[2]
+
+def isLeafNode(node) -> bool:
+	return not isinstance(node.entries[0], RTreeNode)
+
+def getSortedItems(node, W) -> list: # the (child node or polygon id, MBR) items of the node overlapping W sorted by x_low
+	if isLeafNode(node):
+		items = [(entry[0], entry[1]) for entry in node.entries if isOverlap(entry[1], W)]
+	else:
+		items = [(entry, entry.MBR) for entry in node.entries if isOverlap(entry.MBR, W)]
+	items.sort(key = lambda item:item[1][0])
+	return items
+
+def planeSweep(itemsA, itemsB) -> tuple: # yield every overlapping (item_a, item_b) pair of two lists sorted by x_low
+	i, j = 0, 0
+	while i < len(itemsA) and j < len(itemsB):
+		if itemsA[i][1][0] <= itemsB[j][1][0]: # the item with the smaller x_low meets every item of the other list starting before its x_high
+			item, MBR = itemsA[i]
+			k = j
+			while k < len(itemsB) and itemsB[k][1][0] <= MBR[1]:
+				if itemsB[k][1][2] <= MBR[3] and itemsB[k][1][3] >= MBR[2]:
+					yield item, itemsB[k][0]
+				k += 1
+			i += 1
+		else:
+			item, MBR = itemsB[j]
+			k = i
+			while k < len(itemsA) and itemsA[k][1][0] <= MBR[1]:
+				if itemsA[k][1][2] <= MBR[3] and itemsA[k][1][3] >= MBR[2]:
+					yield itemsA[k][0], item
+				k += 1
+			j += 1
+
+def iterSpatialJoining(rTreeA, rTreeB) -> tuple: # yield every (id_a, id_b) pair of overlapping fundamental MBRs by a synchronized depth-first traversal
+	if not rTreeA.entries or not rTreeB.entries or not isOverlap(rTreeA.MBR, rTreeB.MBR):
+		return
+	stack = [(rTreeA, rTreeB)] # pairs of overlapping nodes
+	while stack:
+		nodeA, nodeB = stack.pop()
+		W = [max(nodeA.MBR[0], nodeB.MBR[0]), min(nodeA.MBR[1], nodeB.MBR[1]), max(nodeA.MBR[2], nodeB.MBR[2]), min(nodeA.MBR[3], nodeB.MBR[3])] # only the children overlapping the intersection can meet
+		isLeafA, isLeafB = isLeafNode(nodeA), isLeafNode(nodeB)
+		if isLeafA and isLeafB:
+			yield from planeSweep(getSortedItems(nodeA, W), getSortedItems(nodeB, W))
+		elif isLeafA == isLeafB:
+			stack.extend(planeSweep(getSortedItems(nodeA, W), getSortedItems(nodeB, W)))
+		elif isLeafA: # the trees differ in height, so only the deeper one goes down
+			stack.extend((nodeA, entry) for entry in nodeB.entries if isOverlap(entry.MBR, W))
+		else:
+			stack.extend((entry, nodeB) for entry in nodeA.entries if isOverlap(entry.MBR, W))
+
+
+# make output #
+def outputStream(pairs, outputFp = joinResultsFilepath, encoding = "utf-8", chunkSize = defaultStreamChunkSize) -> int: # write the pairs chunk by chunk so that no pair list is kept and return the pair count or -1 on failure
+	count, lines = 0, []
+	try:
+		with open(outputFp, "w", encoding = encoding) as f:
+			for id_a, id_b in pairs:
+				lines.append("{0},{1}\n".format(id_a, id_b))
+				if len(lines) >= chunkSize:
+					f.write("".join(lines))
+					count += len(lines)
+					lines.clear()
+			f.write("".join(lines))
+			count += len(lines)
+		print("Dump to the result file successfully. ")
+		return count
+	except Exception as e:
+		print("Error writing output file. ")
+		print(e)
+		return -1
+
+
+
+# main function #
+def preExit(countdownTime = defaultTime) -> None: # we use this function before exiting instead of getch since getch is not OS-independent
+	try:
+		cntTime = int(countdownTime)
+		length = len(str(cntTime))
+	except:
+		return
+	print()
+	while cntTime > 0:
+		print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(cntTime), end = "")
+		try:
+			sleep(1)
+		except:
+			print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(0))
+			return
+		cntTime -= 1
+	print("\rProgram ended, exiting in {{0:>{0}}} second(s). ".format(length).format(cntTime))
+
+def printHelp() -> None:
+	print("Python script for joining two RTrees into the pairs of overlapping polygon MBRs. ", end = "\n\n")
+	print("Option: ")
+	print("\t[/rTreeA|--rTreeA|rTreeA]: Specify that the following option is the first input rTree file (text or binary). ")
+	print("\t[/rTreeB|--rTreeB|rTreeB]: Specify that the following option is the second input rTree file (text or binary). ")
+	print("\t[/o|-o|o|/output|--output|output]: Specify that the following option is the output result file, where each line is a pair \"id_a,id_b\". ", end = "\n\n")
+	print("Format: ")
+	print("\tpython spatialJoining.py [/rTreeA|--rTreeA|rTreeA] rTreeAFilepath [/rTreeB|--rTreeB|rTreeB] rTreeBFilepath [/o|-o|o|/output|--output|output] outputFilepath", end = "\n\n")
+	print("Example: ")
+	print("\tpython spatialJoining.py /rTreeA Rtree.txt /rTreeB Rtree.txt")
+	print("\tpython spatialJoining.py /rTreeA Rtree.txt /rTreeB Rtree.bin /output joinResults.txt", end = "\n\n")
+
+def handleCommandline() -> dict:
+	for arg in argv[1:]:
+		if arg.lower() in ("/h", "-h", "h", "/help", "--help", "help", "/?", "-?", "?"):
+			printHelp()
+			return True
+	if len(argv) > 1 and len(argv) not in (3, 5, 7):
+		print("The count of the commandline options is incorrect. Please check your commandline. ")
+		return False
+	dicts = {"rTreeA":rTreeFilepath, "rTreeB":rTreeFilepath, "output":joinResultsFilepath}
+	pointer = None
+	for arg in argv[1:]:
+		if arg.lower() in ("/rtreea", "--rtreea", "rtreea"):
+			pointer = "rTreeA"
+		elif arg.lower() in ("/rtreeb", "--rtreeb", "rtreeb"):
+			pointer = "rTreeB"
+		elif arg.lower() in ("/o", "-o", "o", "/output", "--output", "output"):
+			pointer = "output"
+		elif pointer is None:
+			print("Error handling commandline, please check your commandline. ")
+			return False
+		else:
+			dicts[pointer] = arg
+			pointer = None # reset
+	return dicts
+
+def main() -> int:
+	# get input #
+	commandlineArgument = handleCommandline()
+	if type(commandlineArgument) == bool:
+		return EXIT_SUCCESS if commandlineArgument else EXIT_FAILURE
+	rTrees = []
+	for key in ("rTreeA", "rTreeB"):
+		rTree = getRTree(commandlineArgument[key])
+		if rTree is None:
+			print("Error reading RTree {0}, please check. ".format(commandlineArgument[key]))
+			preExit()
+			return EXIT_FAILURE
+		if not rTree.entries: # an RTree whose entries are all deleted joins nothing
+			rTrees.append(rTree)
+			continue
+		computeRTreeMBR(rTree)
+		if not isinstance(rTree, MappedRTreeNode) and not checkRTreeMBR(rTree): # checking a binary RTree would touch every page
+			print("Check RTree MBR failed. Please check your input RTree file {0}. ".format(commandlineArgument[key]))
+			preExit()
+			return EXIT_FAILURE
+		rTrees.append(rTree)
+
+	# handle joining #
+	start_time = time()
+	count = outputStream(iterSpatialJoining(rTrees[0], rTrees[1]), outputFp = commandlineArgument["output"]) # the pairs are written while they are found
+	end_time = time()
+	if count < 0:
+		preExit()
+		return EXIT_FAILURE
+	print("Total time: {0:.3f}s. Pair count: {1}. Throughput: {2:.1f} pair(s)/s. ".format(end_time - start_time, count, count / max(end_time - start_time, 1e-9)))
+	preExit()
+	return EXIT_SUCCESS
+
+
+
+
+
+if __name__ == "__main__":
+	exit(main())
@@ -0,0 +1,109 @@
+import os
+import random
+import indexing
+
+
+def collectRTree(rTree) -> tuple: # (node ids, polygon ids) of the whole RTree
+	nodeIds, polygonIds, stack = [], [], [rTree]
+	while stack:
+		node = stack.pop()
+		nodeIds.append(node.id)
+		for entry in node.entries:
+			if isinstance(entry, indexing.RTreeNode):
+				stack.append(entry)
+			else:
+				polygonIds.append(entry[0])
+	return nodeIds, polygonIds
+
+def test_insert_keeps_node_ids_unique(tmp_path) -> None: # every root split must allocate a fresh id at the level of the new root
+	random.seed(6)
+	rTree = None
+	for polygon_id in range(3000):
+		x, y = random.uniform(0, 100), random.uniform(0, 100)
+		rTree = indexing.insert(rTree, polygon_id, [x, x + 0.5, y, y + 0.5])
+	filepath = os.path.join(str(tmp_path), "Rtree.txt")
+	assert indexing.doDumpRTree(rTree, filepath)
+	reloaded = indexing.getRTree(filepath)
+	nodeIds, polygonIds = collectRTree(reloaded)
+	assert len(nodeIds) == len(set(nodeIds))
+	assert sorted(polygonIds) == list(range(3000))
+
+def test_dump_empty_rtree(tmp_path) -> None: # deleting every entry leaves an empty root which is written as a leaf node
+	rTree = None
+	for polygon_id in range(50):
+		rTree = indexing.insert(rTree, polygon_id, [polygon_id, polygon_id + 1, 0, 1])
+	for polygon_id in range(50):
+		rTree = indexing.delete(rTree, polygon_id)
+	for filename in ("Rtree.txt", "Rtree.bin"):
+		filepath = os.path.join(str(tmp_path), filename)
+		assert indexing.doDumpRTree(rTree, filepath)
+		assert indexing.getRTree(filepath).entries == []
+
+def test_reindex_applies_changes(capsys) -> None: # moved, shifted, removed and added polygons where some changes carry the old MBR
+	random.seed(9)
+	coords, offsets, rTree = [], [], None
+	for polygon_id in range(300):
+		x, y = random.uniform(0, 100), random.uniform(0, 100)
+		offsets.append([polygon_id, len(coords), len(coords) + 3])
+		coords += [[x, y], [x + 1, y], [x + 1, y + 1], [x, y + 1]]
+		rTree = indexing.insert(rTree, polygon_id, [x, x + 1, y, y + 1])
+	changes = {}
+	for polygon_id in range(20): # moved far away, the first half with the old MBR
+		start = offsets[polygon_id][1]
+		changes[polygon_id] = ["change", [coords[start][0], coords[start][0] + 1, coords[start][1], coords[start][1] + 1] if polygon_id < 10 else None]
+		for coord in coords[start:start + 4]:
+			coord[0] += 200
+	for polygon_id in range(20, 30): # shifted inside its leaf node
+		for coord in coords[offsets[polygon_id][1]:offsets[polygon_id][1] + 4]:
+			coord[0] += 1e-9
+		changes[polygon_id] = ["change", None]
+	for polygon_id in range(30, 40):
+		changes[polygon_id] = ["remove", None]
+	changes[999] = ["remove", None]
+	for polygon_id in range(1000, 1005):
+		offsets.append([polygon_id, len(coords), len(coords) + 3])
+		coords += [[polygon_id, 0], [polygon_id + 1, 0], [polygon_id + 1, 1], [polygon_id, 1]]
+		changes[polygon_id] = ["add", None]
+	offsets = [offset for offset in offsets if not 30 <= offset[0] < 40]
+	rTree = indexing.reindex(rTree, changes, coords, offsets)
+	assert "Polygon 999 is not found in the previous RTree and there is nothing to remove. " in capsys.readouterr().out
+	nodeIds, polygonIds = collectRTree(rTree)
+	assert len(nodeIds) == len(set(nodeIds))
+	assert sorted(polygonIds) == [offset[0] for offset in sorted(offsets)]
+	path, idx = indexing.findEntry(rTree, 0)
+	assert path[-1].entries[idx][1][0] == coords[offsets[0][1]][0]
+
+def countDecoded(rTree) -> int: # the decoded nodes of a mapped RTree without decoding any more of it
+	decoded, stack = 0, [rTree]
+	while stack:
+		node = stack.pop()
+		entries = node._entries if isinstance(node, indexing.MappedRTreeNode) else node.entries
+		if entries is not None:
+			decoded += 1
+			stack.extend(entry for entry in entries if isinstance(entry, indexing.RTreeNode))
+	return decoded
+
+def test_binary_rtree_keeps_next_ids(tmp_path) -> None: # splits after reloading a binary RTree must neither walk it nor reuse an id
+	random.seed(11)
+	rTree = None
+	for polygon_id in range(3000):
+		x, y = random.uniform(0, 100), random.uniform(0, 100)
+		rTree = indexing.insert(rTree, polygon_id, [x, x + 0.5, y, y + 0.5])
+	nodeCount = len(collectRTree(rTree)[0])
+	filepath = os.path.join(str(tmp_path), "Rtree.bin")
+	assert indexing.doDumpRTree(rTree, filepath)
+	sizes = [os.path.getsize(filepath)]
+	for batch in range(12): # each batch splits nodes in a corner of the RTree
+		rTree = indexing.getRTree(filepath)
+		assert rTree.nextIds # read from the file instead of walking the RTree
+		for polygon_id in range(10000 + batch * 100, 10100 + batch * 100):
+			x, y = random.uniform(0, 1), random.uniform(0, 1)
+			rTree = indexing.insert(rTree, polygon_id, [x, x + 0.01, y, y + 0.01])
+		assert countDecoded(rTree) * 2 < nodeCount
+		assert indexing.doDumpRTree(rTree, filepath, isIncremental = True)
+		sizes.append(os.path.getsize(filepath))
+	assert any(later < earlier for earlier, later in zip(sizes, sizes[1:])) # the file has been compacted
+	assert max(sizes) < indexing._COMPACT_RATIO * sizes[0] * 1.5
+	nodeIds, polygonIds = collectRTree(indexing.getRTree(filepath))
+	assert len(nodeIds) == len(set(nodeIds))
+	assert sorted(polygonIds) == list(range(3000)) + list(range(10000, 11200))
@@ -0,0 +1,67 @@
+import os
+import math
+import random
+from array import array
+import pytest
+import indexing
+import kNNCoordsSearching
+
+
+def buildRTree(tmp_path, filename, count, seed) -> tuple: # (RTree loaded by kNNCoordsSearching, CoordStore, [[x, y, coord id], ...])
+	random.seed(seed)
+	coords, ids, offsets, rTree = array("d"), array("q"), array("q"), None
+	for polygon_id in range(count):
+		x, y, r = random.uniform(0, 100), random.uniform(0, 100), random.uniform(0.2, 2)
+		vertices = random.choice([3, 4, 5, 8, 100]) # the largest polygons are searched in vertex chunks
+		ring = [[x + r * math.cos(2 * math.pi * i / vertices), y + r * math.sin(2 * math.pi * i / vertices)] for i in range(vertices)]
+		offsets.extend((polygon_id, len(ids), len(ids) + vertices - 1))
+		for vertex in ring:
+			coords.extend(vertex)
+			ids.append(len(ids))
+		rTree = indexing.insert(rTree, polygon_id, indexing.computeNodeMBR([[vx, vx, vy, vy] for vx, vy in ring]))
+	filepath = os.path.join(str(tmp_path), filename)
+	assert indexing.doDumpRTree(rTree, filepath)
+	rTree = kNNCoordsSearching.getRTree(filepath)
+	kNNCoordsSearching.computeRTreeMBR(rTree)
+	return rTree, kNNCoordsSearching.indexStream(coords, ids, offsets), [[coords[2 * i], coords[2 * i + 1], i] for i in range(len(ids))]
+
+def getQueries(count, seed) -> list: # scattered points and clusters of nearby points
+	random.seed(seed)
+	queries = [[random.uniform(-10, 110), random.uniform(-10, 110)] for _ in range(count)]
+	return queries + [[x + random.uniform(-0.5, 0.5), y + random.uniform(-0.5, 0.5)] for x, y in queries[:count // 4] for _ in range(4)]
+
+@pytest.mark.parametrize("order", ["input", "morton", "hilbert"])
+def test_curve_order_is_restored(tmp_path, order) -> None: # the queries answered along the curve come back in the input order
+	rTree, fMBRs, _ = buildRTree(tmp_path, "Rtree.txt", 500, 19)
+	queries = getQueries(200, 20)
+	permutation = kNNCoordsSearching.getQueryOrder(queries, order = order)
+	assert sorted(permutation) == list(range(len(queries)))
+	assert kNNCoordsSearching.restoreOrder(kNNCoordsSearching.doKNNSearching(rTree, [queries[i] for i in permutation], 10, fMBRs), permutation) == kNNCoordsSearching.doKNNSearching(rTree, queries, 10, fMBRs)
+
+@pytest.mark.parametrize("filename", ["Rtree.txt", "Rtree.bin"])
+def test_knn_equals_brute_force(tmp_path, filename) -> None: # ties are broken by the coord id
+	rTree, fMBRs, coords = buildRTree(tmp_path, filename, 500, 21)
+	queries = getQueries(100, 22) + [coord[:2] for coord in coords[:20]] # a query on a vertex has a zero distance
+	for k in (1, 10):
+		assert [ids for _, ids in kNNCoordsSearching.doKNNSearching(rTree, queries, k, fMBRs)] == [[coord_id for _, coord_id in sorted(((x - q[0]) * (x - q[0]) + (y - q[1]) * (y - q[1]), coord_id) for x, y, coord_id in coords)[:k]] for q in queries]
+
+@pytest.mark.parametrize("isNumPyAvailable", [False, True] if kNNCoordsSearching.isNumPyAvailable else [False])
+def test_packed_equals_nodes(tmp_path, monkeypatch, isNumPyAvailable) -> None: # the vectorized distances of the packed search agree with the scalar ones
+	monkeypatch.setattr(kNNCoordsSearching, "isNumPyAvailable", isNumPyAvailable)
+	rTree, fMBRs, _ = buildRTree(tmp_path, "Rtree.bin", 500, 23)
+	queries = getQueries(200, 24)
+	packed = kNNCoordsSearching.PackedRTree(rTree)
+	for k in (1, 10, 50):
+		assert kNNCoordsSearching.doKNNSearching(packed, queries, k, fMBRs) == kNNCoordsSearching.doKNNSearching(rTree, queries, k, fMBRs)
+
+@pytest.mark.parametrize("storage", ["nodes", "packed"])
+def test_group_batch_equals_single(tmp_path, storage) -> None: # the members of a group get the results of their own searches
+	rTree, fMBRs, _ = buildRTree(tmp_path, "Rtree.txt", 500, 25)
+	queries = getQueries(200, 26)
+	queries += queries[:20] # repeated queries
+	if storage == "packed":
+		rTree = kNNCoordsSearching.PackedRTree(rTree)
+	for k in (1, 10):
+		kNNResults = kNNCoordsSearching.doKNNSearching(rTree, queries, k, fMBRs)
+		for batchSize in (4, 64):
+			assert kNNCoordsSearching.doKNNSearchingBatch(rTree, queries, k, fMBRs, batchSize) == kNNResults
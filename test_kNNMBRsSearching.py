@@ -0,0 +1,60 @@
+import os
+import random
+import pytest
+import indexing
+import kNNMBRsSearching
+
+
+def buildRTree(tmp_path, filename, count, seed) -> tuple: # (RTree loaded by kNNMBRsSearching, {polygon id: MBR})
+	random.seed(seed)
+	mbrs, rTree = {}, None
+	for polygon_id in range(count):
+		x, y, w, h = random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 2), random.uniform(0, 2)
+		mbrs[polygon_id] = [x, x + w, y, y + h]
+		rTree = indexing.insert(rTree, polygon_id, mbrs[polygon_id])
+	filepath = os.path.join(str(tmp_path), filename)
+	assert indexing.doDumpRTree(rTree, filepath)
+	rTree = kNNMBRsSearching.getRTree(filepath)
+	kNNMBRsSearching.computeRTreeMBR(rTree)
+	return rTree, mbrs
+
+def getQueries(count, seed) -> list: # scattered points and clusters of nearby points
+	random.seed(seed)
+	queries = [[random.uniform(-10, 110), random.uniform(-10, 110)] for _ in range(count)]
+	return queries + [[x + random.uniform(-0.5, 0.5), y + random.uniform(-0.5, 0.5)] for x, y in queries[:count // 4] for _ in range(4)]
+
+@pytest.mark.parametrize("order", ["input", "morton", "hilbert"])
+def test_curve_order_is_restored(tmp_path, order) -> None: # the queries answered along the curve come back in the input order
+	rTree, _ = buildRTree(tmp_path, "Rtree.txt", 1000, 19)
+	queries = getQueries(200, 20)
+	permutation = kNNMBRsSearching.getQueryOrder(queries, order = order)
+	assert sorted(permutation) == list(range(len(queries)))
+	assert kNNMBRsSearching.restoreOrder(kNNMBRsSearching.doKNNSearching(rTree, [queries[i] for i in permutation], 10), permutation) == kNNMBRsSearching.doKNNSearching(rTree, queries, 10)
+
+@pytest.mark.parametrize("filename", ["Rtree.txt", "Rtree.bin"])
+def test_knn_equals_brute_force(tmp_path, filename) -> None: # ties are broken by the polygon id
+	rTree, mbrs = buildRTree(tmp_path, filename, 1500, 21)
+	queries = getQueries(100, 22) + [list(mbr[0::2]) for mbr in list(mbrs.values())[:20]] # a query on a corner has a zero distance
+	for k in (1, 10):
+		assert [ids for _, ids in kNNMBRsSearching.doKNNSearching(rTree, queries, k)] == [sorted(mbrs, key = lambda polygon_id:(kNNMBRsSearching.squaredDistance(mbrs[polygon_id], q), polygon_id))[:k] for q in queries]
+
+@pytest.mark.parametrize("isNumPyAvailable", [False, True] if kNNMBRsSearching.isNumPyAvailable else [False])
+def test_packed_equals_nodes(tmp_path, monkeypatch, isNumPyAvailable) -> None: # the vectorized distances of the packed search agree with the scalar ones
+	monkeypatch.setattr(kNNMBRsSearching, "isNumPyAvailable", isNumPyAvailable)
+	rTree, _ = buildRTree(tmp_path, "Rtree.bin", 1500, 23)
+	queries = getQueries(200, 24)
+	packed = kNNMBRsSearching.PackedRTree(rTree)
+	for k in (1, 10, 50):
+		assert kNNMBRsSearching.doKNNSearching(packed, queries, k) == kNNMBRsSearching.doKNNSearching(rTree, queries, k)
+
+@pytest.mark.parametrize("storage", ["nodes", "packed"])
+def test_group_batch_equals_single(tmp_path, storage) -> None: # the members of a group get the results of their own searches
+	rTree, _ = buildRTree(tmp_path, "Rtree.txt", 1500, 25)
+	queries = getQueries(200, 26)
+	queries += queries[:20] # repeated queries
+	if storage == "packed":
+		rTree = kNNMBRsSearching.PackedRTree(rTree)
+	for k in (1, 10):
+		kNNResults = kNNMBRsSearching.doKNNSearching(rTree, queries, k)
+		for batchSize in (4, 64):
+			assert kNNMBRsSearching.doKNNSearchingBatch(rTree, queries, k, batchSize) == kNNResults
@@ -0,0 +1,103 @@
+import os
+import math
+import random
+from array import array
+import pytest
+import indexing
+import rangeQuerying
+
+
+def buildRTree(tmp_path, filename, count, seed) -> tuple: # (filepath, RTree loaded by rangeQuerying, {polygon id: MBR})
+	random.seed(seed)
+	mbrs, rTree = {}, None
+	for polygon_id in range(count):
+		x, y, w, h = random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 2), random.uniform(0, 2)
+		mbrs[polygon_id] = [x, x + w, y, y + h]
+		rTree = indexing.insert(rTree, polygon_id, mbrs[polygon_id])
+	filepath = os.path.join(str(tmp_path), filename)
+	assert indexing.doDumpRTree(rTree, filepath)
+	rTree = rangeQuerying.getRTree(filepath)
+	rangeQuerying.computeRTreeMBR(rTree)
+	return filepath, rTree, mbrs
+
+def getWindows(count, seed) -> list: # [x_low, x_high, y_low, y_high] of every size from a point to the whole space
+	random.seed(seed)
+	windows = []
+	for _ in range(count):
+		x, y, w, h = random.uniform(-10, 100), random.uniform(-10, 100), random.expovariate(0.1), random.expovariate(0.1)
+		windows.append([x, x + w, y, y + h])
+	return windows + [[50, 50, 50, 50], [-100, 200, -100, 200]]
+
+@pytest.mark.skipif(not rangeQuerying.isNumPyAvailable, reason = "the batch engine needs NumPy")
+@pytest.mark.parametrize("filename", ["Rtree.txt", "Rtree.bin"])
+def test_batch_equals_single(tmp_path, filename) -> None: # the same ids in the same depth-first order
+	_, rTree, mbrs = buildRTree(tmp_path, filename, 3000, 11)
+	windows = getWindows(300, 12)
+	singleResults = rangeQuerying.doRangeQuerying(rTree, windows)
+	assert [sorted(ids) for _, ids in singleResults] == [sorted(polygon_id for polygon_id, mbr in mbrs.items() if rangeQuerying.isOverlap(mbr, W)) for W in windows]
+	packed = rangeQuerying.PackedRTree(rTree)
+	assert rangeQuerying.doRangeQueryingBatch(packed, windows, batchSize = 64) == singleResults
+	assert rangeQuerying.doRangeQuerying(packed, windows, engine = "batch", limit = 5) == rangeQuerying.doRangeQuerying(rTree, windows, limit = 5)
+
+@pytest.mark.parametrize("isNumPyAvailable", [False, True] if rangeQuerying.isNumPyAvailable else [False])
+def test_refine_keeps_meeting_polygons(tmp_path, monkeypatch, isNumPyAvailable) -> None: # concave star polygons listed in a shuffled offset order
+	monkeypatch.setattr(rangeQuerying, "isNumPyAvailable", isNumPyAvailable)
+	random.seed(15)
+	coords, offsets, rings, rTree = array("d"), [], {}, None
+	for polygon_id in range(400):
+		x, y, r = random.uniform(0, 100), random.uniform(0, 100), random.uniform(0.5, 3)
+		vertices = random.randint(3, 80)
+		rings[polygon_id] = [[x + r * random.uniform(0.2, 1) * math.cos(2 * math.pi * i / vertices), y + r * random.uniform(0.2, 1) * math.sin(2 * math.pi * i / vertices)] for i in range(vertices)]
+		offsets.append([polygon_id, len(coords) // 2, len(coords) // 2 + vertices - 1])
+		for vertex in rings[polygon_id]:
+			coords.extend(vertex)
+		rTree = indexing.insert(rTree, polygon_id, indexing.computeNodeMBR([[vx, vx, vy, vy] for vx, vy in rings[polygon_id]]))
+	random.shuffle(offsets)
+	filepath = os.path.join(str(tmp_path), "Rtree.txt")
+	assert indexing.doDumpRTree(rTree, filepath)
+	rTree = rangeQuerying.getRTree(filepath)
+	rangeQuerying.computeRTreeMBR(rTree)
+	store = rangeQuerying.PolygonStore(coords, array("q", [item for offset in offsets for item in offset]))
+	windows = [[x, x + w, y, y + h] for x, y, w, h in ((random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 4), random.uniform(0, 4)) for _ in range(500))]
+	rangeResults = rangeQuerying.doRangeQuerying(rTree, windows)
+	refinedResults = rangeQuerying.doRefining(rangeResults, store)
+	assert refinedResults == [[W, [polygon_id for polygon_id in ids if rangeQuerying.isRingMeetingRect(rings[polygon_id], W)]] for W, ids in rangeResults]
+	assert sum(len(ids) for _, ids in refinedResults) < sum(len(ids) for _, ids in rangeResults)
+
+@pytest.mark.parametrize("isNumPyAvailable", [False, True] if rangeQuerying.isNumPyAvailable else [False])
+@pytest.mark.parametrize("budget", [1 << 26, 1 << 17]) # everything fits or the windows keep being evicted
+def test_cache_equals_engine(tmp_path, monkeypatch, isNumPyAvailable, budget) -> None: # repeated windows and windows zooming into earlier ones
+	monkeypatch.setattr(rangeQuerying, "isNumPyAvailable", isNumPyAvailable)
+	_, rTree, _ = buildRTree(tmp_path, "Rtree.txt", 1500, 16)
+	windows = getWindows(100, 17)
+	for x_low, x_high, y_low, y_high in windows[:100]:
+		w, h = (x_high - x_low) / 4, (y_high - y_low) / 4
+		windows.append([x_low + w, x_high - w, y_low + h, y_high - h])
+	windows += random.sample(windows, 100)
+	engines = ["single", "batch"] if isNumPyAvailable else ["single"]
+	for engine in engines:
+		cache = rangeQuerying.RangeCache(rangeQuerying.PackedRTree(rTree) if engine == "batch" else rTree, budget = budget)
+		for limit in (0, 5):
+			assert rangeQuerying.doRangeQueryingCached(cache.rTree, windows, cache, engine = engine, limit = limit) == rangeQuerying.doRangeQuerying(rTree, windows, limit = limit)
+		assert cache.hits and (cache.containedHits or engine == "batch") # a batch looks up all its windows before caching any of them
+		assert cache.size <= budget
+
+@pytest.mark.parametrize("isForked", [True, False]) # the workers inherit the RTree or load it again from the file
+def test_parallel_equals_single(tmp_path, monkeypatch, isForked) -> None: # the chunks come back in the input order
+	if not isForked:
+		monkeypatch.setattr(rangeQuerying, "get_all_start_methods", lambda:[])
+	filepath, rTree, _ = buildRTree(tmp_path, "Rtree.txt", 1500, 17)
+	windows = getWindows(300, 18)
+	engines = ["single", "batch"] if rangeQuerying.isNumPyAvailable else ["single"]
+	for engine in engines:
+		assert rangeQuerying.doRangeQueryingParallel(rangeQuerying.PackedRTree(rTree) if engine == "batch" else rTree, windows, workers = 2, rTreeFp = filepath, engine = engine, limit = 5) == rangeQuerying.doRangeQuerying(rTree, windows, limit = 5)
+	rangeQuerying.computeRTreeAggregate(rTree)
+	assert rangeQuerying.doRangeQueryingParallel(rTree, windows, workers = 2, rTreeFp = filepath, mode = "count") == rangeQuerying.doRangeAggregating(rTree, windows, mode = "count")
+
+@pytest.mark.parametrize("order", ["input", "morton", "hilbert"])
+def test_curve_order_is_restored(tmp_path, order) -> None: # the windows answered along the curve come back in the input order
+	_, rTree, _ = buildRTree(tmp_path, "Rtree.txt", 1000, 19)
+	windows = getWindows(300, 20)
+	permutation = rangeQuerying.getQueryOrder([[(W[0] + W[1]) / 2, (W[2] + W[3]) / 2] for W in windows], order = order)
+	assert sorted(permutation) == list(range(len(windows)))
+	assert rangeQuerying.restoreOrder(rangeQuerying.doRangeQuerying(rTree, [windows[i] for i in permutation]), permutation) == rangeQuerying.doRangeQuerying(rTree, windows)
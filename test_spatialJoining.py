@@ -0,0 +1,32 @@
+import os
+import random
+import indexing
+import spatialJoining
+
+
+def buildRTree(tmp_path, filename, count, seed) -> tuple: # (RTree loaded by spatialJoining, {polygon id: MBR})
+	random.seed(seed)
+	mbrs, rTree = {}, None
+	for polygon_id in range(count):
+		x, y, w, h = random.uniform(0, 100), random.uniform(0, 100), random.uniform(0, 3), random.uniform(0, 3)
+		mbrs[polygon_id] = [x, x + w, y, y + h]
+		rTree = indexing.insert(rTree, polygon_id, mbrs[polygon_id])
+	filepath = os.path.join(str(tmp_path), filename)
+	assert indexing.doDumpRTree(rTree, filepath)
+	rTree = spatialJoining.getRTree(filepath)
+	spatialJoining.computeRTreeMBR(rTree)
+	return rTree, mbrs
+
+def bruteForceJoining(mbrsA, mbrsB) -> list:
+	return sorted((id_a, id_b) for id_a, mbr_a in mbrsA.items() for id_b, mbr_b in mbrsB.items() if spatialJoining.isOverlap(mbr_a, mbr_b))
+
+def test_self_join(tmp_path) -> None:
+	rTree, mbrs = buildRTree(tmp_path, "Rtree.txt", 1500, 18)
+	assert sorted(spatialJoining.iterSpatialJoining(rTree, rTree)) == bruteForceJoining(mbrs, mbrs)
+
+def test_join_different_heights(tmp_path) -> None: # both orders of a deep text RTree and a shallow binary RTree
+	rTreeA, mbrsA = buildRTree(tmp_path, "RtreeA.txt", 2000, 19)
+	rTreeB, mbrsB = buildRTree(tmp_path, "RtreeB.bin", 60, 20)
+	assert indexing.getLevel(indexing.getRTree(os.path.join(str(tmp_path), "RtreeA.txt"))) > indexing.getLevel(indexing.getRTree(os.path.join(str(tmp_path), "RtreeB.bin")))
+	assert sorted(spatialJoining.iterSpatialJoining(rTreeA, rTreeB)) == bruteForceJoining(mbrsA, mbrsB)
+	assert sorted(spatialJoining.iterSpatialJoining(rTreeB, rTreeA)) == bruteForceJoining(mbrsB, mbrsA)